@@ -7,7 +7,69 @@ def create_app(test_config=None):
 
     app.config.from_mapping(
         SECRET_KEY='hellowisp',
+        # Path of the database file, or ':memory:' to hold it in this process, see app.db.MemoryDatabase
         DATABASE=os.path.join(app.instance_path, 'tic_tac_toe.sqlite'),
+        # For DATABASE=':memory:', file restored at startup and written with snapshots. None keeps nothing
+        DATABASE_SNAPSHOT=None,
+        # Seconds between snapshots, 0 only takes one on shutdown
+        DATABASE_SNAPSHOT_INTERVAL=60.0,
+        # Pragma profile applied once to every new connection, see app.db.PRAGMA_PROFILES
+        DATABASE_PRAGMA_PROFILE='wal',
+        # Single pragmas overriding the profile, e.g. {'synchronous': 'FULL'}
+        DATABASE_PRAGMAS={},
+        # Connections kept open and reused across requests, 0 connects per request
+        DATABASE_POOL_SIZE=5,
+        # Seconds a request waits for a free connection
+        DATABASE_POOL_TIMEOUT=30.0,
+        # Check a pooled connection still works before handing it out
+        DATABASE_POOL_PRE_PING=True,
+        # How new games store their board: 'text' (CHAR(9) board) or 'bits' (packed board_bits)
+        GAME_BOARD_STORAGE='text',
+        # Game rows kept in memory for reads, written through by every move. 0 turns it off
+        GAME_CACHE_SIZE=4096,
+        # Unix socket of a `flask cache-server` shared by every worker, None keeps the cache per process
+        GAME_CACHE_SOCKET=None,
+        # Carries move events to subscribers in other workers: None (this process only) or 'sqlite'
+        GAME_EVENTS_BACKEND=None,
+        # Seconds between reads of the games with subscribers by the 'sqlite' backend
+        GAME_EVENTS_POLL_INTERVAL=0.5,
+        # Seconds between keepalive comments on an idle event stream
+        GAME_EVENTS_KEEPALIVE=15.0,
+        # Longest a long poll waits for a move, in seconds
+        GAME_EVENTS_WAIT_TIMEOUT=30.0,
+        # Times a move is retried while another connection holds the write lock, then 409
+        MOVE_RETRIES=3,
+        # Seconds before the first retry, doubled for each one after
+        MOVE_RETRY_BACKOFF=0.01,
+        # Acknowledge moves before they are stored and write them in batches, see app.journal.
+        # Only for a single worker, the pending moves live in its memory
+        MOVE_WRITE_BEHIND=False,
+        # Append-only log of moves not stored yet, replayed at startup. None keeps them only in memory,
+        # so a crash loses the moves acknowledged since the last flush
+        MOVE_JOURNAL_PATH=None,
+        # fsync the log on every move, so acknowledged moves also survive losing power
+        MOVE_JOURNAL_FSYNC=False,
+        # Seconds between flushes of pending moves to the database
+        MOVE_JOURNAL_FLUSH_INTERVAL=0.05,
+        # Pending moves that trigger a flush before the interval is up
+        MOVE_JOURNAL_FLUSH_MOVES=500,
+        # Threads running the endpoints without coroutine views when served over ASGI by app.asgi, see asgi.py
+        ASGI_THREADS=32,
+        # Verified tokens kept in memory with their user row, 0 verifies every request
+        TOKEN_CACHE_SIZE=1024,
+        # Werkzeug hash method and cost for new passwords, e.g. 'pbkdf2:sha256:600000' or 'scrypt:32768:8:1'.
+        # Older hashes are replaced on the next successful login
+        PASSWORD_HASH_METHOD='pbkdf2',
+        # Processes hashing passwords, 0 hashes inline. The request thread still waits for them, see app.passwords
+        PASSWORD_HASH_WORKERS=0,
+        # Most users accepted by one POST /auth/register/bulk
+        AUTH_BULK_MAX_USERS=1000,
+        # Seconds between reloads of the in-memory leaderboard ranking, to pick up other workers' wins
+        LEADERBOARD_REFRESH=60.0,
+        # Authorization header value for the /admin endpoints, None turns them off
+        ADMIN_TOKEN=None,
+        # Solved positions for the computer opponent, memory-mapped at startup
+        AI_TABLE_PATH=os.path.join(os.path.dirname(__file__), 'ai_table.bin'),
     )
 
     if test_config is None:
@@ -26,9 +88,26 @@ def create_app(test_config=None):
     from . import db
     db.init_app(app)
 
-    from app.routes import auth, game, ping
+    from . import ai
+    ai.init_app(app)
+
+    from . import cache
+    cache.init_app(app)
+
+    from . import journal
+    journal.init_app(app)
+
+    from . import export
+    export.init_app(app)
+
+    from . import passwords
+    passwords.init_app(app)
+
+    from app.routes import admin, auth, game, leaderboard, ping
     app.register_blueprint(ping.bp)
     app.register_blueprint(auth.bp)
     app.register_blueprint(game.bp)
+    app.register_blueprint(leaderboard.bp)
+    app.register_blueprint(admin.bp)
 
     return app
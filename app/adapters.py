@@ -0,0 +1,134 @@
+import asyncio
+import time
+
+from flask import stream_with_context
+from app.aiodb import connect_async, fetchall, fetchone
+from app.db import close_db, get_db
+from app.passwords import hash_password, hash_password_async, hash_passwords, hash_passwords_async, verify_password, \
+    verify_password_async
+
+
+def run_sync(coroutine):
+    """
+    Run a view coroutine to its end on this thread. Given a SyncAdapter, nothing it awaits
+    ever suspends, so it returns on the first step.
+    """
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+
+    coroutine.close()
+    raise RuntimeError('A view run by run_sync awaited something other than its SyncAdapter')
+
+
+class SyncAdapter:
+    """
+    What a view coroutine reads, writes and waits on under the Flask server: the request's
+    connection from app.db.get_db, and waits that block the request thread.
+    """
+
+    async def execute(self, sql, params=()):
+        return get_db().execute(sql, params)
+
+    async def executemany(self, sql, params):
+        return get_db().executemany(sql, params)
+
+    async def fetchone(self, sql, params=()):
+        return get_db().execute(sql, params).fetchone()
+
+    async def fetchall(self, sql, params=()):
+        return get_db().execute(sql, params).fetchall()
+
+    async def commit(self):
+        get_db().commit()
+
+    async def rollback(self):
+        get_db().rollback()
+
+    async def release(self):
+        # Back to the pool while the request waits, get_db takes one again if it's needed
+        close_db()
+
+    async def sleep(self, seconds):
+        time.sleep(seconds)
+
+    async def wait(self, subscription, after_turn, timeout):
+        return subscription.wait(after_turn, timeout)
+
+    async def hash_password(self, password):
+        return hash_password(password)
+
+    async def hash_passwords(self, passwords):
+        return hash_passwords(passwords)
+
+    async def verify_password(self, password_hash, password):
+        return verify_password(password_hash, password)
+
+    def stream(self, body):
+        # Sent after the view returns, with the request's connection still open
+        return stream_with_context(iter(body))
+
+
+class AsyncAdapter:
+    """
+    What a view coroutine reads, writes and waits on under app.asgi: a connection of the
+    aiosqlite pool, taken on first use and kept until close, and waits on the event loop.
+    """
+
+    def __init__(self, app, pool):
+        self.app = app
+        self._pool = pool
+        self._db = None
+
+    async def connection(self):
+        if self._db is None:
+            self._db = await self._pool.acquire() if self._pool is not None else await connect_async(self.app.config)
+
+        return self._db
+
+    async def execute(self, sql, params=()):
+        return await (await self.connection()).execute(sql, params)
+
+    async def executemany(self, sql, params):
+        return await (await self.connection()).executemany(sql, params)
+
+    async def fetchone(self, sql, params=()):
+        return await fetchone(await self.connection(), sql, params)
+
+    async def fetchall(self, sql, params=()):
+        return await fetchall(await self.connection(), sql, params)
+
+    async def commit(self):
+        await (await self.connection()).commit()
+
+    async def rollback(self):
+        await (await self.connection()).rollback()
+
+    async def release(self):
+        db, self._db = self._db, None
+
+        if db is not None:
+            if self._pool is not None:
+                await self._pool.release(db)
+            else:
+                await db.close()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+    async def wait(self, subscription, after_turn, timeout):
+        return await subscription.wait_async(after_turn, timeout)
+
+    async def hash_password(self, password):
+        return await hash_password_async(self.app, password)
+
+    async def hash_passwords(self, passwords):
+        return await hash_passwords_async(self.app, passwords)
+
+    async def verify_password(self, password_hash, password):
+        return await verify_password_async(self.app, password_hash, password)
+
+    def stream(self, body):
+        # Sent with async for by app.asgi, which releases the connection after the last chunk
+        return body
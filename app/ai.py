@@ -0,0 +1,176 @@
+import mmap
+import os
+import struct
+
+import click
+from app.util import (FULL_MASK, RESULT_CODES, SYMMETRIES, WIN_MASKS, _OUTCOMES, _TERNARY, board_to_bits,
+                      canonicalize_bits, transform_bits)
+
+# No best move: the position is finished or can't be reached in a real game
+NO_MOVE = 255
+
+# Solved table file: a header, then one record per base-3 board index (see check_winner_bits)
+# holding the board's result code (see RESULTS), its value + 10 (0 when unreachable) and its best move
+TABLE_MAGIC = b'TTTS'
+TABLE_VERSION = 1
+TABLE_HEADER = struct.Struct('<4sHH')
+TABLE_RECORD_SIZE = 3
+TABLE_SIZE = TABLE_HEADER.size + TABLE_RECORD_SIZE * 3 ** 9
+
+# Shipped with the app, rebuilt with `flask build-ai-table`
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(__file__), 'ai_table.bin')
+
+_table = None
+
+
+def _has_won(mask):
+    for win_mask in WIN_MASKS:
+        if mask & win_mask == win_mask:
+            return True
+
+    return False
+
+
+def _solve():
+    """
+    Negamax over every position reachable from the empty board. The transposition table is
+    keyed by the canonical form of (mover_mask, opponent_mask), so each set of symmetric
+    positions is solved once. Returns the value and best move of each position as two 3^9
+    tables indexed like check_winner_bits.
+    """
+    table = {}
+
+    def negamax(mover, opponent):
+        mover, opponent, _ = canonicalize_bits(mover, opponent)
+        key = (mover, opponent)
+        if key in table:
+            return table[key][0]
+
+        # The opponent just moved, so only they can have won
+        if _has_won(opponent):
+            result = (-(10 - bin(mover | opponent).count('1')), NO_MOVE)
+        elif mover | opponent == FULL_MASK:
+            result = (0, NO_MOVE)
+        else:
+            result = None
+            for cell in range(9):
+                if (mover | opponent) >> cell & 1:
+                    continue
+                value = -negamax(opponent, mover | 1 << cell)
+                # Ties keep the lowest cell of the canonical board, so the choice is deterministic
+                if result is None or value > result[0]:
+                    result = (value, cell)
+
+        table[key] = result
+        return result[0]
+
+    negamax(0, 0)
+
+    values = bytearray(3 ** 9)
+    moves = bytearray([NO_MOVE]) * 3 ** 9
+    for (mover, opponent), (value, move) in table.items():
+        # X moves first, so X is to move whenever both sides have made as many moves
+        mover_is_x = bin(mover).count('1') == bin(opponent).count('1')
+
+        # Spread each canonical position back over its symmetries. Cell i of a transformed
+        # board is cell perm[i] of the canonical one, so the move moves to perm.index(move)
+        for transform, perm in enumerate(SYMMETRIES):
+            t_mover, t_opponent = transform_bits(mover, opponent, transform)
+            x_mask, o_mask = (t_mover, t_opponent) if mover_is_x else (t_opponent, t_mover)
+            index = _TERNARY[x_mask] + 2 * _TERNARY[o_mask]
+            if values[index]:
+                continue
+
+            # Stored offset by 10 so it fits a byte: 10 is a draw, above 10 the mover wins
+            values[index] = value + 10
+            moves[index] = NO_MOVE if move == NO_MOVE else perm.index(move)
+
+    return bytes(values), bytes(moves)
+
+
+def build_table():
+    """Solve every position and return the contents of the table file."""
+    values, moves = _solve()
+    records = bytearray(TABLE_RECORD_SIZE * 3 ** 9)
+    records[0::3] = bytes(RESULT_CODES[outcome] for outcome in _OUTCOMES)
+    records[1::3] = values
+    records[2::3] = moves
+
+    return TABLE_HEADER.pack(TABLE_MAGIC, TABLE_VERSION, TABLE_RECORD_SIZE) + bytes(records)
+
+
+def load_table(path=DEFAULT_TABLE_PATH):
+    """
+    Memory-map a table file and use it for every lookup in this process. The mapping
+    is read only, so processes mapping the same file share its pages.
+    """
+    global _table
+
+    with open(path, 'rb') as f:
+        table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, version, record_size = TABLE_HEADER.unpack_from(table)
+    if (magic, version, record_size) != (TABLE_MAGIC, TABLE_VERSION, TABLE_RECORD_SIZE) or len(table) != TABLE_SIZE:
+        table.close()
+        raise ValueError(f'{path} is not a version {TABLE_VERSION} AI table, rebuild it with `flask build-ai-table`')
+
+    _table = table
+    return table
+
+
+def _get_table():
+    global _table
+
+    if _table is None:
+        # Not loaded at startup, solve in memory rather than fail
+        if os.path.exists(DEFAULT_TABLE_PATH):
+            load_table()
+        else:
+            _table = build_table()
+
+    return _table
+
+
+def _record(x_mask, o_mask):
+    offset = TABLE_HEADER.size + TABLE_RECORD_SIZE * (_TERNARY[x_mask] + 2 * _TERNARY[o_mask])
+    return _get_table()[offset:offset + TABLE_RECORD_SIZE]
+
+
+def best_move_bits(x_mask, o_mask):
+    """Return the best cell for the player to move, or None if the position is finished."""
+    move = _record(x_mask, o_mask)[2]
+    return None if move == NO_MOVE else move
+
+
+def best_move(board):
+    """Return the best cell for the player to move on a 9-cell board, or None if the position is finished."""
+    return best_move_bits(*board_to_bits(board))
+
+
+def position_value(board):
+    """
+    Return the minimax value for the player to move: 0 is a draw, positive is a win for
+    them and negative a loss, larger the sooner it happens. None if the position can't be reached.
+    """
+    value = _record(*board_to_bits(board))[1]
+    return None if value == 0 else value - 10
+
+
+@click.command('build-ai-table')
+@click.option('--output', default=DEFAULT_TABLE_PATH, show_default=True, help='Where to write the table.')
+def build_ai_table_command(output):
+    """Solve every position and write the AI table file."""
+    table = build_table()
+
+    # Written beside the target then renamed, so running workers never map a partial file
+    with open(output + '.tmp', 'wb') as f:
+        f.write(table)
+    os.replace(output + '.tmp', output)
+    click.echo(f'Wrote {len(table)} bytes to {output}.')
+
+
+def init_app(app):
+    app.cli.add_command(build_ai_table_command)
+
+    if os.path.exists(app.config['AI_TABLE_PATH']):
+        load_table(app.config['AI_TABLE_PATH'])
@@ -0,0 +1,93 @@
+import asyncio
+import functools
+import sqlite3
+
+import aiosqlite
+from app.db import connect
+
+# Rows aiosqlite reads per trip to a connection's thread when a cursor is iterated
+ITER_CHUNK_SIZE = 256
+
+
+async def connect_async(config):
+    """
+    Open an aiosqlite connection. The sqlite3 connection underneath is made by app.db.connect,
+    so it has the same pragmas and functions, and runs every query on a thread of its own.
+    """
+    return await aiosqlite.Connection(functools.partial(connect, config), ITER_CHUNK_SIZE)
+
+
+async def fetchone(db, sql, params=()):
+    async with db.execute(sql, params) as cursor:
+        return await cursor.fetchone()
+
+
+async def fetchall(db, sql, params=()):
+    return list(await db.execute_fetchall(sql, params))
+
+
+class AsyncConnectionPool:
+    """
+    The ConnectionPool of app.db for coroutines, over aiosqlite connections. At most `size`
+    connections are open at once; checkout waits on the event loop up to `timeout` seconds
+    for one to be returned before raising asyncio.TimeoutError. Use it from one event loop.
+    """
+
+    def __init__(self, config, size=5, timeout=30.0, pre_ping=True):
+        self.config = config
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self._idle = []
+        self._slots = asyncio.Semaphore(size)
+        self._closed = False
+
+    async def acquire(self):
+        await asyncio.wait_for(self._slots.acquire(), self.timeout)
+
+        try:
+            while self._idle:
+                db = self._idle.pop()
+                if not self.pre_ping or await self._is_healthy(db):
+                    return db
+                await self._discard(db)
+
+            return await connect_async(self.config)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, db):
+        try:
+            if self._closed:
+                await self._discard(db)
+                return
+
+            # Don't hand uncommitted work to the next request
+            if db.in_transaction:
+                await db.rollback()
+            self._idle.append(db)
+        except (sqlite3.Error, ValueError):
+            await self._discard(db)
+        finally:
+            self._slots.release()
+
+    async def close(self):
+        """Close the idle connections; ones still checked out are closed when released."""
+        self._closed = True
+        while self._idle:
+            await self._discard(self._idle.pop())
+
+    @staticmethod
+    async def _is_healthy(db):
+        try:
+            await fetchone(db, 'SELECT 1')
+            return True
+        except (sqlite3.Error, ValueError):
+            return False
+
+    @staticmethod
+    async def _discard(db):
+        try:
+            await db.close()
+        except (sqlite3.Error, ValueError):
+            pass
@@ -0,0 +1,216 @@
+import asyncio
+import io
+
+from a2wsgi import WSGIMiddleware
+from a2wsgi.wsgi import build_environ
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.routing import RequestRedirect
+
+from app.adapters import AsyncAdapter, SyncAdapter, run_sync
+from app.aiodb import AsyncConnectionPool
+from app.db import close_memory_db, close_pool
+from app.events import close_game_events
+from app.journal import close_move_journal, get_move_journal
+from app.passwords import close_hash_pool
+
+
+class AsyncViews:
+    """
+    Views of a blueprint written once, as coroutines that take an adapter (see app.adapters)
+    before the rule's arguments and do all their I/O through it. Flask serves each with a
+    SyncAdapter through run_sync, ASGIApp awaits it on the event loop with an AsyncAdapter.
+    Either way it runs in the app's request context, so it uses flask.request as any view.
+    """
+
+    def __init__(self, blueprint):
+        self.blueprint = blueprint
+        self.views = {}
+
+    def route(self, rule, write_behind=True, **options):
+        """
+        As Blueprint.route, for a coroutine view. With write_behind=False, ASGIApp leaves the
+        endpoint to Flask while MOVE_WRITE_BEHIND is set.
+        """
+        def register(f):
+            endpoint = options.pop('endpoint', f.__name__)
+
+            def view(**kwargs):
+                return run_sync(f(SyncAdapter(), **kwargs))
+
+            view.__name__ = view.__qualname__ = f.__name__
+            view.__doc__ = f.__doc__
+            self.blueprint.add_url_rule(rule, endpoint, view, **options)
+            self.views[f'{self.blueprint.name}.{endpoint}'] = (f, write_behind)
+            return f
+
+        return register
+
+
+class ASGIApp:
+    """
+    Serves the Flask app to an ASGI server such as uvicorn (`uvicorn asgi:app`).
+
+    The views of AsyncViews are awaited on the server's event loop with an AsyncAdapter:
+    SQLite is read and written through a pool of aiosqlite connections and passwords are
+    hashed on executors, so a request waiting on either holds no thread of its own, and
+    event streams and long polls wait on the loop. They run in a Flask request context,
+    through the app's before_request hooks, error handlers and teardowns, so they answer as
+    they do under Flask. Every other endpoint, and the moves when MOVE_WRITE_BEHIND is set,
+    runs the Flask app on a pool of ASGI_THREADS threads.
+    """
+
+    def __init__(self, app):
+        from app.routes import auth, game, ping
+
+        self.app = app
+        self.wsgi = WSGIMiddleware(app, workers=app.config['ASGI_THREADS'])
+        self.db = None
+        if app.config['DATABASE_POOL_SIZE'] > 0:
+            self.db = AsyncConnectionPool(
+                app.config,
+                size=app.config['DATABASE_POOL_SIZE'],
+                timeout=app.config['DATABASE_POOL_TIMEOUT'],
+                pre_ping=app.config['DATABASE_POOL_PRE_PING']
+            )
+
+        # The journal's locks are thread locks, held while a move reads its game
+        write_behind = get_move_journal(app) is not None
+        self.views = {
+            endpoint: view
+            for module in (auth, game, ping)
+            for endpoint, (view, with_write_behind) in module.aio.views.items()
+            if with_write_behind or not write_behind
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            view, args = self._match(scope)
+            if view is None:
+                await self.wsgi(scope, receive, send)
+            else:
+                await self._http(view, args, scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def close(self):
+        """Close the aiosqlite connections, then drain the threads and the app's pools."""
+        if self.db is not None:
+            await self.db.close()
+
+        self.wsgi.executor.shutdown(wait=True)
+        close_move_journal(self.app)
+        close_game_events(self.app)
+        close_hash_pool(self.app)
+        close_pool(self.app)
+        close_memory_db(self.app)
+
+    def _match(self, scope):
+        # The Flask app's own URL map picks the endpoint. What it can't match, and the HEAD and
+        # OPTIONS requests Flask answers by itself, go to the Flask app for the same response
+        if scope['method'] in ('HEAD', 'OPTIONS'):
+            return None, None
+
+        root_path, path = scope.get('root_path', ''), scope['path']
+        if path.startswith(root_path):
+            path = path[len(root_path):]
+
+        adapter = self.app.url_map.bind('localhost', script_name=root_path or None)
+        try:
+            endpoint, args = adapter.match(path, scope['method'])
+        except (NotFound, MethodNotAllowed, RequestRedirect):
+            return None, None
+
+        return self.views.get(endpoint), args
+
+    async def _http(self, view, args, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        # As Flask.wsgi_app and full_dispatch_request, with the view awaited in place of
+        # dispatch_request, so hooks, error handlers and teardowns run as they do under Flask
+        app = self.app
+        adapter = AsyncAdapter(app, self.db)
+        ctx = app.request_context(build_environ(scope, io.BytesIO(bytes(body))))
+        error = None
+        response = None
+        try:
+            try:
+                ctx.push()
+                try:
+                    rv = app.preprocess_request()
+                    if rv is None:
+                        rv = await view(adapter, **args)
+                except Exception as e:
+                    rv = app.handle_user_exception(e)
+                response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers.items()],
+            })
+
+            # Event streams and replays are async iterators, sent as they come
+            if hasattr(response.response, '__aiter__'):
+                await self._stream(response.response, receive, send)
+            else:
+                await send({'type': 'http.response.body', 'body': b''.join(response.iter_encoded())})
+        finally:
+            await adapter.release()
+            if response is not None:
+                # Runs its call_on_close handlers
+                response.close()
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    async def _stream(self, stream, receive, send):
+        messages = stream.__aiter__()
+
+        async def disconnected():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+
+        watcher = asyncio.ensure_future(disconnected())
+        message = None
+        try:
+            while True:
+                message = asyncio.ensure_future(messages.__anext__())
+                await asyncio.wait((message, watcher), return_when=asyncio.FIRST_COMPLETED)
+
+                # The client went away while the stream was waiting for its next chunk
+                if not message.done():
+                    return
+
+                try:
+                    chunk = message.result()
+                except StopAsyncIteration:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk.encode('utf8'), 'more_body': True})
+
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            watcher.cancel()
+            if message is not None and not message.done():
+                message.cancel()
+                await asyncio.wait((message,))
+            await messages.aclose()
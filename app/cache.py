@@ -0,0 +1,190 @@
+import json
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+
+import click
+from flask import current_app
+
+# Columns of a games row kept in the cache
+GAME_FIELDS = ('id', 'user_id', 'board', 'board_bits', 'current_turn', 'winner', 'opponent')
+
+
+def _is_newer(state, cached):
+    # current_turn goes up by one on every move, so it orders the states of a game
+    return cached is None or state['current_turn'] >= cached['current_turn']
+
+
+class SocketBackend:
+    """
+    Client for the key-value server started by `flask cache-server`, shared by every
+    worker on the host. Each thread keeps its own connection. Any error counts as a miss,
+    so the cache never fails a request.
+    """
+
+    def __init__(self, path, timeout=0.5):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _request(self, message):
+        try:
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.settimeout(self.timeout)
+                sock.connect(self.path)
+                conn = self._local.conn = sock.makefile('rwb')
+            conn.write(json.dumps(message).encode('utf8') + b'\n')
+            conn.flush()
+            return json.loads(conn.readline())
+        except (OSError, ValueError):
+            self._local.conn = None
+            return None
+
+    def get(self, key):
+        response = self._request({'op': 'get', 'key': key})
+        return response and response.get('value')
+
+    def set(self, key, value):
+        self._request({'op': 'set', 'key': key, 'value': value})
+
+    def delete(self, key):
+        self._request({'op': 'delete', 'key': key})
+
+
+class GameCache:
+    """
+    LRU cache of games rows by id, in front of an optional shared backend, which get reads
+    through to whenever one is set. Moves write their result through with put. A state only replaces one with the same or
+    an earlier current_turn, so a slow writer can't put an older state back.
+    """
+
+    def __init__(self, maxsize=4096, backend=None):
+        self.maxsize = maxsize
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, game_id):
+        # Other workers write the shared backend, so it's read on every get. The local copy
+        # is only served over it when newer, i.e. a put of this worker didn't reach it
+        shared = self.backend.get(str(game_id)) if self.backend else None
+
+        with self._lock:
+            state = self._entries.get(game_id)
+            if shared is not None and _is_newer(shared, state):
+                state = shared
+                self._store(game_id, state)
+
+            if state is not None:
+                if game_id in self._entries:
+                    self._entries.move_to_end(game_id)
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return state
+
+    def put(self, state):
+        state = {field: state[field] for field in GAME_FIELDS}
+
+        with self._lock:
+            self._store(state['id'], state)
+
+        if self.backend:
+            self.backend.set(str(state['id']), state)
+
+    def invalidate(self, game_id):
+        with self._lock:
+            self._entries.pop(game_id, None)
+
+        if self.backend:
+            self.backend.delete(str(game_id))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'shared': self.backend is not None
+            }
+
+    def _store(self, game_id, state):
+        if self.maxsize <= 0 or not _is_newer(state, self._entries.get(game_id)):
+            return
+
+        self._entries[game_id] = state
+        self._entries.move_to_end(game_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+_cache_lock = threading.Lock()
+
+def get_game_cache(app=None):
+    app = app or current_app
+    cache = app.extensions.get('game_cache')
+
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.get('game_cache')
+            if cache is None:
+                path = app.config['GAME_CACHE_SOCKET']
+                cache = GameCache(app.config['GAME_CACHE_SIZE'], SocketBackend(path) if path else None)
+                app.extensions['game_cache'] = cache
+
+    return cache
+
+
+class _CacheRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        for line in self.rfile:
+            message = json.loads(line)
+            response = {}
+
+            with self.server.lock:
+                if message['op'] == 'get':
+                    response['value'] = store.get(message['key'])
+                elif message['op'] == 'set':
+                    if _is_newer(message['value'], store.get(message['key'])):
+                        store[message['key']] = message['value']
+                elif message['op'] == 'delete':
+                    store.pop(message['key'], None)
+
+            self.wfile.write(json.dumps(response).encode('utf8') + b'\n')
+
+
+class CacheServer(socketserver.ThreadingUnixStreamServer):
+    """A minimal shared game cache for the workers on one host, over a Unix socket."""
+
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        super().__init__(path, _CacheRequestHandler)
+        self.store = {}
+        self.lock = threading.Lock()
+
+
+@click.command('cache-server')
+@click.option('--socket', 'path', required=True, help='Unix socket to listen on, set it as GAME_CACHE_SOCKET.')
+def cache_server_command(path):
+    """Serve a game cache shared by every worker on this host."""
+    with CacheServer(path) as server:
+        click.echo(f'Serving the game cache on {path}.')
+        server.serve_forever()
+
+
+def init_app(app):
+    app.cli.add_command(cache_server_command)
@@ -1,24 +1,284 @@
+import atexit
+import os
+import queue
 import sqlite3
+import threading
+import time
+import uuid
 
 import click
 from flask import current_app, g
+from flask.cli import with_appcontext
+from app.util import RESULTS, RESULT_CODES, bits_to_board, check_winner, check_winner_batch, check_winner_bits
 
 
+# Named pragma sets, picked with DATABASE_PRAGMA_PROFILE. DATABASE_PRAGMAS overrides single pragmas.
+PRAGMA_PROFILES = {
+    # SQLite's own defaults: rollback journal, every commit locks out readers
+    'default': {},
+    # Readers never block the writer and commits don't fsync the main file
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'mmap_size': 134217728,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 5000,
+    },
+}
+
+def get_pragmas(config):
+    pragmas = dict(PRAGMA_PROFILES[config.get('DATABASE_PRAGMA_PROFILE', 'default')])
+    pragmas.update(config.get('DATABASE_PRAGMAS', {}))
+
+    return pragmas
+
+# DATABASE value for a database held in memory by the worker, see MemoryDatabase
+MEMORY_DATABASE = ':memory:'
+
+def connect(config):
+    """Open a new connection and apply the configured pragmas to it."""
+    database, uri = config['DATABASE'], False
+    if database == MEMORY_DATABASE:
+        # SQLite's memdb VFS: every connection in the process opening this name shares one
+        # database, with the usual locking, where a plain :memory: would give each its own
+        database, uri = f"file:/{config['DATABASE_MEMORY_NAME']}?vfs=memdb", True
+
+    db = sqlite3.connect(
+        database,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        # Pooled connections are checked out by whichever thread serves the request
+        check_same_thread=False,
+        uri=uri
+    )
+    db.row_factory = sqlite3.Row
+
+    for name, value in get_pragmas(config).items():
+        db.execute(f'PRAGMA {name} = {value}')
+
+    # Lets a move be validated, scored and stored by a single UPDATE
+    db.create_function('check_winner', 1, check_winner, deterministic=True)
+    db.create_function('check_winner_bits', 2, check_winner_bits, deterministic=True)
+
+    return db
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections, checked out for the length of a request.
+    At most `size` connections are open at once; checkout waits up to `timeout`
+    seconds for one to be returned before raising queue.Empty.
+    """
+
+    def __init__(self, config, size=5, timeout=30.0, pre_ping=True):
+        self.config = config
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise queue.Empty(f'No database connection available after {self.timeout}s')
+
+        try:
+            while True:
+                try:
+                    db = self._idle.get_nowait()
+                except queue.Empty:
+                    return connect(self.config)
+
+                if not self.pre_ping or self._is_healthy(db):
+                    return db
+                self._discard(db)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, db):
+        try:
+            if self._closed:
+                self._discard(db)
+                return
+
+            # Don't hand uncommitted work to the next request
+            if db.in_transaction:
+                db.rollback()
+            self._idle.put(db)
+        except sqlite3.Error:
+            self._discard(db)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close the idle connections; ones still checked out are closed when released."""
+        self._closed = True
+        while True:
+            try:
+                self._discard(self._idle.get_nowait())
+            except queue.Empty:
+                break
+
+    @staticmethod
+    def _is_healthy(db):
+        try:
+            db.execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    @staticmethod
+    def _discard(db):
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+
+
+_pool_lock = threading.Lock()
+
+def get_pool(app=None):
+    app = app or current_app
+    pool = app.extensions.get('db_pool')
+
+    if pool is None:
+        with _pool_lock:
+            pool = app.extensions.get('db_pool')
+            if pool is None:
+                pool = ConnectionPool(
+                    app.config,
+                    size=app.config['DATABASE_POOL_SIZE'],
+                    timeout=app.config['DATABASE_POOL_TIMEOUT'],
+                    pre_ping=app.config['DATABASE_POOL_PRE_PING']
+                )
+                app.extensions['db_pool'] = pool
+                atexit.register(pool.close)
+
+    return pool
+
+def close_pool(app):
+    """Drain the app's connection pool, e.g. on shutdown."""
+    pool = app.extensions.pop('db_pool', None)
+
+    if pool is not None:
+        pool.close()
+        atexit.unregister(pool.close)
+
+class MemoryDatabase:
+    """
+    Keeps a DATABASE = ':memory:' database alive for the life of the app through a connection
+    of its own, so it survives the pool closing idle connections. At startup it is restored from
+    the DATABASE_SNAPSHOT file if there is one, else created from schema.sql. Snapshots go back
+    to that file through the backup API every DATABASE_SNAPSHOT_INTERVAL seconds and on close.
+    Moves made since the last snapshot are lost if the process dies without closing.
+    """
+
+    def __init__(self, app):
+        self.path = app.config['DATABASE_SNAPSHOT']
+        self.logger = app.logger
+        self.snapshots = 0
+        self.last_snapshot = None
+        self._db = connect(app.config)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        if self.path and os.path.exists(self.path):
+            snapshot = sqlite3.connect(self.path)
+            snapshot.backup(self._db)
+            snapshot.close()
+            self.restored = True
+        else:
+            with app.open_resource('schema.sql') as f:
+                self._db.executescript(f.read().decode('utf8'))
+            self.restored = False
+
+        interval = app.config['DATABASE_SNAPSHOT_INTERVAL']
+        if self.path and interval:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='db-snapshot', daemon=True)
+            self._thread.start()
+
+    def snapshot(self):
+        """Copy the database to DATABASE_SNAPSHOT. The file is replaced whole, never left half written."""
+        if not self.path:
+            return
+
+        with self._lock:
+            if self._db is None:
+                return
+
+            started = time.perf_counter()
+            partial = f'{self.path}.partial'
+            target = sqlite3.connect(partial)
+            try:
+                self._db.backup(target)
+            finally:
+                target.close()
+            os.replace(partial, self.path)
+
+            self.snapshots += 1
+            self.last_snapshot = time.perf_counter() - started
+
+    def close(self):
+        """Stop the periodic snapshots and take a last one."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+        with self._lock:
+            if self._db is None:
+                return
+
+        self.snapshot()
+        with self._lock:
+            self._db.close()
+            self._db = None
+
+    def stats(self):
+        return {
+            'snapshot': self.path,
+            'restored': self.restored,
+            'snapshots': self.snapshots,
+            'last_snapshot_seconds': self.last_snapshot
+        }
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.snapshot()
+            except (sqlite3.Error, OSError):
+                self.logger.exception('Database snapshot to %s failed', self.path)
+
+
+def close_memory_db(app):
+    """Snapshot and drop the app's in-memory database, e.g. on shutdown."""
+    memory_db = app.extensions.pop('memory_db', None)
+
+    if memory_db is not None:
+        atexit.unregister(memory_db.close)
+        memory_db.close()
+
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        if current_app.config['DATABASE_POOL_SIZE'] > 0:
+            # Remember the pool so the connection goes back where it came from
+            g.db_pool = get_pool()
+            g.db = g.db_pool.acquire()
+        else:
+            g.db = connect(current_app.config)
 
     return g.db
 
 def close_db(e=None):
     db = g.pop('db', None)
+    pool = g.pop('db_pool', None)
 
     if db is not None:
-        db.close()
+        if pool is not None:
+            pool.release(db)
+        else:
+            db.close()
 
 def init_db():
     db = get_db()
@@ -26,12 +286,49 @@ def init_db():
     with current_app.open_resource('schema.sql') as f:
         db.executescript(f.read().decode('utf8'))
 
+    # WAL is stored in the database file, so set it here once for every later connection
+    journal_mode = get_pragmas(current_app.config).get('journal_mode', 'DELETE')
+    return db.execute(f'PRAGMA journal_mode = {journal_mode}').fetchone()[0]
+
 @click.command('init-db')
+@with_appcontext
 def init_db_command():
     """Clear the existing data and create new tables."""
-    init_db()
-    click.echo('Initialized the database.')
+    journal_mode = init_db()
+    click.echo(f'Initialized the database (journal mode: {journal_mode}).')
+
+@click.command('check-winners')
+@click.option('--chunk-size', default=10000, show_default=True, help='Games scored per batch.')
+@with_appcontext
+def check_winners_command(chunk_size):
+    """Re-score every stored game and report winner mismatches."""
+    cursor = get_db().execute('SELECT id, board, board_bits, winner FROM games ORDER BY id')
+    checked = mismatches = 0
+
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+
+        results = check_winner_batch([
+            row['board'] if row['board'] is not None else ''.join(bits_to_board(row['board_bits']))
+            for row in rows
+        ])
+        for row, code in zip(rows, results):
+            if RESULT_CODES.get(row['winner']) != code:
+                mismatches += 1
+                click.echo(f"Game {row['id']}: stored {row['winner']!r}, board gives {RESULTS[code]!r}")
+        checked += len(rows)
+
+    click.echo(f'Checked {checked} games, {mismatches} mismatches.')
 
 def init_app(app):
+    if app.config['DATABASE'] == MEMORY_DATABASE:
+        # Other apps in the process given the same name share the database
+        app.config.setdefault('DATABASE_MEMORY_NAME', f'tictactoe-{uuid.uuid4().hex}')
+        memory_db = app.extensions['memory_db'] = MemoryDatabase(app)
+        atexit.register(memory_db.close)
+
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(check_winners_command)
@@ -0,0 +1,273 @@
+import asyncio
+import threading
+
+from flask import current_app
+from app.cache import GAME_FIELDS
+from app.db import connect
+
+
+class _Channel:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.state = None
+        self.subscribers = 0
+        # (loop, future) of subscribers waiting in wait_async
+        self.futures = set()
+
+    def newer(self, after_turn):
+        if self.state is not None and self.state['current_turn'] > after_turn:
+            return self.state
+        return None
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class Subscription:
+    """A subscriber to one game, see GameEvents.subscribe. Close it, or use it as a context manager."""
+
+    def __init__(self, events, game_id, channel):
+        self.game_id = game_id
+        self._events = events
+        self._channel = channel
+        self._closed = False
+
+    def wait(self, after_turn, timeout):
+        """
+        Return the newest published state of the game once its current_turn is past after_turn,
+        or None if that doesn't happen within timeout seconds.
+        """
+        channel = self._channel
+        with channel.condition:
+            return channel.condition.wait_for(lambda: channel.newer(after_turn), timeout)
+
+    async def wait_async(self, after_turn, timeout):
+        """As wait, for a coroutine. Waits on the event loop rather than blocking a thread."""
+        channel = self._channel
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+
+        while True:
+            with channel.condition:
+                state = channel.newer(after_turn)
+                if state is not None or loop.time() >= deadline:
+                    return state
+                waiter = (loop, loop.create_future())
+                channel.futures.add(waiter)
+
+            try:
+                await asyncio.wait_for(waiter[1], deadline - loop.time())
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with channel.condition:
+                    channel.futures.discard(waiter)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._events._unsubscribe(self.game_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+KEEPALIVE = ": keepalive\n\n"
+
+
+class EventStream:
+    """
+    Server-sent events for one subscriber: the game's current state unless the client has it
+    already, then every newer state until the game has a winner, with a keepalive comment
+    whenever keepalive seconds pass without a move. render turns a state into an event.
+    Iterating blocks a thread on the subscription, the coroutine views of app.asgi iterate with
+    async for instead. Either way the subscription is closed when the stream ends.
+    """
+
+    def __init__(self, subscription, game, render, last_event_id=None, keepalive=15.0):
+        self.subscription = subscription
+        self.game = game
+        self.render = render
+        self.last_event_id = last_event_id
+        self.keepalive = keepalive
+
+    def __iter__(self):
+        with self.subscription:
+            state = self.game
+            if self.last_event_id is None or state['current_turn'] > self.last_event_id:
+                yield self.render(state)
+
+            while state['winner'] is None:
+                newer = self.subscription.wait(state['current_turn'], self.keepalive)
+                if newer is None:
+                    yield KEEPALIVE
+                else:
+                    state = newer
+                    yield self.render(state)
+
+    async def __aiter__(self):
+        with self.subscription:
+            state = self.game
+            if self.last_event_id is None or state['current_turn'] > self.last_event_id:
+                yield self.render(state)
+
+            while state['winner'] is None:
+                newer = await self.subscription.wait_async(state['current_turn'], self.keepalive)
+                if newer is None:
+                    yield KEEPALIVE
+                else:
+                    state = newer
+                    yield self.render(state)
+
+
+class GameEvents:
+    """
+    In-process pub/sub of game states. Moves publish the committed state, subscribers wait
+    for a game's current_turn to pass the one they have. Everyone waiting on a game shares one
+    Condition rather than a queue each. Under the Flask server, an idle subscriber still
+    holds its request thread, blocked on the Condition, for as long as its stream or long
+    poll is open; only the coroutine views of app.asgi wait without one.
+    Only games with subscribers are tracked. An optional backend carries states between workers.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self._channels = {}
+        self._lock = threading.Lock()
+
+        if backend is not None:
+            backend.start(self)
+
+    def subscribe(self, game_id):
+        """
+        Start listening to a game. Subscribe before reading the game's state, so a move
+        committed in between is still seen by Subscription.wait.
+        """
+        with self._lock:
+            channel = self._channels.get(game_id)
+            if channel is None:
+                channel = self._channels[game_id] = _Channel()
+            channel.subscribers += 1
+
+        return Subscription(self, game_id, channel)
+
+    def publish(self, state, forward=True):
+        """Wake the subscribers of a game with a newer state. forward=False keeps it off the backend."""
+        state = {field: state[field] for field in GAME_FIELDS}
+
+        with self._lock:
+            channel = self._channels.get(state['id'])
+
+        if channel is not None:
+            with channel.condition:
+                # current_turn goes up by one on every move, so it orders the states of a game
+                if channel.state is None or state['current_turn'] > channel.state['current_turn']:
+                    channel.state = state
+                    channel.condition.notify_all()
+                    for loop, future in channel.futures:
+                        loop.call_soon_threadsafe(_wake, future)
+
+        if forward and self.backend is not None:
+            self.backend.publish(state)
+
+    def watched(self):
+        """Ids of the games with subscribers."""
+        with self._lock:
+            return list(self._channels)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'games': len(self._channels),
+                'subscribers': sum(channel.subscribers for channel in self._channels.values()),
+                'shared': self.backend is not None
+            }
+
+    def close(self):
+        if self.backend is not None:
+            self.backend.close()
+
+    def _unsubscribe(self, game_id):
+        with self._lock:
+            channel = self._channels[game_id]
+            channel.subscribers -= 1
+            if channel.subscribers == 0:
+                del self._channels[game_id]
+
+
+class SQLiteNotifier:
+    """
+    Cross-worker backend that uses the database as the channel: one thread per worker
+    reads the games that have subscribers every interval seconds and publishes any newer
+    state locally. Publishing needs nothing, the move is already committed.
+    """
+
+    # Ids per query, well under SQLite's limit on bound parameters
+    CHUNK_SIZE = 500
+
+    def __init__(self, config, interval=0.5):
+        self.config = config
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, events):
+        self._thread = threading.Thread(target=self._run, args=(events,), name='game-events', daemon=True)
+        self._thread.start()
+
+    def publish(self, state):
+        pass
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, events):
+        db = connect(self.config)
+        try:
+            while not self._stop.wait(self.interval):
+                game_ids = events.watched()
+                for start in range(0, len(game_ids), self.CHUNK_SIZE):
+                    chunk = game_ids[start:start + self.CHUNK_SIZE]
+                    rows = db.execute(
+                        f"SELECT * FROM games WHERE id IN ({', '.join('?' * len(chunk))})", chunk
+                    ).fetchall()
+                    for row in rows:
+                        events.publish(row, forward=False)
+        finally:
+            db.close()
+
+
+# Cross-worker backends by GAME_EVENTS_BACKEND
+BACKENDS = {
+    'sqlite': lambda config: SQLiteNotifier(config, config['GAME_EVENTS_POLL_INTERVAL']),
+}
+
+_events_lock = threading.Lock()
+
+def get_game_events(app=None):
+    app = app or current_app
+    events = app.extensions.get('game_events')
+
+    if events is None:
+        with _events_lock:
+            events = app.extensions.get('game_events')
+            if events is None:
+                backend = app.config['GAME_EVENTS_BACKEND']
+                events = GameEvents(BACKENDS[backend](app.config) if backend else None)
+                app.extensions['game_events'] = events
+
+    return events
+
+def close_game_events(app):
+    """Stop the cross-worker backend, if one was started."""
+    events = app.extensions.pop('game_events', None)
+
+    if events is not None:
+        events.close()
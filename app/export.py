@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app.db import connect
+
+# Columns exported per table. Never the password hashes
+EXPORT_COLUMNS = {
+    'games': ('id', 'user_id', 'board', 'board_bits', 'current_turn', 'winner', 'opponent', 'created_at'),
+    'users': ('id', 'username', 'wins', 'created_at'),
+}
+
+EXPORT_FORMATS = ('ndjson', 'csv')
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_watermark(value):
+    """
+    A created_at watermark as stored by SQLite's CURRENT_TIMESTAMP, from an ISO 8601 date or
+    date and time. Times with an offset are converted to UTC. Raises ValueError.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+
+def export_rows(config, table, since_id=None, since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield lists of at most chunk_size rows of a table in id order: rows after since_id, created at
+    or after since (see parse_watermark). Reads on its own connection with fetchmany, so memory
+    stays the same however big the table is, and no pooled connection is held for the whole export.
+    """
+    columns = EXPORT_COLUMNS[table]
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE id > ?"
+    params = [since_id or 0]
+    if since is not None:
+        query += " AND created_at >= ?"
+        params.append(since)
+    query += " ORDER BY id"
+
+    db = connect(config)
+    try:
+        cursor = db.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        db.close()
+
+
+def export_lines(table, chunks, fmt):
+    """Turn the chunks of export_rows into text, one string per chunk. CSV starts with a header."""
+    columns = EXPORT_COLUMNS[table]
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(tuple(row) for row in rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # Only the header is left if there were no rows
+        if buffer.tell():
+            yield buffer.getvalue()
+    else:
+        for rows in chunks:
+            # created_at is read back as a datetime, str gives the stored text
+            yield ''.join(json.dumps(dict(zip(columns, row)), default=str) + '\n' for row in rows)
+
+
+@click.command('export')
+@click.argument('table', type=click.Choice(list(EXPORT_COLUMNS)))
+@click.option('--format', 'fmt', type=click.Choice(EXPORT_FORMATS), default='ndjson', show_default=True)
+@click.option('--since-id', type=int, help='Only rows with a higher id, e.g. the last id of the previous export.')
+@click.option('--since', help='Only rows created at or after this ISO 8601 date or time, in UTC.')
+@click.option('--chunk-size', default=DEFAULT_CHUNK_SIZE, show_default=True, help='Rows read per fetch.')
+@click.option('--output', type=click.File('w'), default='-', help='File to write, stdout by default.')
+@with_appcontext
+def export_command(table, fmt, since_id, since, chunk_size, output):
+    """Stream a table as NDJSON or CSV, for incremental exports."""
+    if since is not None:
+        try:
+            since = parse_watermark(since)
+        except ValueError:
+            raise click.BadParameter(f'{since!r} is not an ISO 8601 date or time', param_hint='--since')
+
+    exported = 0
+    last_id = since_id
+
+    def counted(chunks):
+        nonlocal exported, last_id
+        for rows in chunks:
+            exported += len(rows)
+            last_id = rows[-1][0]
+            yield rows
+
+    for text in export_lines(table, counted(export_rows(current_app.config, table, since_id, since, chunk_size)), fmt):
+        output.write(text)
+    output.flush()
+
+    # On stderr, so it stays out of the export written to stdout. Pass it as --since-id next time
+    click.echo(f'Exported {exported} {table}, last id {last_id}.', err=True)
+
+
+def init_app(app):
+    app.cli.add_command(export_command)
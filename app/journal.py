@@ -0,0 +1,290 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+from flask import current_app
+from app.cache import GAME_FIELDS
+from app.db import connect
+from app.leaderboard import get_leaderboard
+from app.middleware import get_token_cache
+
+# Game states with a higher turn replace what is stored. A game gains its winner with the
+# move that ends it, so a win is counted only by the update that sets the winner, and
+# replaying a state that was already written changes nothing
+_FLUSH_GAME_SQL = """
+    UPDATE games SET board = :board, board_bits = :board_bits, current_turn = :current_turn, winner = :winner
+    WHERE id = :id AND current_turn < :current_turn AND winner IS NULL
+"""
+
+# Moves are keyed by (game_id, ply), so a replayed move is already there
+_FLUSH_MOVES_SQL = "INSERT OR IGNORE INTO moves (game_id, ply, cell, ts) VALUES (?, ?, ?, ?)"
+
+# Game states kept per lock, moves on different games rarely wait for each other
+LOCK_STRIPES = 64
+
+
+class MoveJournal:
+    """
+    Write-behind for moves, turned on with MOVE_WRITE_BEHIND. A move is validated against
+    the newest state of its game, acknowledged and kept here as pending, and a writer thread
+    stores every pending game in one transaction every MOVE_JOURNAL_FLUSH_INTERVAL seconds,
+    or sooner once MOVE_JOURNAL_FLUSH_MOVES moves are waiting.
+
+    Pending moves are also appended to a log at MOVE_JOURNAL_PATH, split in numbered segments
+    that are deleted once their moves are stored, and replayed when the app starts. Without
+    the log, moves acknowledged since the last flush are lost if the process dies.
+    """
+
+    def __init__(self, app):
+        self.config = app.config
+        self.app = app
+        self.path = app.config['MOVE_JOURNAL_PATH']
+        self.fsync = app.config['MOVE_JOURNAL_FSYNC']
+        self.interval = app.config['MOVE_JOURNAL_FLUSH_INTERVAL']
+        self.max_moves = app.config['MOVE_JOURNAL_FLUSH_MOVES']
+
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._condition = threading.Condition()
+        # game_id -> (state, id of the user who won with it or None, [(ply, cell, ts), ...])
+        self._pending = {}
+        self._pending_moves = 0
+        # The batch being written, still the newest state of its games until committed
+        self._flushing = {}
+        self._flush_lock = threading.Lock()
+        self._closed_segments = []
+        self._segment = None
+        self._log = None
+        self._stop = False
+
+        self.batches = 0
+        self.moves_flushed = 0
+        self.last_batch_moves = 0
+        self.max_batch_moves = 0
+        self.last_flush_seconds = None
+        self.max_flush_seconds = 0.0
+
+        if self.path:
+            self.recovered = self._recover()
+            self._open_segment()
+        else:
+            self.recovered = 0
+
+        self._thread = threading.Thread(target=self._run, name='move-journal', daemon=True)
+        self._thread.start()
+
+    def lock(self, game_id):
+        """Hold while reading a game's state and appending the move, so moves on a game are applied one at a time."""
+        return self._locks[game_id % LOCK_STRIPES]
+
+    def pending(self, game_id):
+        """The newest state of a game that isn't stored yet, or None."""
+        with self._condition:
+            entry = self._pending.get(game_id) or self._flushing.get(game_id)
+
+        return entry and entry[0]
+
+    def pending_plies(self, game_id):
+        """The (ply, cell, ts) of a game's moves that aren't stored yet, oldest first."""
+        with self._condition:
+            entries = [self._flushing.get(game_id), self._pending.get(game_id)]
+
+        return [move for entry in entries if entry for move in entry[2]]
+
+    def append(self, state, win_user=None, plies=()):
+        """
+        Acknowledge a game's new state, moved by one or more moves. win_user is the user who won
+        with it, plies the (ply, cell) of the moves that led to it.
+        """
+        state = {field: state[field] for field in GAME_FIELDS}
+        ts = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        plies = [(ply, cell, ts) for ply, cell in plies]
+
+        with self._condition:
+            if self._log is not None:
+                self._log.write(json.dumps({'state': state, 'win_user': win_user, 'plies': plies}) + '\n')
+                self._log.flush()
+                if self.fsync:
+                    os.fsync(self._log.fileno())
+
+            previous = self._pending.get(state['id'])
+            self._pending[state['id']] = (state, win_user, previous[2] + plies if previous else plies)
+            # Every move counts towards MOVE_JOURNAL_FLUSH_MOVES, not every append
+            self._pending_moves += len(plies) or 1
+            if self._pending_moves >= self.max_moves:
+                self._condition.notify()
+
+    def flush(self):
+        """Store every pending move now. Returns the number of moves stored."""
+        with self._flush_lock:
+            with self._condition:
+                batch, moves = self._pending, self._pending_moves
+                if not batch:
+                    return 0
+
+                self._pending, self._pending_moves = {}, 0
+                self._flushing = batch
+                if self._log is not None:
+                    self._open_segment()
+                segments = list(self._closed_segments)
+
+            started = time.perf_counter()
+            ranking = get_leaderboard(self.app).version()
+            try:
+                wins = self._store(batch.values())
+            except BaseException:
+                # Back in line for the next flush, behind any newer state of the same games
+                with self._condition:
+                    for game_id, entry in batch.items():
+                        newer = self._pending.get(game_id)
+                        self._pending[game_id] = (*newer[:2], entry[2] + newer[2]) if newer else entry
+                    self._pending_moves += moves
+                    self._flushing = {}
+                raise
+            elapsed = time.perf_counter() - started
+
+            with self._condition:
+                self._flushing = {}
+                for segment in segments:
+                    os.unlink(segment)
+                    self._closed_segments.remove(segment)
+
+                self.batches += 1
+                self.moves_flushed += moves
+                self.last_batch_moves = moves
+                self.max_batch_moves = max(self.max_batch_moves, moves)
+                self.last_flush_seconds = elapsed
+                self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+        # Cached tokens hold the user row, which no longer has the right wins
+        for user_id, user_wins in wins:
+            get_token_cache(self.app).invalidate_user(user_id)
+            get_leaderboard(self.app).record_win(ranking, user_wins - 1)
+
+        return moves
+
+    def stats(self):
+        with self._condition:
+            return {
+                'pending_games': len(self._pending),
+                'pending_moves': self._pending_moves,
+                'batches': self.batches,
+                'moves_flushed': self.moves_flushed,
+                'last_batch_moves': self.last_batch_moves,
+                'max_batch_moves': self.max_batch_moves,
+                'mean_batch_moves': self.moves_flushed / self.batches if self.batches else None,
+                'last_flush_seconds': self.last_flush_seconds,
+                'max_flush_seconds': self.max_flush_seconds,
+                'recovered': self.recovered,
+                'log': self.path
+            }
+
+    def close(self):
+        """Stop the writer and store what is pending."""
+        with self._condition:
+            self._stop = True
+            self._condition.notify()
+        self._thread.join()
+
+        self.flush()
+        with self._condition:
+            if self._log is not None:
+                self._log.close()
+                os.unlink(self._segment)
+                self._log = None
+
+    def _store(self, entries):
+        # One transaction for the whole batch. Returns (user_id, wins) for every win stored
+        db = connect(self.config)
+        wins = []
+        try:
+            for state, win_user, plies in entries:
+                cursor = db.execute(_FLUSH_GAME_SQL, state)
+                if cursor.rowcount == 1 and win_user is not None:
+                    user_wins = db.execute(
+                        "UPDATE users SET wins = wins + 1 WHERE id = ? RETURNING wins", (win_user,)
+                    ).fetchall()[0][0]
+                    wins.append((win_user, user_wins))
+                db.executemany(_FLUSH_MOVES_SQL, [(state['id'], *move) for move in plies])
+            db.commit()
+        finally:
+            db.close()
+
+        return wins
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._stop or self._pending_moves >= self.max_moves, self.interval)
+                if self._stop:
+                    return
+
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Storing pending moves failed, retrying with the next flush')
+
+    def _segments(self):
+        # Numbered so replaying in order applies older states first
+        return sorted(glob.glob(f'{glob.escape(self.path)}.*'), key=lambda path: int(path.rsplit('.', 1)[1]))
+
+    def _open_segment(self):
+        if self._log is not None:
+            self._log.close()
+            self._closed_segments.append(self._segment)
+
+        existing = self._segments()
+        number = int(existing[-1].rsplit('.', 1)[1]) + 1 if existing else 1
+        self._segment = f'{self.path}.{number}'
+        self._log = open(self._segment, 'a')
+
+    def _recover(self):
+        # Moves acknowledged by a process that stopped before storing them
+        entries = {}
+        segments = self._segments()
+        for segment in segments:
+            with open(segment) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Cut short by the crash, the move was never acknowledged
+                        break
+                    state = entry['state']
+                    stored = entries.get(state['id'])
+                    plies = [tuple(move) for move in entry.get('plies', ())]
+                    if stored is None:
+                        entries[state['id']] = (state, entry['win_user'], plies)
+                    elif state['current_turn'] > stored[0]['current_turn']:
+                        entries[state['id']] = (state, entry['win_user'], stored[2] + plies)
+                    else:
+                        stored[2].extend(plies)
+
+        if entries:
+            self._store(entries.values())
+        for segment in segments:
+            os.unlink(segment)
+
+        return len(entries)
+
+
+def get_move_journal(app=None):
+    """The app's MoveJournal, None unless MOVE_WRITE_BEHIND is set."""
+    app = app or current_app
+    return app.extensions.get('move_journal')
+
+def close_move_journal(app):
+    """Store pending moves and stop the writer, e.g. on shutdown."""
+    journal = app.extensions.pop('move_journal', None)
+
+    if journal is not None:
+        atexit.unregister(journal.close)
+        journal.close()
+
+def init_app(app):
+    if app.config['MOVE_WRITE_BEHIND']:
+        # Created with the app, so moves left in the log are stored before any new one
+        journal = app.extensions['move_journal'] = MoveJournal(app)
+        atexit.register(journal.close)
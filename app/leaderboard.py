@@ -0,0 +1,124 @@
+import threading
+import time
+from flask import current_app
+from app.db import get_db
+
+
+class WinsRanking:
+    """
+    Order statistics over users' win counts: a Fenwick tree of how many users have each
+    number of wins. Moving a user up one win and ranking a win count are both O(log max wins).
+    """
+
+    def __init__(self, counts=None):
+        self.total = 0
+        self._counts = []
+        self._tree = [0]
+        for wins, users in (counts or {}).items():
+            self.add(wins, users)
+
+    def add(self, wins, users=1):
+        """Add users (negative to remove) with the given number of wins."""
+        if wins >= len(self._counts):
+            self._grow(wins + 1)
+
+        self._counts[wins] += users
+        self.total += users
+        i = wins + 1
+        while i < len(self._tree):
+            self._tree[i] += users
+            i += i & -i
+
+    def record_win(self, old_wins):
+        """Move one user from old_wins to old_wins + 1."""
+        self.add(old_wins, -1)
+        self.add(old_wins + 1, 1)
+
+    def count_above(self, wins):
+        """Number of users with more than the given wins."""
+        at_most = 0
+        i = min(wins + 1, len(self._tree) - 1)
+        while i > 0:
+            at_most += self._tree[i]
+            i -= i & -i
+
+        return self.total - at_most
+
+    def rank(self, wins):
+        """1-based rank of a user with the given wins. Users with the same wins share a rank."""
+        return self.count_above(wins) + 1
+
+    def _grow(self, size):
+        # Double, so a user climbing one win at a time rebuilds the tree O(log wins) times
+        size = max(size, 2 * len(self._counts), 64)
+        self._counts += [0] * (size - len(self._counts))
+        self._tree = [0] * (size + 1)
+        for wins, users in enumerate(self._counts):
+            i = wins + 1
+            while i <= size:
+                self._tree[i] += users
+                i += i & -i
+
+
+class Leaderboard:
+    """
+    The app's WinsRanking, loaded from the users table on first use and reloaded every
+    `refresh` seconds, so wins counted by other workers show up.
+
+    Writers take version() before committing and pass it to record_win or record_user after.
+    A load in between may already have read the commit, so rather than count it twice, the
+    ranking is dropped and loaded again on the next rank.
+    """
+
+    def __init__(self, refresh=60.0):
+        self.refresh = refresh
+        self._ranking = None
+        self._loaded_at = 0.0
+        self._loads = 0
+        self._lock = threading.Lock()
+
+    def _load(self):
+        counts = dict(get_db().execute("SELECT wins, COUNT(*) FROM users GROUP BY wins").fetchall())
+        self._ranking = WinsRanking(counts)
+        self._loaded_at = time.monotonic()
+        self._loads += 1
+
+    def version(self):
+        with self._lock:
+            return self._loads
+
+    def rank(self, wins):
+        with self._lock:
+            if self._ranking is None or time.monotonic() - self._loaded_at > self.refresh:
+                self._load()
+            return self._ranking.rank(wins), self._ranking.total
+
+    def record_user(self, version, users=1):
+        with self._lock:
+            # Not loaded yet, the next load reads the new users from the table
+            if self._ranking is not None:
+                if self._loads != version:
+                    self._ranking = None
+                else:
+                    self._ranking.add(0, users)
+
+    def record_win(self, version, old_wins):
+        with self._lock:
+            if self._ranking is not None:
+                if self._loads != version:
+                    self._ranking = None
+                else:
+                    self._ranking.record_win(old_wins)
+
+
+_leaderboard_lock = threading.Lock()
+
+def get_leaderboard(app=None):
+    app = app or current_app
+    leaderboard = app.extensions.get('leaderboard')
+
+    if leaderboard is None:
+        with _leaderboard_lock:
+            leaderboard = app.extensions.setdefault('leaderboard', Leaderboard(app.config['LEADERBOARD_REFRESH']))
+
+    return leaderboard
@@ -1,40 +1,179 @@
+import hashlib
+import hmac
+import inspect
+import threading
+import time
+from collections import OrderedDict
 from functools import wraps
 import jwt
 from flask import request, current_app
-from app.db import get_db
+from app.adapters import SyncAdapter, run_sync
+
+
+class TokenCache:
+    """
+    LRU cache of verified tokens, keyed by the token's SHA-256 digest.
+    Each entry holds the decoded claims and the user row, and is dropped at the token's
+    `exp` or when invalidate_user is called for its user.
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._by_user = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode('utf8')).digest()
+
+    def get(self, token):
+        """Return (claims, user) for a cached token that hasn't expired, else None."""
+        key = self._key(token)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0]['exp'] > time.time():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, token, claims, user):
+        # Tokens without an expiry are never cached, as nothing would ever drop them
+        if self.maxsize <= 0 or 'exp' not in claims:
+            return
+
+        key = self._key(token)
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (claims, user)
+            self._by_user.setdefault(user['id'], set()).add(key)
+
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user, e.g. after their row changed."""
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._entries),
+                'maxsize': self.maxsize
+            }
+
+    def _remove(self, key):
+        claims, user = self._entries.pop(key)
+        keys = self._by_user.get(user['id'])
+        keys.discard(key)
+        if not keys:
+            del self._by_user[user['id']]
+
+
+_cache_lock = threading.Lock()
+
+def get_token_cache(app=None):
+    app = app or current_app
+    cache = app.extensions.get('token_cache')
+
+    if cache is None:
+        with _cache_lock:
+            cache = app.extensions.setdefault('token_cache', TokenCache(app.config['TOKEN_CACHE_SIZE']))
+
+    return cache
+
+
+async def _authenticate(db):
+    # The user of the request's token, or the error response as (None, response)
+    token = None
+    if "Authorization" in request.headers:
+        # I think this could be a bug?, modifying it
+        # token = request.headers["Authorization"].split(" ")[1]
+        token = request.headers["Authorization"]
+    if not token:
+        return None, ({
+            "message": "Authentication Token is missing!",
+            "data": None,
+            "error": "Unauthorized"
+        }, 403)
+
+    cache = get_token_cache()
+    cached = cache.get(token)
+    if cached is not None:
+        return cached[1], None
+
+    try:
+        data=jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
+        current_user = await db.fetchone('SELECT * FROM users WHERE id = ?', (data["user_id"],))
+        if current_user is None:
+            return None, ({
+            "message": "Invalid Authentication token!",
+            "data": None,
+            "error": "Unauthorized"
+        }, 403)
+    except Exception as e:
+        return None, ({
+            "message": "Something went wrong",
+            "data": None,
+            "error": str(e)
+        }, 500)
+
+    cache.put(token, data, current_user)
+
+    return current_user, None
+
 
 def token_required(f):
+    # The coroutine views of app.asgi.AsyncViews get their adapter first and the user after it,
+    # Flask views the user first
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated(db, *args, **kwargs):
+            current_user, error = await _authenticate(db)
+            if error:
+                return error
+
+            return await f(db, current_user, *args, **kwargs)
+    else:
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            current_user, error = run_sync(_authenticate(SyncAdapter()))
+            if error:
+                return error
+
+            return f(current_user, *args, **kwargs)
+
+    return decorated
+
+
+def admin_required(f):
+    # Admin endpoints take ADMIN_TOKEN as the Authorization header, and are off while it isn't set
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        if "Authorization" in request.headers:
-            # I think this could be a bug?, modifying it
-            # token = request.headers["Authorization"].split(" ")[1]
-            token = request.headers["Authorization"]
-        if not token:
+        admin_token = current_app.config['ADMIN_TOKEN']
+        token = request.headers.get("Authorization", "")
+
+        if not admin_token or not hmac.compare_digest(token.encode(), admin_token.encode()):
             return {
-                "message": "Authentication Token is missing!",
+                "message": "Invalid admin token!",
                 "data": None,
                 "error": "Unauthorized"
             }, 403
-        try:
-            data=jwt.decode(token, current_app.config["SECRET_KEY"], algorithms=["HS256"])
-            current_user = get_db().execute(
-                'SELECT * FROM users WHERE id = ?', (data["user_id"],)
-            ).fetchone()
-            if current_user is None:
-                return {
-                "message": "Invalid Authentication token!",
-                "data": None,
-                "error": "Unauthorized"
-            }, 403
-        except Exception as e:
-            return {
-                "message": "Something went wrong",
-                "data": None,
-                "error": str(e)
-            }, 500
 
-        return f(current_user, *args, **kwargs)
+        return f(*args, **kwargs)
 
     return decorated
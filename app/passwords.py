@@ -0,0 +1,119 @@
+import asyncio
+import atexit
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from flask import current_app
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Werkzeug's parameters for a method given without them, e.g. "pbkdf2" or "scrypt"
+_METHOD_DEFAULTS = {
+    'pbkdf2': ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)],
+    'scrypt': ['32768', '8', '1'],
+}
+
+
+def full_method(method):
+    """Spell out a Werkzeug hash method with all its parameters, e.g. "pbkdf2" -> "pbkdf2:sha256:600000"."""
+    name, *params = method.split(':')
+    defaults = _METHOD_DEFAULTS.get(name, [])
+
+    return ':'.join([name] + params + defaults[len(params):])
+
+
+def needs_rehash(password_hash, method=None):
+    """True when a stored hash wasn't made with the configured method and cost."""
+    method = method or current_app.config['PASSWORD_HASH_METHOD']
+    return password_hash.split('$', 1)[0] != full_method(method)
+
+
+def get_hash_pool(app=None):
+    """Return the app's process pool for hashing, or None when hashing runs inline."""
+    app = app or current_app
+    return app.extensions.get('password_pool')
+
+
+def close_hash_pool(app):
+    """Shut down the app's hashing processes, e.g. on shutdown."""
+    pool = app.extensions.pop('password_pool', None)
+
+    if pool is not None:
+        pool.shutdown()
+        atexit.unregister(pool.shutdown)
+
+
+def init_app(app):
+    workers = app.config['PASSWORD_HASH_WORKERS']
+    if workers <= 0:
+        return
+
+    # Created with the app, before the server starts its threads. Workers come from a forkserver,
+    # or are spawned, so none is forked from a process other threads may hold locks in
+    method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    pool = app.extensions['password_pool'] = ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context(method)
+    )
+    atexit.register(pool.shutdown)
+
+
+# With a pool, the sync functions below block the request thread until a worker process has the
+# result. What they buy is a bound on the cores hashing takes, at most PASSWORD_HASH_WORKERS however
+# many requests hash at once, and no hashing in the server's own process. They don't free the thread
+# while it waits, only the coroutine views of app.asgi do, through the *_async functions further down
+
+def hash_password(password):
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    pool = get_hash_pool()
+
+    if pool is None:
+        return generate_password_hash(password, method)
+
+    return pool.submit(generate_password_hash, password, method).result()
+
+
+def hash_passwords(passwords):
+    """
+    Hash many passwords in parallel, over the process pool when there is one. Otherwise
+    over threads, since hashlib releases the GIL while it hashes.
+    """
+    method = current_app.config['PASSWORD_HASH_METHOD']
+    methods = [method] * len(passwords)
+    pool = get_hash_pool()
+
+    if pool is not None:
+        return list(pool.map(generate_password_hash, passwords, methods))
+
+    if len(passwords) <= 1:
+        return [generate_password_hash(password, method) for password in passwords]
+
+    with ThreadPoolExecutor(max_workers=min(len(passwords), os.cpu_count() or 1)) as threads:
+        return list(threads.map(generate_password_hash, passwords, methods))
+
+
+def verify_password(password_hash, password):
+    pool = get_hash_pool()
+
+    if pool is None:
+        return check_password_hash(password_hash, password)
+
+    return pool.submit(check_password_hash, password_hash, password).result()
+
+
+# For the coroutine views of app.asgi: hashing runs on the process pool when there is one,
+# else on the event loop's default threads, and the view awaits it without blocking the loop
+
+async def hash_password_async(app, password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_pool(app), generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+
+async def hash_passwords_async(app, passwords):
+    loop = asyncio.get_running_loop()
+    pool, method = get_hash_pool(app), app.config['PASSWORD_HASH_METHOD']
+
+    return await asyncio.gather(*(loop.run_in_executor(pool, generate_password_hash, password, method) for password in passwords))
+
+
+async def verify_password_async(app, password_hash, password):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_hash_pool(app), check_password_hash, password_hash, password)
@@ -0,0 +1,41 @@
+from flask import Blueprint, current_app, request, jsonify, Response
+from app.export import DEFAULT_CHUNK_SIZE, EXPORT_COLUMNS, EXPORT_FORMATS, export_lines, export_rows, parse_watermark
+from app.middleware import admin_required
+
+bp = Blueprint('admin', __name__, url_prefix='/admin')
+
+MAX_CHUNK_SIZE = 10000
+
+MIMETYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+@bp.route('/export/<table>', methods=['GET'])
+@admin_required
+def export(table):
+    fmt = request.args.get('format', 'ndjson')
+    since_id = request.args.get('since_id', type=int)
+    since = request.args.get('since')
+    chunk_size = request.args.get('chunk_size', DEFAULT_CHUNK_SIZE, type=int)
+
+    if table not in EXPORT_COLUMNS:
+        return jsonify({'message': f'Unknown table, expected one of {", ".join(EXPORT_COLUMNS)}'}), 404
+
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'message': f'Unknown format, expected one of {", ".join(EXPORT_FORMATS)}'}), 400
+
+    if not 1 <= chunk_size <= MAX_CHUNK_SIZE:
+        return jsonify({'message': f'Chunk size must be between 1 and {MAX_CHUNK_SIZE}'}), 400
+
+    if since is not None:
+        try:
+            since = parse_watermark(since)
+        except ValueError:
+            return jsonify({'message': 'since must be an ISO 8601 date or time'}), 400
+
+    # Rows are read chunk by chunk as the response is sent, on a connection of the export's own
+    chunks = export_rows(current_app.config, table, since_id, since, chunk_size)
+    return Response(export_lines(table, chunks, fmt), mimetype=MIMETYPES[fmt], headers={
+        'Content-Disposition': f'attachment; filename={table}.{fmt}'
+    })
@@ -1,13 +1,21 @@
+import json
+import sqlite3
 import jwt
 from datetime import datetime, timedelta
 from flask import Blueprint, g, request, jsonify, current_app
-from werkzeug.security import check_password_hash, generate_password_hash
-from app.db import get_db
+from app.asgi import AsyncViews
+from app.leaderboard import get_leaderboard
+from app.middleware import get_token_cache
+from app.passwords import needs_rehash
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
+# Coroutine views, served by Flask and by app.asgi alike
+aio = AsyncViews(bp)
 
-@bp.route("/register", methods=["POST"])
-def register():
+_FIND_USERS_SQL = "SELECT id, username FROM users WHERE username IN (SELECT value FROM json_each(?))"
+
+@aio.route("/register", methods=["POST"])
+async def register(db):
     data = request.get_json()
 
     if not data:
@@ -19,16 +27,16 @@ def register():
     if not username or not password:
         return jsonify({"message": "Missing required fields!"}), 400
 
-    db = get_db()
-
     insert_query = """
         INSERT INTO users (username, password)
         VALUES (?, ?)
     """
 
     try:
-        cursor = db.execute(insert_query, (username, generate_password_hash(password, "pbkdf2")))
-        db.commit()
+        cursor = await db.execute(insert_query, (username, await db.hash_password(password)))
+        ranking = get_leaderboard().version()
+        await db.commit()
+        get_leaderboard().record_user(ranking)
         return jsonify({
             "message": "User registered successfully!",
             "user": {
@@ -38,13 +46,101 @@ def register():
             }
         }), 201
 
-    except db.IntegrityError:
+    except sqlite3.IntegrityError:
         return jsonify({"message": "Username already exists!"}), 400
     except Exception as e:
         return jsonify({"message": "An error occurred: " + str(e)}), 500
 
-@bp.route("/login", methods=["POST"])
-def login():
+@aio.route("/register/bulk", methods=["POST"])
+async def register_bulk(db):
+    data = request.get_json()
+
+    if not isinstance(data, list) or not data:
+        return jsonify({"message": "Request body must be a JSON array of users"}), 400
+
+    max_users = current_app.config["AUTH_BULK_MAX_USERS"]
+    if len(data) > max_users:
+        return jsonify({"message": f"At most {max_users} users can be registered at once"}), 400
+
+    results, pending = _bulk_items(data)
+
+    async def mark_existing():
+        for row in await db.fetchall(_FIND_USERS_SQL, (json.dumps(list(pending)),)):
+            _mark_taken(results, pending, row)
+
+    try:
+        # Skip hashing for names that are already taken
+        await mark_existing()
+        hashes = dict(zip(pending, await db.hash_passwords([password for _, password in pending.values()])))
+
+        # Names may have been taken while hashing, so check again under the write lock
+        await db.execute("BEGIN IMMEDIATE")
+        await mark_existing()
+        await db.executemany(
+            "INSERT INTO users (username, password) VALUES (?, ?)",
+            [(username, hashes[username]) for username in pending]
+        )
+        for row in await db.fetchall(_FIND_USERS_SQL, (json.dumps(list(pending)),)):
+            _mark_created(results, pending, row)
+        ranking = get_leaderboard().version()
+        await db.commit()
+        get_leaderboard().record_user(ranking, sum(1 for result in results if result["status"] == 201))
+
+    except Exception as e:
+        await db.rollback()
+        return jsonify({"message": "An error occurred: " + str(e)}), 500
+
+    return jsonify(_bulk_response(results)), 200
+
+def _bulk_items(data):
+    """
+    Check the items of a bulk registration. Returns the results, one per item in the order
+    given and None for the items to register, and {username: (index, password)} of those.
+    """
+    results = [None] * len(data)
+    pending = {}
+
+    for index, item in enumerate(data):
+        username = item.get("username") if isinstance(item, dict) else None
+        password = item.get("password") if isinstance(item, dict) else None
+
+        if not username or not password:
+            results[index] = {"username": username, "status": 400, "message": "Missing required fields!"}
+        elif not isinstance(username, str) or not isinstance(password, str):
+            # Anything else would be stored as text but looked up by its own value below
+            results[index] = {"username": username, "status": 400, "message": "Username and password must be strings"}
+        elif username in pending:
+            results[index] = {"username": username, "status": 400, "message": "Username already exists!"}
+        else:
+            pending[username] = (index, password)
+
+    return results, pending
+
+def _mark_taken(results, pending, row):
+    index, _ = pending.pop(row["username"])
+    results[index] = {"username": row["username"], "status": 400, "message": "Username already exists!"}
+
+def _mark_created(results, pending, row):
+    results[pending[row["username"]][0]] = {
+        "username": row["username"],
+        "status": 201,
+        "message": "User registered successfully!",
+        "user": {
+            "id": row["id"],
+            "username": row["username"],
+            "wins": 0
+        }
+    }
+
+def _bulk_response(results):
+    created = sum(1 for result in results if result["status"] == 201)
+    return {
+        "message": f"Registered {created} of {len(results)} users",
+        "results": results
+    }
+
+@aio.route("/login", methods=["POST"])
+async def login(db):
     data = request.get_json()
     if not data:
         return jsonify({"message": "Request body must be JSON"}), 400
@@ -55,31 +151,39 @@ def login():
     if not username or not password:
         return jsonify({"message": "Username and password are required"}), 400
 
-    db = get_db()
     try:
-        user = db.execute(
+        user = await db.fetchone(
             "SELECT * FROM users WHERE username = ?", (username,)
-        ).fetchone()
-
-        if user and check_password_hash(user["password"], password):
-            return jsonify({
-                "status": "success",
-                "token": jwt.encode(
-                    {
-                        "user_id": user["id"],
-                        "exp" : datetime.utcnow() + timedelta(minutes = 30)
-                    },
-                    current_app.config["SECRET_KEY"],
-                    algorithm="HS256"
-                ),
-                "user": {
-                    "id": user["id"],
-                    "username": user["username"],
-                    "wins": user["wins"]
-                }
-            }), 200
+        )
+
+        if user and await db.verify_password(user["password"], password):
+            # Bring the stored hash up to the configured method and cost
+            if needs_rehash(user["password"]):
+                await db.execute("UPDATE users SET password = ? WHERE id = ?", (await db.hash_password(password), user["id"]))
+                await db.commit()
+                get_token_cache().invalidate_user(user["id"])
+
+            return jsonify(_login_response(user, current_app.config)), 200
         else:
             return jsonify({"status": "failed"}), 403
 
     except Exception as e:
         return jsonify({"message": "An error occurred: " + str(e)}), 500
+
+def _login_response(user, config):
+    return {
+        "status": "success",
+        "token": jwt.encode(
+            {
+                "user_id": user["id"],
+                "exp" : datetime.utcnow() + timedelta(minutes = 30)
+            },
+            config["SECRET_KEY"],
+            algorithm="HS256"
+        ),
+        "user": {
+            "id": user["id"],
+            "username": user["username"],
+            "wins": user["wins"]
+        }
+    }
@@ -1,73 +1,664 @@
-from flask import Blueprint, g, request, jsonify
-from app.db import get_db
-from app.middleware import token_required
-from app.util import check_winner
+import itertools
+import json
+import sqlite3
+from flask import Blueprint, current_app, request, jsonify, Response
+from app.ai import best_move
+from app.asgi import AsyncViews
+from app.cache import get_game_cache
+from app.events import EventStream, get_game_events
+from app.journal import get_move_journal
+from app.leaderboard import get_leaderboard
+from app.middleware import get_token_cache, token_required
+from app.util import bits_to_board, board_to_bits, check_winner
 
 bp = Blueprint('game', __name__, url_prefix='/game')
+# Coroutine views, served by Flask and by app.asgi alike
+aio = AsyncViews(bp)
+
+# The next board for either storage, as SQL over the row being updated. The expression
+# for the storage a game doesn't use is NULL, since its column is NULL
+_NEXT_BOARD_SQL = "substr(board, 1, :move) || CASE current_turn % 2 WHEN 1 THEN 'X' ELSE 'O' END || substr(board, :move + 2)"
+_NEXT_BITS_SQL = "(board_bits | (1 << (:move + 9 * (1 - current_turn % 2))))"
+
+# A whole move in one statement: the cell must be free and the game unfinished when the
+# row is written, so concurrent moves can't overwrite each other and no SELECT is needed first.
+# A client that passes the current_turn it last saw gets a compare-and-swap on it as well
+_MOVE_QUERY = f"""
+    UPDATE games SET
+        board = {_NEXT_BOARD_SQL},
+        board_bits = {_NEXT_BITS_SQL},
+        current_turn = current_turn + 1,
+        winner = CASE WHEN board IS NULL
+            THEN check_winner_bits(({_NEXT_BITS_SQL} & 511), ({_NEXT_BITS_SQL} >> 9))
+            ELSE check_winner({_NEXT_BOARD_SQL})
+        END
+    WHERE id = :game_id AND winner IS NULL
+        AND (:current_turn IS NULL OR current_turn = :current_turn)
+        AND (substr(board, :move + 1, 1) = ' ' OR (board_bits >> :move) & 513 = 0)
+    RETURNING id, user_id, board, board_bits, current_turn, winner, opponent
+"""
+
+_INSERT_GAME_SQL = "INSERT INTO games (user_id, board, board_bits, opponent) VALUES (:user_id, :board, :board_bits, :opponent)"
+
+# The history of a game, one row per move in the transaction that plays it
+_INSERT_MOVE_SQL = "INSERT INTO moves (game_id, ply, cell) VALUES (?, ?, ?)"
+
+# Opponents a game can be created with, besides another user
+OPPONENTS = ('ai',)
+
+# Filters for the game listing, each backed by a partial index in schema.sql
+STATUS_FILTERS = {
+    'in_progress': "winner IS NULL",
+    'won': "winner IN ('X', 'O')",
+    'draw': "winner = 'Draw'",
+}
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
 
 def initialize_board():
     return [" "] * 9
 
-@bp.route('', methods=['POST'])
+def game_board(game):
+    """Return the board of a games row as a 9-cell list, whichever way it is stored."""
+    if game['board'] is not None:
+        return list(game['board'])
+
+    return bits_to_board(game['board_bits'])
+
+def game_status(game):
+    if game['winner'] is None:
+        return 'in_progress'
+
+    return 'draw' if game['winner'] == 'Draw' else 'won'
+
+def game_json(game):
+    return {
+        'game_id': game['id'],
+        'user_id': game['user_id'],
+        'board': game_board(game),
+        'winner': game['winner'],
+        'current_turn': game['current_turn'],
+        'opponent': game['opponent'],
+        'status': game_status(game)
+    }
+
+def game_etag(game):
+    """Version of a game's state: current_turn goes up with every move, and a game's winner only changes with a move."""
+    return f"{game['id']}-{game['current_turn']}"
+
+async def load_game(db, game_id):
+    """
+    Return the state of a game: moves the journal hasn't stored yet, then the game cache,
+    then the database on a miss. None if there is no such game.
+
+    A cache kept per worker never sees the moves made in other workers, and a shared one
+    misses those whose write to it failed, so a hit is checked against the current_turn
+    stored in the database, a read of the primary key alone, and read again in full if
+    another worker moved the game.
+    """
+    journal = get_move_journal()
+    if journal is not None:
+        game = journal.pending(game_id)
+        if game is not None:
+            return game
+
+    cache = get_game_cache()
+    game = cache.get(game_id)
+
+    if game is not None:
+        stored = await db.fetchone("SELECT current_turn FROM games WHERE id = ?", (game_id,))
+        # Ahead of the database is only a move of this worker still being written
+        if stored is None or stored['current_turn'] > game['current_turn']:
+            cache.invalidate(game_id)
+            game = None
+
+    if game is None:
+        game = await db.fetchone("SELECT * FROM games WHERE id = ?", (game_id,))
+        if game is not None:
+            cache.put(game)
+
+    return game
+
+def _is_int(value):
+    # JSON true and false come in as bools, which are ints to Python
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _turn_error(expected_turn):
+    """The error response for a current_turn that isn't an int, None if it is one or wasn't given."""
+    # SQLite would compare "3" equal to 3, while the 409 check after a failed move wouldn't
+    if expected_turn is not None and not _is_int(expected_turn):
+        return {'message': 'current_turn must be an integer'}, 400
+
+    return None
+
+def _game_error(game, expected_turn):
+    """The error response for a move on a game that can't take one, None if it can."""
+    if not game:
+        return {'message': 'Invalid game ID'}, 400
+
+    if game['winner']:
+        return {'message': 'Game already has a winner', 'board': ''.join(game_board(game)), 'winner': game['winner']}, 400
+
+    if expected_turn is not None and expected_turn != game['current_turn']:
+        return {'message': 'Game was changed by another move', 'current_turn': game['current_turn']}, 409
+
+    return None
+
+def _play_moves(game, moves):
+    """
+    Play moves on a game in memory, with the computer's answer after each one in a game
+    against the AI. Stops at the first move that can't be played.
+    Returns (board, current_turn, winner, user_won, steps, played, message).
+    """
+    board = game_board(game)
+    current_turn = game['current_turn']
+    winner = None
+    user_won = False
+    steps = []
+    played = 0
+    message = None
+
+    for move in moves:
+        if winner:
+            message = 'Game already has a winner'
+            break
+        if not isinstance(move, int) or not 0 <= move <= 8 or board[move] != " ":
+            message = 'Invalid move'
+            break
+
+        current_turn_is_user = (current_turn % 2) == 1
+        board[move] = 'X' if current_turn_is_user else 'O'
+        current_turn += 1
+        winner = check_winner(board)
+        user_won = bool(winner and winner != "Draw" and current_turn_is_user)
+        steps.append({'move': move, 'board': list(board), 'winner': winner})
+        played += 1
+
+        # The computer's answer is a step of its own
+        if game['opponent'] == 'ai' and not winner:
+            ai_move = best_move(board)
+            board[ai_move] = 'X' if (current_turn % 2) == 1 else 'O'
+            current_turn += 1
+            winner = check_winner(board)
+            steps.append({'move': ai_move, 'board': list(board), 'winner': winner, 'ai': True})
+
+    return board, current_turn, winner, user_won, steps, played, message
+
+def _stored_board(game, board):
+    """The board and board_bits columns for a board, in the storage the game uses."""
+    if game['board'] is not None:
+        return {'board': ''.join(board), 'board_bits': None}
+
+    x_mask, o_mask = board_to_bits(board)
+    return {'board': None, 'board_bits': x_mask | o_mask << 9}
+
+def _plies(first_ply, steps):
+    """(ply, cell) of the steps played by _play_moves from first_ply on, every step is a ply."""
+    return [(first_ply + i, step['move']) for i, step in enumerate(steps)]
+
+def _is_busy(error):
+    return 'database is locked' in str(error) or 'database is busy' in str(error)
+
+async def _execute_move(db, params):
+    """
+    Run the move UPDATE, retrying a bounded number of times while another
+    connection holds the write lock. Returns the updated row, or None when the
+    move didn't apply. Raises sqlite3.OperationalError once retries run out.
+    """
+    retries = current_app.config['MOVE_RETRIES']
+
+    for attempt in range(retries + 1):
+        try:
+            rows = await db.fetchall(_MOVE_QUERY, params)
+            return rows[0] if rows else None
+        except sqlite3.OperationalError as e:
+            await db.rollback()
+            if attempt == retries or not _is_busy(e):
+                raise
+            await db.sleep(current_app.config['MOVE_RETRY_BACKOFF'] * 2 ** attempt)
+
+@aio.route('', methods=['POST'])
 @token_required
-def create_game(current_user):
-    db = get_db()
+async def create_game(db, current_user):
+    data = request.get_json(silent=True) or {}
+    opponent = data.get('opponent')
+
+    if opponent is not None and opponent not in OPPONENTS:
+        return jsonify({'message': f'Unknown opponent, expected one of {", ".join(OPPONENTS)}'}), 400
+
+    if current_app.config['GAME_BOARD_STORAGE'] == 'bits':
+        board, board_bits = None, 0
+    else:
+        board, board_bits = ''.join(initialize_board()), None
 
-    board = ''.join(initialize_board())
-    cursor = db.execute(
-        "INSERT INTO games (user_id, board) VALUES (?, ?)",
-        (current_user["id"], board))
-    db.commit()
+    cursor = await db.execute(_INSERT_GAME_SQL, {
+        'user_id': current_user["id"], 'board': board, 'board_bits': board_bits, 'opponent': opponent
+    })
+    await db.commit()
+
+    get_game_cache().put({
+        'id': cursor.lastrowid, 'user_id': current_user["id"], 'board': board, 'board_bits': board_bits,
+        'current_turn': 1, 'winner': None, 'opponent': opponent
+    })
 
     return jsonify({
         'game_id': cursor.lastrowid
     }), 200
 
-@bp.route('/move', methods=['POST'])
+@aio.route('', methods=['GET'])
+@token_required
+async def list_games(db, current_user):
+    status = request.args.get('status')
+    cursor = request.args.get('cursor', type=int)
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+
+    if status is not None and status not in STATUS_FILTERS:
+        return jsonify({'message': f'Unknown status, expected one of {", ".join(STATUS_FILTERS)}'}), 400
+
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({'message': f'Limit must be between 1 and {MAX_PAGE_SIZE}'}), 400
+
+    # Keyset pagination: the page starts below the last id of the previous one, so it
+    # reads limit + 1 index entries however many games the user has
+    query = "SELECT * FROM games WHERE user_id = ?"
+    params = [current_user["id"]]
+    if status is not None:
+        query += f" AND {STATUS_FILTERS[status]}"
+    if cursor is not None:
+        query += " AND id < ?"
+        params.append(cursor)
+    query += " ORDER BY id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    games = await db.fetchall(query, params)
+
+    return jsonify({
+        'games': [game_json(game) for game in games[:limit]],
+        # Pass back as cursor for the next page, None on the last page
+        'next_cursor': games[limit - 1]['id'] if len(games) > limit else None
+    }), 200
+
+@aio.route('/<int:game_id>', methods=['GET'])
+@token_required
+async def get_game(db, current_user, game_id):
+    game = await load_game(db, game_id)
+
+    if not game:
+        return jsonify({'message': 'Invalid game ID'}), 404
+
+    # Pollers send back the ETag of the state they have. While the game sits in the game
+    # cache, an unchanged game is answered with an empty 304 after reading its current_turn alone
+    etag = game_etag(game)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(game_json(game))
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _sse(game):
+    # The event id is the game's turn, so a reconnecting EventSource sends it back as Last-Event-ID
+    return f"id: {game['current_turn']}\nevent: game\ndata: {json.dumps(game_json(game))}\n\n"
+
+@aio.route('/<int:game_id>/events', methods=['GET'])
+@token_required
+async def game_events(db, current_user, game_id):
+    subscription = get_game_events().subscribe(game_id)
+    try:
+        game = await load_game(db, game_id)
+    except BaseException:
+        subscription.close()
+        raise
+
+    if not game:
+        subscription.close()
+        return jsonify({'message': 'Invalid game ID'}), 404
+
+    # The stream only waits on the subscription, so the connection goes back to the pool now.
+    # Flask iterates it on the request thread, app.asgi with async for on the event loop
+    await db.release()
+    stream = EventStream(
+        subscription, game, _sse,
+        last_event_id=request.headers.get('Last-Event-ID', type=int),
+        keepalive=current_app.config['GAME_EVENTS_KEEPALIVE'])
+
+    response = Response(stream, mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Also unsubscribes a stream closed before it started
+    response.call_on_close(subscription.close)
+    return response
+
+@aio.route('/<int:game_id>/poll', methods=['GET'])
 @token_required
-def add_move(current_user):
+async def poll_game(db, current_user, game_id):
+    after = request.args.get('after', type=int)
+    max_timeout = current_app.config['GAME_EVENTS_WAIT_TIMEOUT']
+    timeout = request.args.get('timeout', max_timeout, type=float)
+
+    if after is None:
+        return jsonify({'message': 'after is required, the current_turn the client has'}), 400
+
+    if not 0 <= timeout <= max_timeout:
+        return jsonify({'message': f'Timeout must be between 0 and {max_timeout} seconds'}), 400
+
+    with get_game_events().subscribe(game_id) as subscription:
+        game = await load_game(db, game_id)
+
+        if not game:
+            return jsonify({'message': 'Invalid game ID'}), 404
+
+        if game['current_turn'] <= after and game['winner'] is None:
+            # Give the connection back to the pool while waiting
+            await db.release()
+            game = await db.wait(subscription, after, timeout)
+
+    if game is None:
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(game_json(game))
+        response.set_etag(game_etag(game))
+
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@aio.route('/<int:game_id>/replay', methods=['GET'])
+@token_required
+async def replay_game(db, current_user, game_id):
+    if not await load_game(db, game_id):
+        return jsonify({'message': 'Invalid game ID'}), 404
+
+    # Moves the journal hasn't stored yet come after the stored ones. They are read first,
+    # so a flush while the table is read can only repeat a ply, never skip one
+    journal = get_move_journal()
+    pending = journal.pending_plies(game_id) if journal is not None else []
+    rows = await db.execute("SELECT ply, cell, ts FROM moves WHERE game_id = ? ORDER BY ply", (game_id,))
+
+    # One JSON line per ply, read off the moves table as the response is sent,
+    # so a history is never held in memory whole
+    return Response(db.stream(_Replay(rows, pending)), mimetype='application/x-ndjson', headers={
+        'Cache-Control': 'no-cache'
+    })
+
+class _Replay:
+    """
+    The NDJSON lines of a game's plies, off a cursor of the moves table and then the pending
+    plies, skipping any seen already. Iterated by Flask, or with async for by app.asgi.
+    """
+
+    def __init__(self, rows, pending):
+        self.rows = rows
+        self.pending = pending
+        self.board = initialize_board()
+        self.last_ply = 0
+
+    def __iter__(self):
+        for ply, cell, ts in itertools.chain(self.rows, self.pending):
+            line = self._line(ply, cell, ts)
+            if line is not None:
+                yield line
+
+    async def __aiter__(self):
+        try:
+            async for ply, cell, ts in self.rows:
+                line = self._line(ply, cell, ts)
+                if line is not None:
+                    yield line
+        finally:
+            await self.rows.close()
+
+        for ply, cell, ts in self.pending:
+            line = self._line(ply, cell, ts)
+            if line is not None:
+                yield line
+
+    def _line(self, ply, cell, ts):
+        if ply <= self.last_ply:
+            return None
+
+        self.board[cell] = 'X' if ply % 2 == 1 else 'O'
+        self.last_ply = ply
+        return json.dumps({
+            'ply': ply,
+            'cell': cell,
+            'player': self.board[cell],
+            'board': self.board,
+            'winner': check_winner(self.board),
+            # UTC, as CURRENT_TIMESTAMP writes it: read back as a datetime, or still text if pending
+            'ts': str(ts)
+        }) + '\n'
+
+# The moves are left to Flask under MOVE_WRITE_BEHIND, as they hold the journal's thread locks
+@aio.route('/move', methods=['POST'], write_behind=False)
+@token_required
+async def add_move(db, current_user):
     data = request.get_json()
     game_id = data.get('game_id')
     move = data.get('move')
+    # Optional, the turn the client expects to play. A stale value means another move won the race
+    expected_turn = data.get('current_turn')
 
     if not game_id or move is None:
         return jsonify({'message': 'Game ID, and move are required'}), 400
 
-    db = get_db()
+    error = _turn_error(expected_turn)
+    if error:
+        return error
 
-    game = db.execute("SELECT * FROM games WHERE id = ?", (game_id,)).fetchone()
+    journal = get_move_journal()
+    if journal is not None:
+        return await _add_move_write_behind(db, journal, current_user, game_id, move, expected_turn)
 
-    if not game:
+    game = None
+    if isinstance(move, int) and 0 <= move <= 8:
+        try:
+            game = await _execute_move(db, {'game_id': game_id, 'move': move, 'current_turn': expected_turn})
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+            return jsonify({'message': 'Game is busy, try again'}), 409
+
+    if game is None:
+        # Nothing was written, find out why. Cells are never emptied and a winner never
+        # goes away, so a cached game showing either still explains the failure
+        game = get_game_cache().get(game_id)
+        if game is None or not (game['winner'] or isinstance(move, int) and 0 <= move <= 8 and game_board(game)[move] != " "):
+            game = await db.fetchone("SELECT * FROM games WHERE id = ?", (game_id,))
+            if game is not None:
+                get_game_cache().put(game)
+
+        return _game_error(game, expected_turn) or (jsonify({'message': 'Invalid move'}), 400)
+
+    await db.execute(_INSERT_MOVE_SQL, (game_id, game['current_turn'] - 1, move))
+
+    winner = game['winner']
+    current_turn_is_user = (game['current_turn'] - 1) % 2 == 1
+    user_won = bool(winner and winner != "Draw" and current_turn_is_user)
+
+    # Update win count for user if they won
+    wins = None
+    if user_won:
+        wins = (await db.fetchall("UPDATE users SET wins = wins + 1 WHERE id = ? RETURNING wins", (current_user["id"],)))[0][0]
+
+    # The computer answers in the same transaction, we already hold the write lock
+    ai_move = None
+    if game['opponent'] == 'ai' and not winner:
+        ai_move = best_move(game_board(game))
+        game = (await db.fetchall(_MOVE_QUERY, {'game_id': game_id, 'move': ai_move, 'current_turn': game['current_turn']}))[0]
+        await db.execute(_INSERT_MOVE_SQL, (game_id, game['current_turn'] - 1, ai_move))
+
+    ranking = get_leaderboard().version()
+    await db.commit()
+    get_game_cache().put(game)
+    get_game_events().publish(game)
+
+    # Cached tokens hold the user row, which no longer has the right wins
+    if user_won:
+        get_token_cache().invalidate_user(current_user["id"])
+        get_leaderboard().record_win(ranking, wins - 1)
+
+    response = {
+        'game_id': game_id,
+        'board': game_board(game),
+        'winner': game['winner'],
+        'current_turn': game['current_turn']
+    }
+    if game['opponent'] == 'ai':
+        response['ai_move'] = ai_move
+
+    return jsonify(response), 200
+
+async def _add_move_write_behind(db, journal, current_user, game_id, move, expected_turn):
+    # The id picks the game's lock and pending state, which only an int can do
+    if not _is_int(game_id):
         return jsonify({'message': 'Invalid game ID'}), 400
 
-    board = list(game[2])
-    current_turn = game[3]
-    winner = game[4]
-    next_turn = current_turn + 1
-    current_turn_is_user = (current_turn % 2) == 1
+    # The game's lock orders its moves, so the move is checked against the newest state
+    # and acknowledged without waiting for the database, see app.journal
+    with journal.lock(game_id):
+        game = await load_game(db, game_id)
 
-    if winner:
-        return jsonify({'message': 'Game already has a winner', 'board': ''.join(board), 'winner': winner}), 400
+        error = _game_error(game, expected_turn)
+        if error:
+            return error
 
-    if board[move] != " ":
-        return jsonify({'message': 'Invalid move'}), 400
+        if not isinstance(move, int) or not 0 <= move <= 8 or game_board(game)[move] != " ":
+            return jsonify({'message': 'Invalid move'}), 400
 
-    # Update board to store later
-    board[move] = 'X' if current_turn_is_user else 'O'
+        first_ply = game['current_turn']
+        board, current_turn, winner, user_won, steps, _, _ = _play_moves(game, [move])
+        game = dict(
+            {field: game[field] for field in ('id', 'user_id', 'opponent')},
+            **_stored_board(game, board), current_turn=current_turn, winner=winner)
 
-    winner = check_winner(board)
+        journal.append(game, current_user["id"] if user_won else None, _plies(first_ply, steps))
+        get_game_cache().put(game)
+        get_game_events().publish(game)
 
-    # Update win count for user if they won
-    if winner and winner != "Draw" and current_turn_is_user:
-        db.execute("UPDATE users SET wins = wins + 1 WHERE id = ?", (current_user["id"],))
+    response = {
+        'game_id': game_id,
+        'board': board,
+        'winner': winner,
+        'current_turn': current_turn
+    }
+    if game['opponent'] == 'ai':
+        response['ai_move'] = steps[1]['move'] if len(steps) > 1 else None
+
+    return jsonify(response), 200
+
+@aio.route('/moves', methods=['POST'], write_behind=False)
+@token_required
+async def add_moves(db, current_user):
+    data = request.get_json()
+    game_id = data.get('game_id')
+    moves = data.get('moves')
+    # Optional, the turn the client expects the first move to play
+    expected_turn = data.get('current_turn')
+
+    if not game_id or not isinstance(moves, list) or not moves:
+        return jsonify({'message': 'Game ID, and moves are required'}), 400
+
+    error = _turn_error(expected_turn)
+    if error:
+        return error
+
+    journal = get_move_journal()
+    if journal is not None:
+        return await _add_moves_write_behind(db, journal, current_user, game_id, moves, expected_turn)
+
+    # The game is played in memory, then written back only if no other move got in first
+    for attempt in range(current_app.config['MOVE_RETRIES'] + 1):
+        game = await load_game(db, game_id)
+
+        error = _game_error(game, expected_turn)
+        if error:
+            return error
+
+        board, current_turn, winner, user_won, steps, played, message = _play_moves(game, moves)
+        if not steps:
+            return jsonify({'message': message}), 400
 
-    update_query = "UPDATE games SET board = ?, current_turn = ?, winner = ? WHERE id = ?"
-    db.execute(update_query, (''.join(board), next_turn, winner, game_id))
-    db.commit()
+        stored = _stored_board(game, board)
 
+        try:
+            cursor = await db.execute(
+                "UPDATE games SET board = :board, board_bits = :board_bits, current_turn = :current_turn, winner = :winner "
+                "WHERE id = :game_id AND current_turn = :read_turn AND winner IS NULL",
+                dict(stored, current_turn=current_turn, winner=winner, game_id=game_id, read_turn=game['current_turn']))
+
+            if cursor.rowcount == 1:
+                await db.executemany(_INSERT_MOVE_SQL, [(game_id, *ply) for ply in _plies(game['current_turn'], steps)])
+
+                # Update win count for user if they won
+                if user_won:
+                    wins = (await db.fetchall(
+                        "UPDATE users SET wins = wins + 1 WHERE id = ? RETURNING wins", (current_user["id"],)
+                    ))[0][0]
+                ranking = get_leaderboard().version()
+                await db.commit()
+                state = dict(
+                    {field: game[field] for field in ('id', 'user_id', 'opponent')},
+                    **stored, current_turn=current_turn, winner=winner)
+                get_game_cache().put(state)
+                get_game_events().publish(state)
+                break
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                raise
+
+        # Another move got in first, or the write lock was held, so start over from the database
+        await db.rollback()
+        get_game_cache().invalidate(game_id)
+        if attempt < current_app.config['MOVE_RETRIES']:
+            await db.sleep(current_app.config['MOVE_RETRY_BACKOFF'] * 2 ** attempt)
+    else:
+        return jsonify({'message': 'Game is busy, try again'}), 409
+
+    # Cached tokens hold the user row, which no longer has the right wins
+    if user_won:
+        get_token_cache().invalidate_user(current_user["id"])
+        get_leaderboard().record_win(ranking, wins - 1)
+
+    return _moves_response(game_id, board, current_turn, winner, steps, played, message)
+
+async def _add_moves_write_behind(db, journal, current_user, game_id, moves, expected_turn):
+    if not _is_int(game_id):
+        return jsonify({'message': 'Invalid game ID'}), 400
+
+    # As _add_move_write_behind, the whole sequence is one entry in the journal
+    with journal.lock(game_id):
+        game = await load_game(db, game_id)
+
+        error = _game_error(game, expected_turn)
+        if error:
+            return error
+
+        board, current_turn, winner, user_won, steps, played, message = _play_moves(game, moves)
+        if not steps:
+            return jsonify({'message': message}), 400
+
+        state = dict(
+            {field: game[field] for field in ('id', 'user_id', 'opponent')},
+            **_stored_board(game, board), current_turn=current_turn, winner=winner)
+
+        journal.append(state, current_user["id"] if user_won else None, _plies(game['current_turn'], steps))
+        get_game_cache().put(state)
+        get_game_events().publish(state)
+
+    return _moves_response(game_id, board, current_turn, winner, steps, played, message)
+
+def _moves_response(game_id, board, current_turn, winner, steps, played, message):
     return jsonify({
         'game_id': game_id,
+        'steps': steps,
         'board': board,
-        'winner': winner
+        'winner': winner,
+        'current_turn': current_turn,
+        # Set when a move stopped the sequence early, moves from stopped_at on weren't played
+        'message': message,
+        'stopped_at': played if message else None
     }), 200
-
@@ -0,0 +1,49 @@
+from flask import Blueprint, request, jsonify
+from app.db import get_db
+from app.leaderboard import get_leaderboard
+from app.middleware import token_required
+
+bp = Blueprint('leaderboard', __name__, url_prefix='/leaderboard')
+
+DEFAULT_TOP = 10
+MAX_TOP = 100
+
+@bp.route('', methods=['GET'])
+@token_required
+def top(current_user):
+    limit = request.args.get('limit', DEFAULT_TOP, type=int)
+
+    if not 1 <= limit <= MAX_TOP:
+        return jsonify({'message': f'Limit must be between 1 and {MAX_TOP}'}), 400
+
+    # Walks the first entries of users_wins, however many users there are
+    users = get_db().execute(
+        "SELECT id, username, wins FROM users ORDER BY wins DESC, id LIMIT ?", (limit,)
+    ).fetchall()
+
+    leaderboard = get_leaderboard()
+    return jsonify({
+        'leaders': [{
+            'rank': leaderboard.rank(user['wins'])[0],
+            'id': user['id'],
+            'username': user['username'],
+            'wins': user['wins']
+        } for user in users]
+    }), 200
+
+@bp.route('/<int:user_id>', methods=['GET'])
+@token_required
+def user_rank(current_user, user_id):
+    user = get_db().execute("SELECT id, username, wins FROM users WHERE id = ?", (user_id,)).fetchone()
+
+    if user is None:
+        return jsonify({'message': 'Invalid user ID'}), 404
+
+    rank, users = get_leaderboard().rank(user['wins'])
+    return jsonify({
+        'id': user['id'],
+        'username': user['username'],
+        'wins': user['wins'],
+        'rank': rank,
+        'users': users
+    }), 200
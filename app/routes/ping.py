@@ -1,10 +1,36 @@
-from flask import Blueprint, g, request, jsonify
+from flask import Blueprint, current_app, g, request, jsonify
+from app.asgi import AsyncViews
+from app.cache import get_game_cache
 from app.db import get_db
-from app.middleware import token_required
+from app.events import get_game_events
+from app.journal import get_move_journal
+from app.middleware import get_token_cache, token_required
 from app.util import check_winner
 
 bp = Blueprint('ping', __name__)
+# Coroutine views, served by Flask and by app.asgi alike
+aio = AsyncViews(bp)
 
-@bp.route("/ping", methods=["GET"])
-def ping():
+@aio.route("/ping", methods=["GET"])
+async def ping(db):
     return jsonify({ "message": "pong!",}), 200
+
+@aio.route("/metrics", methods=["GET"])
+async def metrics(db):
+    metrics = {
+        "token_cache": get_token_cache().stats(),
+        "game_cache": get_game_cache().stats(),
+        "game_events": get_game_events().stats(),
+    }
+
+    # Only for DATABASE=':memory:'
+    memory_db = current_app.extensions.get('memory_db')
+    if memory_db is not None:
+        metrics["database"] = memory_db.stats()
+
+    # Only with MOVE_WRITE_BEHIND
+    journal = get_move_journal()
+    if journal is not None:
+        metrics["move_journal"] = journal.stats()
+
+    return jsonify(metrics), 200
@@ -1,5 +1,6 @@
 DROP TABLE IF EXISTS users;
 DROP TABLE IF EXISTS games;
+DROP TABLE IF EXISTS moves;
 
 CREATE TABLE users (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -12,9 +13,36 @@ CREATE TABLE users (
 CREATE TABLE games (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
-  board CHAR(9) NOT NULL,
+  -- Exactly one of board or board_bits is set, depending on GAME_BOARD_STORAGE.
+  -- board_bits packs the X cells in bits 0-8 and the O cells in bits 9-17
+  board CHAR(9),
+  board_bits INTEGER,
   current_turn INTEGER NOT NULL DEFAULT 1,
   winner VARCHAR(255),
+  -- NULL when both sides are played by users, 'ai' when the server answers every X move with O
+  opponent VARCHAR(16),
   created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-  FOREIGN KEY (user_id) REFERENCES users (id)
+  FOREIGN KEY (user_id) REFERENCES users (id),
+  CHECK ((board IS NULL) != (board_bits IS NULL))
 );
+
+-- Every move of a game, written in the same transaction as the games row.
+-- Clustered on its primary key, so replaying a game reads one range of it and nothing else
+CREATE TABLE moves (
+  game_id INTEGER NOT NULL,
+  -- The turn the move was played on: 1 for the first move, odd plies are X
+  ply INTEGER NOT NULL,
+  cell INTEGER NOT NULL,
+  ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (game_id, ply),
+  FOREIGN KEY (game_id) REFERENCES games (id)
+) WITHOUT ROWID;
+
+-- Leaderboard, best first
+CREATE INDEX users_wins ON users (wins DESC, id);
+
+-- Per user game listing, newest first, paged by id
+CREATE INDEX games_user_id ON games (user_id, id);
+CREATE INDEX games_user_in_progress ON games (user_id, id) WHERE winner IS NULL;
+CREATE INDEX games_user_won ON games (user_id, id) WHERE winner IN ('X', 'O');
+CREATE INDEX games_user_draw ON games (user_id, id) WHERE winner = 'Draw';
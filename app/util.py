@@ -1,11 +1,124 @@
-def check_winner(board):
-    winning_combos = [
-        (0, 1, 2), (3, 4, 5), (6, 7, 8),
-        (0, 3, 6), (1, 4, 7), (2, 5, 8),
-        (0, 4, 8), (2, 4, 6)
-    ]
+import itertools
+
+WINNING_COMBOS = [
+    (0, 1, 2), (3, 4, 5), (6, 7, 8),
+    (0, 3, 6), (1, 4, 7), (2, 5, 8),
+    (0, 4, 8), (2, 4, 6)
+]
+
+# Bitboards: bit i of a player's mask is set when that player holds cell i
+WIN_MASKS = tuple(sum(1 << i for i in combo) for combo in WINNING_COMBOS)
+FULL_MASK = 0b111111111
+
+# Base-3 value of a mask's set bits, so x_mask and o_mask combine into a single
+# table index: cell i contributes 3^i for "X" and 2 * 3^i for "O"
+_TERNARY = tuple(sum(3 ** i for i in range(9) if mask >> i & 1) for mask in range(FULL_MASK + 1))
+
+
+def _outcome_from_bits(x_mask, o_mask):
+    for mask in WIN_MASKS:
+        if x_mask & mask == mask:
+            return "X"
+        if o_mask & mask == mask:
+            return "O"
+
+    if x_mask | o_mask == FULL_MASK:
+        return "Draw"
+
+    return None
+
+
+def _build_outcome_tables():
+    outcomes = [None] * 3 ** 9
+    outcomes_by_board = {}
+
+    for cells in itertools.product(" XO", repeat=9):
+        x_mask = sum(1 << i for i, mark in enumerate(cells) if mark == "X")
+        o_mask = sum(1 << i for i, mark in enumerate(cells) if mark == "O")
+        outcome = _outcome_from_bits(x_mask, o_mask)
+        outcomes[_TERNARY[x_mask] + 2 * _TERNARY[o_mask]] = outcome
+        outcomes_by_board[''.join(cells)] = outcome
+
+    return tuple(outcomes), outcomes_by_board
+
+
+# Built once at import: every one of the 3^9 boards mapped to its outcome
+_OUTCOMES, _OUTCOMES_BY_BOARD = _build_outcome_tables()
+
+
+def board_to_bits(board):
+    """Return the (x_mask, o_mask) bitboards for a 9-cell board."""
+    x_mask = o_mask = 0
+    for i in range(9):
+        if board[i] == "X":
+            x_mask |= 1 << i
+        elif board[i] == "O":
+            o_mask |= 1 << i
+
+    return x_mask, o_mask
+
+
+def bits_to_board(board_bits):
+    """Unpack a stored board_bits value (x_mask | o_mask << 9) into a 9-cell board."""
+    return ["X" if board_bits >> i & 1 else "O" if board_bits >> (i + 9) & 1 else " " for i in range(9)]
+
+
+def check_winner_bits(x_mask, o_mask):
+    """Return "X", "O", "Draw" or None for a pair of disjoint bitboards."""
+    return _OUTCOMES[_TERNARY[x_mask] + 2 * _TERNARY[o_mask]]
+
+
+# The 8 rotations and reflections of the board as cell permutations:
+# cell i of the transformed board is cell SYMMETRIES[t][i] of the original
+SYMMETRIES = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8),  # identity
+    (6, 3, 0, 7, 4, 1, 8, 5, 2),  # rotate 90 clockwise
+    (8, 7, 6, 5, 4, 3, 2, 1, 0),  # rotate 180
+    (2, 5, 8, 1, 4, 7, 0, 3, 6),  # rotate 90 counterclockwise
+    (2, 1, 0, 5, 4, 3, 8, 7, 6),  # mirror left to right
+    (6, 7, 8, 3, 4, 5, 0, 1, 2),  # mirror top to bottom
+    (0, 3, 6, 1, 4, 7, 2, 5, 8),  # mirror on the main diagonal
+    (8, 5, 2, 7, 4, 1, 6, 3, 0),  # mirror on the anti diagonal
+)
 
-    for combo in winning_combos:
+# Every 9-bit mask under every symmetry, so transforming a bitboard is one lookup
+_SYMMETRY_MASKS = tuple(
+    tuple(sum(1 << i for i in range(9) if mask >> perm[i] & 1) for mask in range(FULL_MASK + 1))
+    for perm in SYMMETRIES
+)
+
+
+def transform_bits(x_mask, o_mask, transform):
+    """Apply SYMMETRIES[transform] to a pair of bitboards."""
+    masks = _SYMMETRY_MASKS[transform]
+    return masks[x_mask], masks[o_mask]
+
+
+def canonicalize_bits(x_mask, o_mask):
+    """
+    Return (x_mask, o_mask, transform) for the canonical form of a position: the one of
+    its 8 symmetries with the lowest base-3 index. Cell i of the canonical board is cell
+    SYMMETRIES[transform][i] of the original, so a canonical move maps back the same way.
+    """
+    best = None
+    for transform, masks in enumerate(_SYMMETRY_MASKS):
+        index = _TERNARY[masks[x_mask]] + 2 * _TERNARY[masks[o_mask]]
+        if best is None or index < best[0]:
+            best = (index, masks[x_mask], masks[o_mask], transform)
+
+    return best[1], best[2], best[3]
+
+
+def canonicalize(board):
+    """Return (canonical_board, transform) for a 9-cell board, see canonicalize_bits."""
+    x_mask, o_mask, transform = canonicalize_bits(*board_to_bits(board))
+    perm = SYMMETRIES[transform]
+
+    return [board[perm[i]] for i in range(9)], transform
+
+
+def _check_winner_scan(board):
+    for combo in WINNING_COMBOS:
         if board[combo[0]] == board[combo[1]] == board[combo[2]] and board[combo[0]] != " ":
             return board[combo[0]]
 
@@ -13,3 +126,59 @@ def check_winner(board):
         return "Draw"
 
     return None
+
+
+def check_winner(board):
+    # Boards made of " ", "X" and "O" are answered from the precomputed table,
+    # anything else keeps the original scan and its behaviour on bad input
+    try:
+        if len(board) == 9:
+            return _OUTCOMES_BY_BOARD[''.join(board)]
+    except (KeyError, TypeError):
+        pass
+
+    return _check_winner_scan(board)
+
+
+# Integer codes used by check_winner_batch, indexed the same way as RESULTS
+RESULTS = (None, "X", "O", "Draw")
+RESULT_CODES = {result: code for code, result in enumerate(RESULTS)}
+
+# Cell values for batch boards: 0 for " ", 1 for "X" and 2 for "O"
+CELL_CODES = {" ": 0, "X": 1, "O": 2}
+
+_OUTCOME_CODES = bytes(RESULT_CODES[outcome] for outcome in _OUTCOMES)
+
+
+def check_winner_batch(boards):
+    """
+    Score many boards at once. boards is either an integer array of shape (N, 9) holding
+    cell codes (see CELL_CODES) or a sequence of 9 character board strings.
+    Returns a uint8 array of N result codes (see RESULTS).
+    """
+    import numpy as np
+
+    if isinstance(boards, np.ndarray):
+        cells = boards
+    else:
+        if any(len(board) != 9 for board in boards):
+            raise ValueError('Every board must be 9 characters long')
+
+        raw = np.frombuffer(''.join(boards).encode('ascii'), dtype=np.uint8)
+        lookup = np.full(256, 255, dtype=np.uint8)
+        for mark, code in CELL_CODES.items():
+            lookup[ord(mark)] = code
+        cells = lookup[raw].reshape(-1, 9)
+
+    if cells.ndim != 2 or cells.shape[1] != 9:
+        raise ValueError(f'Boards must have shape (N, 9), got {cells.shape}')
+    if not np.issubdtype(cells.dtype, np.integer):
+        raise ValueError(f'Boards must hold integer cell codes, got {cells.dtype}')
+    # A negative code would index the outcomes from the end instead of failing
+    if cells.size and (cells.min() < 0 or cells.max() > 2):
+        raise ValueError('Boards may only contain " ", "X" and "O"')
+
+    # Same base-3 index as check_winner_bits, so a single gather scores every board
+    indexes = cells.astype(np.intp) @ (3 ** np.arange(9, dtype=np.intp))
+
+    return np.frombuffer(_OUTCOME_CODES, dtype=np.uint8)[indexes]
@@ -0,0 +1,5 @@
+from app import create_app
+from app.asgi import ASGIApp
+
+# Serve with an ASGI server, e.g. `uvicorn asgi:app`
+app = ASGIApp(create_app())
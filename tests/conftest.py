@@ -1,34 +1,130 @@
 import os
+import sqlite3
 import tempfile
 
 import pytest
 from app import create_app
-from app.db import get_db, init_db
+from app.db import close_pool, get_db, init_db
+from app.events import close_game_events
+from app.journal import close_move_journal
+from app.passwords import close_hash_pool
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--shard", default=None, metavar="INDEX/COUNT",
+        help="Only run every COUNT-th test starting at INDEX (0-based), to split the suite across processes. "
+             "See tests/shard.py"
+    )
+    parser.addoption(
+        "--benchmarks", action="store_true",
+        help="Run the type_Performance tests, skipped otherwise. They compare timings, so run them on a quiet machine"
+    )
+
+
+def pytest_collection_modifyitems(config, items):
+    if not config.getoption("--benchmarks"):
+        skip = pytest.mark.skip(reason="benchmark, run with --benchmarks")
+        for item in items:
+            if item.get_closest_marker("type_Performance"):
+                item.add_marker(skip)
+
+    shard = config.getoption("--shard")
+    if shard is None:
+        return
+
+    index, count = (int(part) for part in shard.split("/"))
+    if not 0 <= index < count:
+        raise pytest.UsageError(f"--shard index must be between 0 and {count - 1}, got {index}")
+
+    # Round robin over the collection order, so neighbouring tests of a slow file are split up
+    selected = [item for position, item in enumerate(items) if position % count == index]
+    deselected = [item for position, item in enumerate(items) if position % count != index]
+    config.hook.pytest_deselected(items=deselected)
+    items[:] = selected
+
+
+def pytest_terminal_summary(terminalreporter):
+    # What the benchmarks measured, recorded with record_property so it shows without -s
+    reports = [
+        report for outcome in ("passed", "failed") for report in terminalreporter.stats.get(outcome, [])
+        if report.when == "call" and report.user_properties
+    ]
+    if not reports:
+        return
+
+    terminalreporter.section("benchmarks")
+    for report in reports:
+        terminalreporter.write_line(report.nodeid)
+        for name, value in report.user_properties:
+            lines = str(value).splitlines()
+            if len(lines) == 1:
+                terminalreporter.write_line(f"    {name}: {lines[0]}")
+                continue
+
+            # A table, e.g. the load generator's report
+            terminalreporter.write_line(f"    {name}:")
+            for line in lines:
+                terminalreporter.write_line(f"        {line}")
+
+
+@pytest.fixture(scope="session")
+def template_db(tmp_path_factory):
+    """
+    Builds a database with the tables from schema.sql and the journal mode from init_db once per session,
+    in a directory of its own so processes running shards of the suite don't share it.
+    """
+    path = str(tmp_path_factory.mktemp("template") / "template.sqlite")
+
+    template_app = create_app({
+        'TESTING': True,
+        'DATABASE': path,
+        'DATABASE_POOL_SIZE': 0,
+    })
+    with template_app.app_context():
+        init_db()
+
+    return path
 
 
 @pytest.fixture
-def app():
+def app(template_db):
     """
     Creates and opens a temporary file, returning the file descriptor and the path to it.
-    The DATABASE path is overridden so it points to this temporary path instead of the instance folder.
-    After setting the path, the database tables are created and the test data is inserted.
-    After the test is over, the temporary file is closed and removed.
+    The template database is copied into it with SQLite's backup API, and the DATABASE path is overridden so it
+    points to this temporary path instead of the instance folder.
+    Passwords are hashed with a low cost, tests of the hash method set their own.
+    After the test is over, the connection and hashing pools are drained, the game events backend is stopped
+    and the temporary file is closed and removed.
     """
     db_fd, db_path = tempfile.mkstemp()
 
+    source = sqlite3.connect(template_db)
+    target = sqlite3.connect(db_path)
+    source.backup(target)
+    target.close()
+    source.close()
+
     app = create_app({
         'TESTING': True,
         'DATABASE': db_path,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
     })
 
-    with app.app_context():
-        init_db()
-
     yield app
 
+    close_move_journal(app)
+    close_pool(app)
+    close_hash_pool(app)
+    close_game_events(app)
     os.close(db_fd)
     os.unlink(db_path)
 
+    # WAL side files are left behind if a test kept a connection open
+    for suffix in ('-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
 
 @pytest.fixture
 def client(app):
@@ -43,4 +139,4 @@ def runner(app):
 @pytest.fixture
 def context():
     context = {}
-    return context
\ No newline at end of file
+    return context
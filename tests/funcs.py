@@ -1,3 +1,4 @@
+import asyncio
 import itertools
 import json
 import random
@@ -183,6 +184,18 @@ def register(client, username="", password="", manual_set=False):
     return response, username, password
 
 
+# -------------------------------------------------------------------------------------------------
+# Register many users at once. users is a list of {"username": ..., "password": ...}
+# Does not check for validity
+# -------------------------------------------------------------------------------------------------
+def register_bulk(client, users: list):
+    return client.post(
+        '/auth/register/bulk',
+        data=json.dumps(users),
+        content_type='application/json'
+    )
+
+
 # -------------------------------------------------------------------------------------------------
 # Setup a new user with a random username and password
 # Then login and then return token, wins, and response
@@ -219,36 +232,196 @@ def new_user_setup(client, context):
 # -------------------------------------------------------------------------------------------------
 # Create a new game with a given token
 # -------------------------------------------------------------------------------------------------
-def create_game(client, token: str):
+def create_game(client, token: str, opponent: str = None):
+    # Only send a body when playing against something other than a user
+    body = {}
+    if opponent is not None:
+        body = {
+            "data": json.dumps({"opponent": opponent}),
+            "content_type": "application/json"
+        }
+
     # Create a new game
     response = client.post(
         '/game',
         headers={
             'Authorization': token
-        }
+        },
+        **body
     )
     return response
 
 
+# -------------------------------------------------------------------------------------------------
+# Get the state of a game, or a 304 if it still matches etag
+# -------------------------------------------------------------------------------------------------
+def get_game(client, game_id: int, token: str, etag: str = None):
+    headers = {
+        'Authorization': token
+    }
+    # Only ask for a conditional response when given the ETag of a previous one
+    if etag is not None:
+        headers['If-None-Match'] = etag
+
+    return client.get(
+        f'/game/{game_id}',
+        headers=headers
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Replay a game ply by ply. Returns the response, one JSON object per line of its body
+# -------------------------------------------------------------------------------------------------
+def replay_game(client, game_id: int, token: str):
+    return client.get(
+        f'/game/{game_id}/replay',
+        headers={
+            'Authorization': token
+        }
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Export a table through the admin endpoint. query holds format, since_id, since and chunk_size
+# -------------------------------------------------------------------------------------------------
+def export_table(client, table: str, token: str, **query):
+    return client.get(
+        f'/admin/export/{table}',
+        headers={
+            'Authorization': token
+        },
+        query_string=query
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Open the event stream of a game. The response isn't buffered, read events with next_event
+# -------------------------------------------------------------------------------------------------
+def game_events(client, game_id: int, token: str, last_event_id: int = None):
+    headers = {
+        'Authorization': token
+    }
+    if last_event_id is not None:
+        headers['Last-Event-ID'] = str(last_event_id)
+
+    return client.get(
+        f'/game/{game_id}/events',
+        headers=headers,
+        buffered=False
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Read the next message of an event stream: (event id, data) for an event, None for a keepalive
+# -------------------------------------------------------------------------------------------------
+def next_event(stream):
+    message = next(stream).decode('utf8')
+    if message.startswith(':'):
+        return None
+
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return int(fields['id']), json.loads(fields['data'])
+
+
+# -------------------------------------------------------------------------------------------------
+# Wait for a move on a game past the turn the client has
+# -------------------------------------------------------------------------------------------------
+def poll_game(client, game_id: int, token: str, **params):
+    return client.get(
+        f'/game/{game_id}/poll',
+        headers={
+            'Authorization': token
+        },
+        query_string=params
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# List a user's games, one page at a time
+# -------------------------------------------------------------------------------------------------
+def list_games(client, token: str, **params):
+    return client.get(
+        '/game',
+        headers={
+            'Authorization': token
+        },
+        query_string=params
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Get the users with the most wins
+# -------------------------------------------------------------------------------------------------
+def get_leaders(client, token: str, **params):
+    return client.get(
+        '/leaderboard',
+        headers={
+            'Authorization': token
+        },
+        query_string=params
+    )
+
+
+# -------------------------------------------------------------------------------------------------
+# Get a user's rank on the leaderboard
+# -------------------------------------------------------------------------------------------------
+def get_rank(client, user_id: int, token: str):
+    return client.get(
+        f'/leaderboard/{user_id}',
+        headers={
+            'Authorization': token
+        }
+    )
+
+
 # -------------------------------------------------------------------------------------------------
 # Make a move to a specific spot
 # -------------------------------------------------------------------------------------------------
-def make_move(client, move: int, game_id: int, token: str):
+def make_move(client, move: int, game_id: int, token: str, current_turn: int = None):
+    body = {
+        "game_id": game_id,
+        "move": move
+    }
+
+    # Only sent when the caller wants the compare-and-swap on the turn
+    if current_turn is not None:
+        body["current_turn"] = current_turn
+
     # Make a move
     response = client.post(
         '/game/move',
         headers={
             'Authorization': token
         },
-        data=json.dumps({
-            "game_id": game_id,
-            "move": move
-        }),
+        data=json.dumps(body),
         content_type='application/json'
     )
     return response
 
 
+# -------------------------------------------------------------------------------------------------
+# Make several moves in order with one request
+# -------------------------------------------------------------------------------------------------
+def make_moves(client, moves: list, game_id: int, token: str, current_turn: int = None):
+    body = {
+        "game_id": game_id,
+        "moves": moves
+    }
+
+    # Only sent when the caller wants the compare-and-swap on the turn
+    if current_turn is not None:
+        body["current_turn"] = current_turn
+
+    return client.post(
+        '/game/moves',
+        headers={
+            'Authorization': token
+        },
+        data=json.dumps(body),
+        content_type='application/json'
+    )
+
+
 # -------------------------------------------------------------------------------------------------
 # Make a move and return if there was a winner
 # -------------------------------------------------------------------------------------------------
@@ -285,3 +458,100 @@ def get_all_board_combinations():
 
     return all_combinations
 
+
+# -------------------------------------------------------------------------------------------------
+# A games row as the game cache stores it and the game events publish it
+# -------------------------------------------------------------------------------------------------
+def game_state(game_id: int, current_turn: int, board: str = "         ", winner: str = None) -> dict:
+    return {
+        "id": game_id,
+        "user_id": 1,
+        "board": board,
+        "board_bits": None,
+        "current_turn": current_turn,
+        "winner": winner,
+        "opponent": None
+    }
+
+
+# -------------------------------------------------------------------------------------------------
+# One request to an ASGI app. Returns (status, headers, body) once the response is complete,
+# or the asyncio.Queue of response messages when stream is set.
+# The request stays connected until disconnect is set
+# -------------------------------------------------------------------------------------------------
+async def asgi_request(asgi_app, method: str, path: str, token: str = None, body: dict = None,
+                       query: str = "", headers: dict = None, stream: bool = False, disconnect=None):
+    request_headers = [(b"host", b"localhost")]
+    if token is not None:
+        request_headers.append((b"authorization", token.encode()))
+    if body is not None:
+        request_headers.append((b"content-type", b"application/json"))
+        request_headers.append((b"content-length", str(len(json.dumps(body).encode())).encode()))
+    for name, value in (headers or {}).items():
+        request_headers.append((name.lower().encode(), value.encode()))
+
+    scope = {
+        "type": "http", "http_version": "1.1", "method": method, "scheme": "http",
+        "path": path, "query_string": query.encode(), "root_path": "",
+        "headers": request_headers, "server": ("localhost", 80), "client": ("127.0.0.1", 1234)
+    }
+    pending = [{"type": "http.request", "body": json.dumps(body).encode() if body is not None else b""}]
+    disconnect = disconnect or asyncio.Event()
+    messages = asyncio.Queue()
+
+    async def receive():
+        if pending:
+            return pending.pop()
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        await messages.put(message)
+
+    task = asyncio.ensure_future(asgi_app(scope, receive, send))
+    if stream:
+        return messages
+
+    await task
+    start = await messages.get()
+    response_body = b""
+    while not messages.empty():
+        response_body += (await messages.get())["body"]
+
+    return start["status"], dict(start["headers"]), response_body
+
+
+# -------------------------------------------------------------------------------------------------
+# Run a coroutine driving an ASGI app, then close the app. Its aiosqlite threads would keep
+# the test process from exiting
+# -------------------------------------------------------------------------------------------------
+async def asgi_closing(asgi_app, coroutine):
+    try:
+        return await coroutine
+    finally:
+        await asgi_app.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# Register and login through an ASGI app, returning the token
+# -------------------------------------------------------------------------------------------------
+async def asgi_user(asgi_app) -> str:
+    user = {"username": random_str(), "password": random_str()}
+    status, _, _ = await asgi_request(asgi_app, "POST", "/auth/register", body=user)
+    assert status == 201
+    status, _, body = await asgi_request(asgi_app, "POST", "/auth/login", body=user)
+    assert status == 200
+    return json.loads(body)["token"]
+
+
+# -------------------------------------------------------------------------------------------------
+# The next event on a stream opened with asgi_request, as (event id, data)
+# -------------------------------------------------------------------------------------------------
+async def asgi_event(messages: asyncio.Queue):
+    message = await asyncio.wait_for(messages.get(), 5)
+    if message["type"] == "http.response.start":
+        assert message["status"] == 200
+        message = await asyncio.wait_for(messages.get(), 5)
+
+    fields = dict(line.split(": ", 1) for line in message["body"].decode().strip().split("\n"))
+    return int(fields["id"]), json.loads(fields["data"])
@@ -0,0 +1,340 @@
+"""
+Load generator for the API. Starts the app in a real server process on a local port, or targets one
+already running, and drives register -> login -> create game -> full games from many clients at once
+through the helpers in tests/funcs.py. Reports throughput and latency percentiles per endpoint, and
+saves them as a JSON baseline that a later run can be compared against.
+
+    python -m tests.loadgen run --concurrency 16 --games 20 --save tests/baselines/local.json
+    python -m tests.loadgen run --concurrency 16 --games 20 --compare tests/baselines/local.json
+
+`run` exits with 1 if a request failed or the comparison found a regression.
+"""
+import argparse
+import http.client
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+from tests.funcs import create_game, login, make_move, register
+
+# Fills the whole board and ends in a draw, so every move of a game is valid
+DRAW_MOVES = [4, 2, 8, 0, 1, 7, 5, 3, 6]
+
+# Ids in paths, so every game is reported under the same endpoint
+_PATH_ID = re.compile(r'/\d+')
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -------------------------------------------------------------------------------------------------
+# A response from a running server, with the attributes of a Flask test response that tests.funcs uses
+# -------------------------------------------------------------------------------------------------
+class Response:
+    def __init__(self, status_code: int, headers: dict, data: bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.data = data
+
+    @property
+    def json(self):
+        return json.loads(self.data)
+
+
+# -------------------------------------------------------------------------------------------------
+# A keep-alive connection to a running server with the get and post of Flask's test client,
+# so the helpers in tests.funcs work against it. Every request's (start, end) is kept under its endpoint
+# -------------------------------------------------------------------------------------------------
+class HTTPClient:
+    def __init__(self, host: str, port: int):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.latencies = {}
+
+    def get(self, path: str, headers: dict = None, query_string: dict = None):
+        if query_string:
+            path = f"{path}?{urlencode(query_string)}"
+        return self._request('GET', path, None, headers or {})
+
+    def post(self, path: str, headers: dict = None, data: str = None, content_type: str = None):
+        headers = dict(headers or {})
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        return self._request('POST', path, data, headers)
+
+    def close(self):
+        self.connection.close()
+
+    def _request(self, method: str, path: str, body, headers: dict):
+        endpoint = f"{method} {_PATH_ID.sub('/<id>', path.split('?')[0])}"
+
+        for attempt in range(2):
+            try:
+                started = time.perf_counter()
+                self.connection.request(method, path, body, headers)
+                response = self.connection.getresponse()
+                data = response.read()
+                break
+            except (http.client.RemoteDisconnected, ConnectionError):
+                # The server closed the kept-alive connection, open a new one once
+                self.connection.close()
+                if attempt:
+                    raise
+
+        self.latencies.setdefault(endpoint, []).append((started, time.perf_counter()))
+        return Response(response.status, dict(response.getheaders()), data)
+
+
+# -------------------------------------------------------------------------------------------------
+# Start `serve` in a new process on a free port. Returns (process, port)
+# -------------------------------------------------------------------------------------------------
+def start_server(database: str, mode: str = 'wsgi', config: dict = None):
+    command = [sys.executable, '-m', 'tests.loadgen', 'serve', '--database', database, '--mode', mode]
+    for key, value in (config or {}).items():
+        command += ['--config', f'{key}={json.dumps(value)}']
+
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f'Server exited with {process.returncode} before listening')
+
+    return process, int(line)
+
+
+def stop_server(process):
+    process.terminate()
+    process.wait(timeout=10)
+    process.stdout.close()
+
+
+# -------------------------------------------------------------------------------------------------
+# Serve the app on a free local port with a fresh database, printing the port once listening
+# -------------------------------------------------------------------------------------------------
+def serve(database: str, mode: str, config: dict):
+    from app import create_app
+    from app.db import init_db
+
+    app = create_app({'DATABASE': database, **config})
+    with app.app_context():
+        init_db()
+
+    if mode == 'asgi':
+        import socket
+        import uvicorn
+        from app.asgi import ASGIApp
+
+        # With the protocol given, asyncio turns Nagle off on the connections, else every
+        # response waits for the client's delayed ACK
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+        sock.bind(('127.0.0.1', 0))
+        # Listening before the port is printed, clients may connect before uvicorn has started
+        sock.listen()
+        print(sock.getsockname()[1], flush=True)
+        uvicorn.Server(uvicorn.Config(ASGIApp(app), log_level='warning')).run(sockets=[sock])
+    else:
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietRequestHandler(WSGIRequestHandler):
+            def log_request(self, *args):
+                pass
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+        print(server.server_port, flush=True)
+        server.serve_forever()
+
+
+# -------------------------------------------------------------------------------------------------
+# Latency percentile of a sorted list of seconds, in milliseconds
+# -------------------------------------------------------------------------------------------------
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)] * 1000
+
+
+# -------------------------------------------------------------------------------------------------
+# Play games from concurrency clients at once, each registering, logging in and then playing
+# games full games. Returns the report
+# -------------------------------------------------------------------------------------------------
+def run_load(host: str, port: int, concurrency: int, games: int) -> dict:
+    clients = [HTTPClient(host, port) for _ in range(concurrency)]
+    errors = []
+    ready = threading.Barrier(concurrency + 1)
+    # Password hashing holds the CPU, so every client logs in before any game starts
+    # rather than slowing down the games of clients that got in first
+    logged_in = threading.Barrier(concurrency)
+
+    def player(client):
+        ready.wait()
+        try:
+            token = None
+            try:
+                response, username, password = register(client)
+                token = login(client, username, password).json['token']
+            finally:
+                logged_in.wait()
+
+            for _ in range(games):
+                game_id = create_game(client, token).json['game_id']
+                for move in DRAW_MOVES:
+                    response = make_move(client, move, game_id, token)
+                    if response.status_code != 200:
+                        errors.append(f"{response.status_code} {response.data[:200]!r}")
+        except Exception as e:
+            errors.append(repr(e))
+        finally:
+            client.close()
+
+    threads = [threading.Thread(target=player, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+
+    latencies = {}
+    for client in clients:
+        for endpoint, times in client.latencies.items():
+            latencies.setdefault(endpoint, []).extend(times)
+
+    endpoints = {}
+    for endpoint, spans in sorted(latencies.items()):
+        times = sorted(end - start for start, end in spans)
+        # Over the time the endpoint was in use, the phases of the run don't overlap
+        window = max(end for _, end in spans) - min(start for start, _ in spans)
+        endpoints[endpoint] = {
+            'requests': len(times),
+            'throughput': len(times) / window if window else 0.0,
+            'p50': _percentile(times, 0.5),
+            'p90': _percentile(times, 0.9),
+            'p99': _percentile(times, 0.99),
+            'max': times[-1] * 1000,
+        }
+
+    requests = sum(endpoint['requests'] for endpoint in endpoints.values())
+    return {
+        'concurrency': concurrency,
+        'games': games,
+        'duration': duration,
+        'requests': requests,
+        'throughput': requests / duration,
+        'errors': errors,
+        'endpoints': endpoints,
+    }
+
+
+# -------------------------------------------------------------------------------------------------
+# Compare a report with a baseline. Returns a message for every endpoint whose throughput dropped by
+# more than tolerance (0.25 is 25%) or whose p99 latency grew by more than latency_tolerance
+# -------------------------------------------------------------------------------------------------
+def compare(report: dict, baseline: dict, tolerance: float = 0.25, latency_tolerance: float = 0.5) -> list:
+    regressions = []
+
+    for endpoint, expected in baseline['endpoints'].items():
+        got = report['endpoints'].get(endpoint)
+        if got is None:
+            regressions.append(f"{endpoint}: not measured")
+            continue
+
+        if got['throughput'] < expected['throughput'] * (1 - tolerance):
+            regressions.append(f"{endpoint}: {got['throughput']:.0f} req/s, baseline {expected['throughput']:.0f} req/s")
+        if got['p99'] > expected['p99'] * (1 + latency_tolerance):
+            regressions.append(f"{endpoint}: p99 {got['p99']:.1f}ms, baseline {expected['p99']:.1f}ms")
+
+    return regressions
+
+
+def format_report(report: dict) -> str:
+    lines = [
+        f"{report['concurrency']} clients x {report['games']} games: {report['requests']} requests in "
+        f"{report['duration']:.2f}s, {report['throughput']:.0f} req/s, {len(report['errors'])} errors",
+        f"{'endpoint':<24}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'max ms':>10}",
+    ]
+    for endpoint, stats in report['endpoints'].items():
+        lines.append(
+            f"{endpoint:<24}{stats['requests']:>10}{stats['throughput']:>10.0f}"
+            f"{stats['p50']:>10.1f}{stats['p90']:>10.1f}{stats['p99']:>10.1f}{stats['max']:>10.1f}"
+        )
+
+    return '\n'.join(lines)
+
+
+def _config_option(option: str):
+    key, _, value = option.partition('=')
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tests.loadgen', description=__doc__.split('\n\n')[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help='Generate load and report per endpoint.')
+    run.add_argument('--concurrency', type=int, default=8, help='Clients playing at once.')
+    run.add_argument('--games', type=int, default=10, help='Games played by each client.')
+    run.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi', help='How the started server runs the app.')
+    run.add_argument('--config', action='append', default=[], type=_config_option, metavar='KEY=VALUE',
+                     help='App config for the started server, values as JSON. Repeatable.')
+    run.add_argument('--url', help='host:port of a running server to target instead of starting one.')
+    run.add_argument('--save', metavar='PATH', help='Save the report as a baseline.')
+    run.add_argument('--compare', metavar='PATH', help='Fail on a regression against a saved baseline.')
+    run.add_argument('--tolerance', type=float, default=0.25, help='Allowed drop in throughput, 0.25 is 25%%.')
+    run.add_argument('--latency-tolerance', type=float, default=0.5, help='Allowed growth in p99 latency.')
+
+    serve_command = commands.add_parser('serve', help='Serve the app on a free port and print it.')
+    serve_command.add_argument('--database', required=True)
+    serve_command.add_argument('--mode', choices=('wsgi', 'asgi'), default='wsgi')
+    serve_command.add_argument('--config', action='append', default=[], type=_config_option, metavar='KEY=VALUE')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        serve(args.database, args.mode, dict(args.config))
+        return 0
+
+    if args.url:
+        host, _, port = args.url.rpartition(':')
+        report = run_load(host, int(port), args.concurrency, args.games)
+    else:
+        db_fd, db_path = tempfile.mkstemp()
+        process, port = start_server(db_path, args.mode, dict(args.config))
+        try:
+            report = run_load('127.0.0.1', port, args.concurrency, args.games)
+        finally:
+            stop_server(process)
+            os.close(db_fd)
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(db_path + suffix):
+                    os.unlink(db_path + suffix)
+
+    print(format_report(report))
+    for error in report['errors'][:10]:
+        print(f"error: {error}")
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.latency_tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}")
+        if not regressions:
+            print(f"No regressions against {args.compare}")
+
+    return 1 if report['errors'] or regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
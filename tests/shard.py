@@ -0,0 +1,50 @@
+"""
+Run the test suite split across processes, each running one --shard of it with its own temporary
+databases. Arguments after the process count are passed to every pytest run.
+
+    python -m tests.shard 4 -m "not bug"
+
+Exits with the first failing shard's code, or 0 if every shard passed.
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# pytest's exit code when a shard ends up with no tests after deselection
+NO_TESTS_COLLECTED = 5
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or not argv[0].isdigit() or int(argv[0]) < 1:
+        print(__doc__.strip(), file=sys.stderr)
+        return 2
+
+    count, pytest_args = int(argv[0]), argv[1:]
+    started = time.monotonic()
+
+    # The cache plugin writes .pytest_cache, which every shard would share
+    processes = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider', f'--shard={index}/{count}', *pytest_args],
+            cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+        )
+        for index in range(count)
+    ]
+
+    codes = []
+    for index, process in enumerate(processes):
+        output, _ = process.communicate()
+        print(f"===== shard {index}/{count} =====")
+        print(output.rstrip())
+        codes.append(0 if process.returncode == NO_TESTS_COLLECTED else process.returncode)
+
+    print(f"===== {count} shards in {time.monotonic() - started:.1f}s =====")
+    return next((code for code in codes if code), 0)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
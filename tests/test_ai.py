@@ -0,0 +1,114 @@
+import mmap
+
+import pytest
+from app import ai
+from app.ai import DEFAULT_TABLE_PATH, best_move, build_table, load_table, position_value
+from app.util import check_winner
+from tests.funcs import *
+
+"""
+Unit tests for the computer opponent in app/ai.py
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: Spot check the best move on boards with one clear answer
+#
+# Verifies:
+# ✅ Takes a winning move
+# ✅ Blocks the opponent's winning move
+# ✅ No move on finished boards
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Smoke
+@pytest.mark.parametrize("board, expected", [
+    # X to move and wins on the top row
+    ("XX OO    ", 2),
+    # O to move and wins on the middle row
+    ("XX OO X  ", 5),
+    # O to move and has to block the top row
+    ("XX  O    ", 2),
+    # X won
+    ("XXXOO    ", None),
+    # Draw
+    ("OXOOXXXOX", None),
+])
+def test_ai_best_move_sanity(board, expected):
+    assert best_move(list(board)) == expected, f"Expected best move {expected} for board {board!r}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play the computer against every possible sequence of moves from the other side
+#
+# Verifies:
+# ✅ The computer never loses as O
+# ✅ The computer never loses as X
+# ✅ The empty board is a draw with best play
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_ai_never_loses():
+    def play(board, ai_mark):
+        winner = check_winner(board)
+        if winner:
+            assert winner != ("O" if ai_mark == "X" else "X"), f"Computer lost as {ai_mark} on board {board}"
+            return
+
+        to_move = "X" if board.count("X") == board.count("O") else "O"
+        if to_move == ai_mark:
+            move = best_move(board)
+            assert board[move] == " ", f"Computer picked occupied cell {move} on board {board}"
+            play(board[:move] + [ai_mark] + board[move + 1:], ai_mark)
+        else:
+            for move in [i for i, cell in enumerate(board) if cell == " "]:
+                play(board[:move] + [to_move] + board[move + 1:], ai_mark)
+
+    # ✅ Both sides
+    play([" "] * 9, "O")
+    play([" "] * 9, "X")
+
+    # ✅ Draw with best play
+    assert position_value([" "] * 9) == 0, "Empty board should be a draw"
+    assert position_value(list("XXXXXXXXX")) is None, "Unreachable board should have no value"
+
+
+# -----------------------------------------------------------------------------------
+# Description: The shipped table file is up to date and mapped at startup
+#
+# Verifies:
+# ✅ The shipped file matches a fresh solve
+# ✅ The app maps the file when it starts
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_ai_table_shipped(app):
+    with open(DEFAULT_TABLE_PATH, "rb") as f:
+        assert f.read() == build_table(), "Shipped AI table is out of date, run `flask build-ai-table`"
+
+    assert isinstance(ai._table, mmap.mmap), "AI table was not memory-mapped at startup"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Build a table file with the CLI and load it
+#
+# Verifies:
+# ✅ build-ai-table writes a table that can be loaded
+# ✅ A file that isn't a table is rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_ErrorHandling
+def test_ai_table_build_and_load(runner, tmp_path):
+    # ✅ Build and load
+    output = tmp_path / "table.bin"
+    result = runner.invoke(args=["build-ai-table", "--output", str(output)])
+    assert result.exit_code == 0, result.output
+    load_table(str(output))
+    assert best_move(list("XX OO    ")) == 2, "Loaded table gives the wrong move"
+
+    # ✅ Not a table
+    bad = tmp_path / "bad.bin"
+    bad.write_bytes(b"not a table")
+    with pytest.raises(ValueError):
+        load_table(str(bad))
+
+    load_table()
@@ -0,0 +1,296 @@
+import asyncio
+import json
+
+import pytest
+from app.asgi import ASGIApp
+from app.db import close_pool
+from app.events import close_game_events, get_game_events
+from app.journal import close_move_journal
+from app.passwords import close_hash_pool
+from flask import jsonify, request
+from tests.funcs import *
+from tests.test_journal import write_behind_app
+
+"""
+Tests for the ASGI serving mode in app/asgi.py, driving the ASGI app directly without a server
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play a game through the ASGI app
+#
+# Verifies:
+# ✅ Bodies, headers and query strings reach the Flask app
+# ✅ Status codes, headers and bodies come back
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Smoke
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_asgi_requests(app):
+    asgi_app = ASGIApp(app)
+
+    async def play():
+        status, _, body = await asgi_request(asgi_app, "GET", "/ping")
+        assert status == 200 and json.loads(body) == {"message": "pong!"}
+
+        token = await asgi_user(asgi_app)
+        status, _, body = await asgi_request(asgi_app, "POST", "/game", token=token)
+        assert status == 200
+        game_id = json.loads(body)["game_id"]
+
+        for move in [0, 3, 1, 4, 2]:
+            status, _, body = await asgi_request(asgi_app, "POST", "/game/move", token=token,
+                                                 body={"game_id": game_id, "move": move})
+            assert status == 200, body
+        assert json.loads(body)["winner"] == "X"
+
+        # ✅ Query string and headers
+        status, _, body = await asgi_request(asgi_app, "GET", "/game", token=token, query="status=won&limit=1")
+        assert status == 200 and [game["game_id"] for game in json.loads(body)["games"]] == [game_id]
+
+        status, headers, _ = await asgi_request(asgi_app, "GET", f"/game/{game_id}", token=token)
+        etag = headers[b"etag"].decode()
+        status, _, body = await asgi_request(asgi_app, "GET", f"/game/{game_id}", token=token,
+                                             headers={"If-None-Match": etag})
+        assert status == 304 and body == b""
+
+        # ✅ Errors
+        status, _, _ = await asgi_request(asgi_app, "GET", "/game/0", token=token)
+        assert status == 404
+
+    asyncio.run(asgi_closing(asgi_app, play()))
+
+
+# -----------------------------------------------------------------------------------
+# Description: Many event streams on fewer threads than streams
+#
+# Verifies:
+# ✅ Streams are served on the event loop, more of them than ASGI_THREADS
+# ✅ Every stream gets the move
+# ✅ A client going away unsubscribes its stream
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_asgi_event_streams(app):
+    app.config['ASGI_THREADS'] = 2
+    asgi_app = ASGIApp(app)
+
+    async def follow():
+        token = await asgi_user(asgi_app)
+        status, _, body = await asgi_request(asgi_app, "POST", "/game", token=token)
+        game_id = json.loads(body)["game_id"]
+
+        disconnect = asyncio.Event()
+        streams = [
+            await asgi_request(asgi_app, "GET", f"/game/{game_id}/events", token=token, stream=True, disconnect=disconnect)
+            for _ in range(50)
+        ]
+        for stream in streams:
+            assert (await asgi_event(stream))[0] == 1
+
+        # ✅ All open, and a move is still served
+        status, _, _ = await asgi_request(asgi_app, "POST", "/game/move", token=token, body={"game_id": game_id, "move": 4})
+        assert status == 200
+        for stream in streams:
+            event_id, game = await asgi_event(stream)
+            assert event_id == 2 and game["board"][4] == "X"
+
+        # ✅ Unsubscribed
+        disconnect.set()
+        for _ in range(100):
+            if get_game_events(app).stats()["subscribers"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert get_game_events(app).stats()["subscribers"] == 0, "Streams were not unsubscribed"
+
+    asyncio.run(asgi_closing(asgi_app, follow()))
+
+
+# -----------------------------------------------------------------------------------
+# Description: Serve the auth, game and ping endpoints with coroutine views
+#
+# Verifies:
+# ✅ The endpoints are served on the event loop, not by the Flask app on the threads
+# ✅ More long polls wait at once than there are threads and database connections
+# ✅ Every poll gets the move
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_asgi_coroutine_views(app):
+    app.config['ASGI_THREADS'] = 1
+    app.config['DATABASE_POOL_SIZE'] = 2
+    asgi_app = ASGIApp(app)
+
+    # ✅ On the event loop
+    assert {"ping.ping", "auth.register", "auth.login", "game.get_game", "game.poll_game", "game.add_move"} <= set(asgi_app.views)
+    assert "leaderboard.get_leaderboard" not in asgi_app.views
+
+    async def poll():
+        token = await asgi_user(asgi_app)
+        status, _, body = await asgi_request(asgi_app, "POST", "/game", token=token)
+        game_id = json.loads(body)["game_id"]
+
+        # ✅ Waiting together
+        polls = [
+            asyncio.ensure_future(asgi_request(asgi_app, "GET", f"/game/{game_id}/poll", token=token, query="after=1&timeout=5"))
+            for _ in range(20)
+        ]
+        await asyncio.sleep(0.1)
+        assert get_game_events(app).stats()["subscribers"] == 20
+        status, _, _ = await asgi_request(asgi_app, "POST", "/game/move", token=token, body={"game_id": game_id, "move": 4})
+        assert status == 200
+
+        # ✅ Every poll
+        for status, _, body in await asyncio.wait_for(asyncio.gather(*polls), 5):
+            assert status == 200 and json.loads(body)["current_turn"] == 2
+
+    asyncio.run(asgi_closing(asgi_app, poll()))
+
+
+# -----------------------------------------------------------------------------------
+# Description: Coroutine views answer like the Flask views they stand in for
+#
+# Verifies:
+# ✅ Same status, content type and body for bad bodies, tokens, ids and arguments
+# ✅ Same JSON 500 for a password that isn't a string
+# ✅ Moves are left to the Flask views with MOVE_WRITE_BEHIND, and still played
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.game_Move
+def test_asgi_matches_flask(app, client):
+    asgi_app = ASGIApp(app)
+    user_data = new_user_setup(client, {})
+    token = user_data['token']
+    game_id = check_valid_json(create_game(client, token))['game_id']
+
+    requests = [
+        ("POST", "/auth/register", None, {}, None),
+        ("POST", "/auth/register", None, {"username": "only"}, None),
+        ("POST", "/auth/register", None, {"username": random_str(), "password": 5}, None),
+        ("POST", "/auth/register", None, {"username": user_data['username'], "password": "x"}, None),
+        ("POST", "/auth/login", None, {"username": user_data['username'], "password": "wrong"}, None),
+        ("POST", "/auth/register/bulk", None, {"username": "not a list"}, None),
+        ("GET", "/game", "not a token", None, ""),
+        ("GET", "/game", None, None, ""),
+        ("GET", "/game", token, None, "status=lost"),
+        ("GET", "/game", token, None, "limit=0"),
+        ("GET", "/game/0", token, None, ""),
+        ("GET", f"/game/{game_id}", token, None, ""),
+        ("GET", f"/game/{game_id}/poll", token, None, ""),
+        ("POST", "/game", token, {"opponent": "nobody"}, None),
+        ("POST", "/game/move", token, {"game_id": game_id}, None),
+        ("POST", "/game/move", token, {"game_id": 0, "move": 4}, None),
+        ("POST", "/game/moves", token, {"game_id": game_id, "moves": [9]}, None),
+        ("POST", "/game/move", token, {"game_id": game_id, "move": 4, "current_turn": "1"}, None),
+        ("POST", "/game/moves", token, {"game_id": game_id, "moves": [4], "current_turn": True}, None),
+        ("HEAD", "/ping", None, None, ""),
+        ("GET", "/nowhere", None, None, ""),
+        ("DELETE", "/ping", None, None, ""),
+    ]
+
+    async def compare():
+        for method, path, request_token, body, query in requests:
+            headers = {"Authorization": request_token} if request_token else None
+            response = client.open(path, method=method, json=body, headers=headers, query_string=query)
+            status, response_headers, response_body = await asgi_request(
+                asgi_app, method, path, token=request_token, body=body, query=query or "")
+
+            request = f"{method} {path} {body or query}"
+            assert status == response.status_code, f"{request}: {status}, Flask answers {response.status_code}"
+            assert response_headers.get(b"content-type", b"").decode() == (response.content_type or ""), request
+            assert response_body == response.data, f"{request}: {response_body}, Flask answers {response.data}"
+
+        # Not JSON
+        status, headers, body = await asgi_request(asgi_app, "POST", "/game/move", token=token,
+                                                   headers={"Content-Type": "text/plain"})
+        response = client.post("/game/move", headers={"Authorization": token}, data="x")
+        assert (status, headers[b"content-type"].decode(), body) == (response.status_code, response.content_type, response.data)
+
+    asyncio.run(asgi_closing(asgi_app, compare()))
+
+    # ✅ Write-behind
+    wb_app = write_behind_app(app.config['DATABASE'])
+    wb_asgi_app = ASGIApp(wb_app)
+    assert "game.add_move" not in wb_asgi_app.views and "game.get_game" in wb_asgi_app.views
+
+    async def play():
+        status, _, body = await asgi_request(wb_asgi_app, "POST", "/game/move", token=token, body={"game_id": game_id, "move": 4})
+        assert status == 200 and json.loads(body)["current_turn"] == 2
+        status, _, body = await asgi_request(wb_asgi_app, "GET", f"/game/{game_id}", token=token)
+        assert status == 200 and json.loads(body)["board"][4] == "X"
+
+    asyncio.run(asgi_closing(wb_asgi_app, play()))
+
+
+# -----------------------------------------------------------------------------------
+# Description: The app's hooks and error handlers apply to the coroutine views
+#
+# Verifies:
+# ✅ An error handler of the app answers an error raised in a before_request hook
+# ✅ An error handler answers a body that isn't JSON
+# ✅ Unknown routes and methods get the app's handlers, not the server's pages
+# ✅ after_request hooks add their headers
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.game_Move
+def test_asgi_error_handlers(app):
+    class Closed(Exception):
+        pass
+
+    # Handlers and hooks are registered before the app's first request
+    handled_app = write_behind_app(app.config['DATABASE'], MOVE_WRITE_BEHIND=False)
+
+    @handled_app.before_request
+    def closed():
+        if request.headers.get("X-Closed"):
+            raise Closed()
+
+    @handled_app.after_request
+    def served_by(response):
+        response.headers["X-Served-By"] = "app"
+        return response
+
+    @handled_app.errorhandler(Closed)
+    def closed_error(e):
+        return jsonify({"message": "Closed"}), 503
+
+    @handled_app.errorhandler(400)
+    @handled_app.errorhandler(404)
+    @handled_app.errorhandler(405)
+    @handled_app.errorhandler(415)
+    def http_error(e):
+        return jsonify({"message": e.name}), e.code
+
+    client = handled_app.test_client()
+    asgi_app = ASGIApp(handled_app)
+    token = new_user_setup(client, {})['token']
+
+    requests = [
+        ("GET", "/ping", None, {"X-Closed": "1"}),
+        ("POST", "/auth/login", None, {"X-Closed": "1"}),
+        ("POST", "/game/move", token, {"Content-Type": "text/plain"}),
+        ("GET", "/nowhere", None, None),
+        ("DELETE", "/ping", None, None),
+        ("GET", "/ping", None, None),
+    ]
+
+    async def compare():
+        # ✅ The coroutine views themselves
+        assert {"ping.ping", "auth.login", "game.add_move"} <= set(asgi_app.views)
+
+        for method, path, request_token, headers in requests:
+            response = client.open(path, method=method, headers=dict(headers or {}, **(
+                {"Authorization": request_token} if request_token else {})))
+            status, response_headers, body = await asgi_request(asgi_app, method, path, token=request_token, headers=headers)
+
+            assert (status, json.loads(body)) == (response.status_code, response.get_json()), f"{method} {path}"
+            assert response_headers[b"content-type"] == b"application/json"
+            assert response_headers[b"x-served-by"] == b"app"
+
+    try:
+        asyncio.run(asgi_closing(asgi_app, compare()))
+    finally:
+        close_move_journal(handled_app)
+        close_pool(handled_app)
+        close_hash_pool(handled_app)
+        close_game_events(handled_app)
@@ -1,4 +1,10 @@
+import time
+
 import pytest
+from app import create_app
+from app.db import close_pool, get_db
+from app.middleware import TokenCache, get_token_cache, token_required
+from app.passwords import close_hash_pool, full_method, get_hash_pool
 from tests.funcs import *
 
 """
@@ -315,3 +321,258 @@ def test_register_exists(client):
     assert "user" not in response_body, "User should not be in response"
 
 
+
+
+# -----------------------------------------------------------------------------------
+# Description: Verified tokens are cached until the user's row changes
+#
+# Verifies:
+# ✅ The first request with a token misses, the next ones hit
+# ✅ The cached user row is dropped when the user wins
+# ✅ Hit and miss counters are exposed on /metrics
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Login
+@pytest.mark.game_Move
+def test_token_cache(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    cache = get_token_cache(app)
+
+    # ✅ Miss, then hits
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+    assert cache.stats()['misses'] == 1 and cache.stats()['hits'] == 0, f"Unexpected stats {cache.stats()}"
+    for move in [0, 3, 1, 4]:
+        check_code(gotten_code=make_move(client, move, game_id, user_data['token']).status_code, expect=200)
+    assert cache.stats()['hits'] == 4, f"Unexpected stats {cache.stats()}"
+
+    # ✅ Winning drops the cached row, so the next request sees the new wins
+    check_code(gotten_code=make_move(client, 2, game_id, user_data['token']).status_code, expect=200)
+    assert cache.stats()['size'] == 0, "Cached token was not dropped after the user won"
+    cached_user = None
+
+    def remember_user(current_user):
+        nonlocal cached_user
+        cached_user = current_user
+        return {}, 200
+
+    with app.test_request_context(headers={"Authorization": user_data['token']}):
+        token_required(remember_user)()
+    assert cached_user['wins'] == 1, f"Expected 1 win on the user row, got {cached_user['wins']}"
+
+    # ✅ Counters exposed
+    response_body = check_valid_json(client.get('/metrics'))
+    assert response_body['token_cache']['hits'] == cache.stats()['hits']
+    assert response_body['token_cache']['misses'] == cache.stats()['misses']
+
+
+# -----------------------------------------------------------------------------------
+# Description: Cached tokens expire with the token and the cache stays within its size
+#
+# Verifies:
+# ✅ An entry past the token's exp is not returned
+# ✅ The least recently used entry is evicted
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Boundary
+def test_token_cache_expiry_and_size():
+    cache = TokenCache(maxsize=2)
+    user = {"id": 1}
+
+    # ✅ Expired
+    cache.put("expired", {"user_id": 1, "exp": time.time() - 1}, user)
+    assert cache.get("expired") is None, "Expired token was returned from the cache"
+
+    # ✅ Least recently used evicted
+    cache.put("a", {"user_id": 1, "exp": time.time() + 60}, user)
+    cache.put("b", {"user_id": 1, "exp": time.time() + 60}, user)
+    cache.get("a")
+    cache.put("c", {"user_id": 1, "exp": time.time() + 60}, user)
+    assert cache.get("b") is None, "Least recently used token was not evicted"
+    assert cache.get("a") is not None and cache.get("c") is not None, "Recently used tokens were evicted"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Hash methods given without parameters get Werkzeug's defaults
+#
+# Verifies:
+# ✅ Missing parameters are filled in
+# ✅ Given parameters are kept
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.parametrize("method, expected", [
+    ("pbkdf2", "pbkdf2:sha256:600000"),
+    ("pbkdf2:sha512", "pbkdf2:sha512:600000"),
+    ("pbkdf2:sha256:1000", "pbkdf2:sha256:1000"),
+    ("scrypt", "scrypt:32768:8:1"),
+    ("scrypt:16384", "scrypt:16384:8:1"),
+])
+def test_password_full_method(method, expected):
+    assert full_method(method) == expected, f"Expected {expected} for {method} but got {full_method(method)}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Passwords hashed with an old cost are rehashed on login
+#
+# Verifies:
+# ✅ New passwords use the configured method and cost
+# ✅ A successful login replaces an outdated hash
+# ✅ The user can still login after the rehash
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Registration
+@pytest.mark.account_Login
+def test_password_rehash_on_login(app, client):
+    def stored_hash(username):
+        with app.app_context():
+            return get_db().execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()[0]
+
+    # ✅ Configured cost used
+    app.config['PASSWORD_HASH_METHOD'] = "pbkdf2:sha256:1000"
+    response, username, password = register(client)
+    check_code(gotten_code=response.status_code, expect=201)
+    assert stored_hash(username).startswith("pbkdf2:sha256:1000$"), "Configured hash method not used"
+
+    # ✅ Rehashed with the new cost
+    app.config['PASSWORD_HASH_METHOD'] = "pbkdf2:sha256:2000"
+    check_code(gotten_code=login(client, username, password).status_code, expect=200)
+    assert stored_hash(username).startswith("pbkdf2:sha256:2000$"), "Hash was not upgraded on login"
+
+    # ✅ Still works
+    check_code(gotten_code=login(client, username, password).status_code, expect=200)
+    bad_login(client, username, password + "x", expected_code=403)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Register and login with hashing offloaded to worker processes
+#
+# Verifies:
+# ✅ The pool is created with the app, its workers aren't forked from the server process
+# ✅ Register and login work through the process pool
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Registration
+@pytest.mark.account_Login
+def test_password_hash_pool(app, context):
+    pool_app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'PASSWORD_HASH_WORKERS': 2,
+        'PASSWORD_HASH_METHOD': "pbkdf2:sha256:1000",
+    })
+    client = pool_app.test_client()
+
+    # ✅ Created with the app
+    pool = get_hash_pool(pool_app)
+    assert pool is not None, "The pool was not created with the app"
+    assert pool._mp_context.get_start_method() != "fork", "Hashing workers are forked from the server"
+
+    try:
+        user_data = new_user_setup(client, context)
+        bad_login(client, user_data['username'], user_data['password'] + "x", expected_code=403)
+        assert pool._processes, "Hashing did not go through the process pool"
+    finally:
+        close_hash_pool(pool_app)
+        close_pool(pool_app)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Register several users in one request, some of them invalid
+#
+# Verifies:
+# ✅ Valid users are registered and can login
+# ✅ Existing, repeated and incomplete users fail without stopping the others
+# ✅ Results are in the order given
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Smoke
+@pytest.mark.type_Regression
+@pytest.mark.account_Registration
+@pytest.mark.account_Login
+def test_register_bulk(app, client):
+    app.config['PASSWORD_HASH_METHOD'] = "pbkdf2:sha256:1000"
+
+    # An existing user
+    response, existing_username, _ = register(client)
+    check_code(gotten_code=response.status_code, expect=201)
+
+    new_users = [{"username": random_str(), "password": random_str()} for _ in range(2)]
+    response = register_bulk(client, [
+        new_users[0],
+        {"username": existing_username, "password": random_str()},
+        new_users[1],
+        {"username": new_users[0]["username"], "password": random_str()},
+        {"username": random_str()},
+    ])
+
+    # ✅ Check response code
+    check_code(gotten_code=response.status_code, expect=200)
+    response_body = check_valid_json(response)
+
+    # ✅ Per user results, in order
+    statuses = [result['status'] for result in response_body['results']]
+    assert statuses == [201, 400, 201, 400, 400], f"Unexpected per user statuses {statuses}"
+    messages = [result['message'] for result in response_body['results']]
+    assert messages[1] == messages[3] == "Username already exists!", f"Unexpected messages {messages}"
+    assert messages[4] == "Missing required fields!", f"Unexpected messages {messages}"
+    assert response_body['message'] == "Registered 2 of 5 users"
+
+    # ✅ Registered users can login
+    for index, user in [(0, new_users[0]), (2, new_users[1])]:
+        assert response_body['results'][index]['user']['username'] == user['username']
+        response = login(client, user['username'], user['password'])
+        check_code(gotten_code=response.status_code, expect=200)
+        assert check_valid_json(response)['user']['id'] == response_body['results'][index]['user']['id']
+
+
+# -----------------------------------------------------------------------------------
+# Description: Bulk registration with a bad body or too many users
+#
+# Verifies:
+# ✅ The body must be a non empty array
+# ✅ The number of users is limited
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.type_Boundary
+@pytest.mark.account_Registration
+def test_register_bulk_invalid(app, client):
+    for body in [[], {"username": random_str(), "password": random_str()}]:
+        response = register_bulk(client, body)
+        check_code(gotten_code=response.status_code, expect=400, message=f"Body {body} should be rejected")
+
+    app.config['AUTH_BULK_MAX_USERS'] = 2
+    response = register_bulk(client, [{"username": random_str(), "password": random_str()} for _ in range(3)])
+    check_code(gotten_code=response.status_code, expect=400, message="Too many users should be rejected")
+    assert check_valid_json(response)['message'] == "At most 2 users can be registered at once"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Bulk registration with items of the wrong type next to good ones
+#
+# Verifies:
+# ✅ Each bad item gets its own 400 result
+# ✅ The good items are still registered
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.account_Registration
+def test_register_bulk_bad_items(client):
+    good = [{"username": random_str(), "password": random_str()} for _ in range(2)]
+    body = [
+        {"username": 123, "password": "x"},
+        good[0],
+        {"username": ["a"], "password": "x"},
+        {"username": random_str(), "password": {"a": 1}},
+        "not a user",
+        good[1],
+    ]
+
+    response = register_bulk(client, body)
+    check_code(gotten_code=response.status_code, expect=200)
+    results = check_valid_json(response)['results']
+
+    # ✅ Rejected one by one
+    assert [result['status'] for result in results] == [400, 201, 400, 400, 400, 201]
+    assert results[0]['message'] == "Username and password must be strings"
+
+    # ✅ Registered
+    for user in good:
+        check_code(gotten_code=login(client, user['username'], user['password']).status_code, expect=200)
@@ -0,0 +1,555 @@
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+import pytest
+from app import create_app
+from app.asgi import ASGIApp
+from app.db import MEMORY_DATABASE, close_memory_db, close_pool, connect, get_db, init_db
+from app.export import export_lines, export_rows
+from app.journal import close_move_journal
+from app.leaderboard import get_leaderboard
+from app.routes.game import _MOVE_QUERY
+from app.util import _check_winner_scan, board_to_bits, check_winner, check_winner_bits
+from tests import loadgen
+from tests.test_game import hammer_game
+from tests.funcs import *
+
+"""
+Benchmarks and load tests for hot paths. These compare against a baseline measured in the same test,
+so they are relative and not tied to the machine speed.
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: Compare check_winner against the original 8 combo scan over every board
+#
+# Verifies:
+# ✅ The table lookup is faster than the original scan
+# ✅ The bitboard lookup is faster than the original scan
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+def test_benchmark_check_winner(record_property):
+    # Get all the combos, and their bitboards
+    all_combos = get_all_board_combinations()
+    all_bits = [board_to_bits(combo) for combo in all_combos]
+
+    # Best of several runs to keep the numbers stable
+    def best_of(func):
+        return min(timeit.repeat(func, number=1, repeat=5))
+
+    scan_time = best_of(lambda: [_check_winner_scan(combo) for combo in all_combos])
+    table_time = best_of(lambda: [check_winner(combo) for combo in all_combos])
+    bits_time = best_of(lambda: [check_winner_bits(x_mask, o_mask) for x_mask, o_mask in all_bits])
+
+    record_property("result", f"scan: {scan_time:.4f}s, table: {table_time:.4f}s ({scan_time / table_time:.1f}x), "
+                              f"bits: {bits_time:.4f}s ({scan_time / bits_time:.1f}x)")
+
+    # ✅ Faster than the original scan
+    assert table_time < scan_time, f"Table lookup ({table_time:.4f}s) was not faster than scan ({scan_time:.4f}s)"
+    assert bits_time < scan_time, f"Bitboard lookup ({bits_time:.4f}s) was not faster than scan ({scan_time:.4f}s)"
+
+
+# -------------------------------------------------------------------------------------------------
+# Play moves from several threads while other threads keep reading the games table,
+# then return the number of successful moves per second
+# -------------------------------------------------------------------------------------------------
+def move_throughput(profile: str, seconds: float = 1.0, writers: int = 4, readers: int = 4, config: dict = None) -> float:
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': db_path,
+        'DATABASE_PRAGMA_PROFILE': profile,
+        'DATABASE_POOL_SIZE': writers,
+        **(config or {}),
+    })
+
+    with app.app_context():
+        init_db()
+
+    # One user plays both sides of every game, each writer thread gets its own games
+    client = app.test_client()
+    user_data = new_user_setup(client, {})
+    game_ids = [create_game(client, user_data['token']).json['game_id'] for _ in range(100 * writers)]
+
+    # Fills the whole board and ends in a draw, so every move is valid
+    draw_moves = [4, 2, 8, 0, 1, 7, 5, 3, 6]
+    moves_made = [0] * writers
+    failures = []
+    stop_at = time.monotonic() + seconds
+
+    def writer(index):
+        writer_client = app.test_client()
+        count = 0
+        while time.monotonic() < stop_at:
+            game_id = game_ids[(count // 9) * writers + index]
+            response = make_move(writer_client, draw_moves[count % 9], game_id, user_data['token'])
+            if response.status_code != 200:
+                failures.append(response.status_code)
+                return
+            count += 1
+        moves_made[index] = count
+
+    def reader():
+        db = connect(app.config)
+        while time.monotonic() < stop_at:
+            db.execute("BEGIN")
+            db.execute("SELECT * FROM games").fetchall()
+            db.execute("COMMIT")
+        db.close()
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    close_move_journal(app)
+    close_pool(app)
+    os.close(db_fd)
+    os.unlink(db_path)
+
+    assert not failures, f"Moves failed under load with the \"{profile}\" profile: {failures}"
+    return sum(moves_made) / seconds
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves under concurrent readers with the rollback journal and with WAL
+#
+# Verifies:
+# ✅ Every move succeeds under load with both profiles
+# ✅ WAL moves more games per second than the rollback journal
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_benchmark_move_throughput_wal(record_property):
+    default_rate = move_throughput("default")
+    wal_rate = move_throughput("wal")
+
+    record_property("result", f"default: {default_rate:.0f} moves/s, wal: {wal_rate:.0f} moves/s ({wal_rate / default_rate:.1f}x)")
+
+    # ✅ Readers no longer hold up the writers
+    assert wal_rate > default_rate, \
+        f"WAL ({wal_rate:.0f} moves/s) was not faster than the rollback journal ({default_rate:.0f} moves/s)"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves committed one by one against write-behind with group commit
+#
+# Verifies:
+# ✅ Every move succeeds under load with write-behind
+# ✅ Write-behind moves more games per second with either profile
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_benchmark_write_behind(record_property):
+    write_behind = {'MOVE_WRITE_BEHIND': True}
+
+    for profile in ("default", "wal"):
+        sync_rate = move_throughput(profile)
+        write_behind_rate = move_throughput(profile, config=write_behind)
+
+        record_property(profile, f"per move: {sync_rate:.0f} moves/s, "
+                                 f"write-behind: {write_behind_rate:.0f} moves/s ({write_behind_rate / sync_rate:.1f}x)")
+
+        # ✅ A commit per flush instead of per move
+        assert write_behind_rate > sync_rate, \
+            f"Write-behind ({write_behind_rate:.0f} moves/s) was not faster than committing every move " \
+            f"({sync_rate:.0f} moves/s) with the \"{profile}\" profile"
+
+
+# -------------------------------------------------------------------------------------------------
+# Play games move by move straight on a connection, committing every move as add_move does,
+# and return the number of moves per second. Leaves out the HTTP layer, which costs the same either way
+# -------------------------------------------------------------------------------------------------
+def commit_rate(memory: bool, games: int = 1000) -> float:
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': MEMORY_DATABASE if memory else db_path,
+    })
+
+    # An in-memory database is created with the app
+    if not memory:
+        with app.app_context():
+            init_db()
+
+    db = connect(app.config)
+    db.execute("INSERT INTO users (username, password) VALUES ('player', '')")
+    db.executemany("INSERT INTO games (user_id, board, current_turn) VALUES (1, '         ', 1)", [()] * games)
+    db.commit()
+
+    draw_moves = [4, 2, 8, 0, 1, 7, 5, 3, 6]
+
+    def play():
+        for game_id in range(1, games + 1):
+            for move in draw_moves:
+                db.execute(_MOVE_QUERY, {'game_id': game_id, 'move': move, 'current_turn': None}).fetchall()
+                db.commit()
+
+    seconds = timeit.timeit(play, number=1)
+    db.close()
+    close_memory_db(app)
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
+    return games * len(draw_moves) / seconds
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves on an in-memory database against a database file in WAL mode
+#
+# Verifies:
+# ✅ Committing moves is faster in memory
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_benchmark_memory_database(record_property):
+    file_rate = commit_rate(memory=False)
+    memory_rate = commit_rate(memory=True)
+
+    record_property("result", f"file (wal): {file_rate:.0f} moves/s, memory: {memory_rate:.0f} moves/s ({memory_rate / file_rate:.1f}x)")
+
+    # ✅ Faster in memory
+    assert memory_rate > file_rate, \
+        f"In-memory database ({memory_rate:.0f} moves/s) was not faster than the file ({file_rate:.0f} moves/s)"
+
+
+# -------------------------------------------------------------------------------------------------
+# Play games where every move comes from one of several threads racing on random cells.
+# Checks every finished game is consistent and returns the requests handled per second
+# -------------------------------------------------------------------------------------------------
+def hammer_games(threads: int, games: int = 20) -> float:
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': db_path,
+        'DATABASE_POOL_SIZE': threads,
+    })
+
+    with app.app_context():
+        init_db()
+
+    client = app.test_client()
+    user_data = new_user_setup(client, {})
+    requests_made = 0
+    elapsed = 0.0
+
+    # Consistency is checked by test_game_concurrent_moves, this only counts requests
+    for _ in range(games):
+        game_id = create_game(client, user_data['token']).json['game_id']
+        started = time.perf_counter()
+        _, unexpected, game_requests = hammer_game(app, game_id, user_data['token'], threads)
+        elapsed += time.perf_counter() - started
+        requests_made += game_requests
+        assert not unexpected, f"Unexpected responses for game {game_id}: {unexpected}"
+
+    close_pool(app)
+    os.close(db_fd)
+    os.unlink(db_path)
+
+    return requests_made / elapsed
+
+
+# -----------------------------------------------------------------------------------
+# Description: Hammer single games from many threads at once
+#
+# Verifies:
+# ✅ Throughput holds up against a single player
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_stress_concurrent_moves(record_property):
+    serial_rate = hammer_games(threads=1)
+    concurrent_rate = hammer_games(threads=8)
+
+    record_property("result", f"1 thread: {serial_rate:.0f} requests/s, 8 threads: {concurrent_rate:.0f} requests/s")
+
+    # ✅ Contention on one game doesn't collapse throughput
+    assert concurrent_rate > 0.3 * serial_rate, \
+        f"8 threads ({concurrent_rate:.0f} requests/s) fell far behind 1 thread ({serial_rate:.0f} requests/s)"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Leaderboard queries over many users against scanning the users table
+#
+# Verifies:
+# ✅ The ranking agrees with counting users with more wins
+# ✅ Ranking a user is faster than the count and takes under a millisecond
+# ✅ The top users come off the wins index faster than sorting the table
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+def test_benchmark_leaderboard(app, record_property):
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO users (username, password, wins) VALUES (?, '', ?)",
+            ((f"user{i}", int(random.expovariate(0.05))) for i in range(100000))
+        )
+        db.commit()
+
+        leaderboard = get_leaderboard()
+        wins = [row[0] for row in db.execute("SELECT wins FROM users ORDER BY random() LIMIT 200")]
+        count_query = "SELECT COUNT(*) FROM users WHERE wins > ?"
+        top_query = "SELECT id, username, wins FROM users {} ORDER BY wins DESC, id LIMIT 10"
+
+        # ✅ Same ranks
+        for user_wins in wins[:20]:
+            assert leaderboard.rank(user_wins)[0] == db.execute(count_query, (user_wins,)).fetchone()[0] + 1
+
+        ranking_time = timeit.timeit(lambda: [leaderboard.rank(user_wins) for user_wins in wins], number=5)
+        count_time = timeit.timeit(lambda: [db.execute(count_query, (user_wins,)).fetchone() for user_wins in wins], number=5)
+        indexed_time = timeit.timeit(lambda: db.execute(top_query.format("")).fetchall(), number=200)
+        sorted_time = timeit.timeit(lambda: db.execute(top_query.format("NOT INDEXED")).fetchall(), number=5) * 40
+
+    record_property("result", f"rank: {ranking_time / 1000 * 1e6:.1f}us vs count {count_time / 1000 * 1e6:.1f}us, "
+                              f"top 10: {indexed_time / 200 * 1e6:.1f}us vs sort {sorted_time / 200 * 1e6:.1f}us")
+
+    # ✅ Ranking
+    assert ranking_time < count_time, f"Ranking ({ranking_time:.3f}s) was not faster than counting ({count_time:.3f}s)"
+    assert ranking_time / 1000 < 0.001, f"Ranking took {ranking_time:.3f}s for 1000 users"
+
+    # ✅ Top users
+    assert indexed_time < sorted_time, f"Index ({indexed_time:.3f}s) was not faster than sorting ({sorted_time:.3f}s)"
+
+
+# -------------------------------------------------------------------------------------------------
+# Latency percentile of a list of seconds
+# -------------------------------------------------------------------------------------------------
+def percentile(latencies: list, fraction: float) -> float:
+    ordered = sorted(latencies)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+# -------------------------------------------------------------------------------------------------
+# Read one game from many clients at once while streams sit idle on the same game,
+# served the sync way: a thread per stream and per client.
+# Returns (requests per second, p99 latency, threads used)
+# -------------------------------------------------------------------------------------------------
+def sync_mode_load(app, streams: int, clients: int, seconds: float) -> tuple:
+    client = app.test_client()
+    token = new_user_setup(client, {})['token']
+    game_id = create_game(client, token).json['game_id']
+    threads_before = threading.active_count()
+
+    opened = threading.Barrier(streams + 1)
+    responses = []
+
+    def follow():
+        response = game_events(app.test_client(), game_id, token)
+        responses.append(response)
+        stream = iter(response.response)
+        next(stream)
+        opened.wait()
+        for _ in stream:
+            pass
+
+    followers = [threading.Thread(target=follow, daemon=True) for _ in range(streams)]
+    for thread in followers:
+        thread.start()
+    opened.wait()
+
+    latencies = [[] for _ in range(clients)]
+    stop_at = time.monotonic() + seconds
+
+    def reader(index):
+        reader_client = app.test_client()
+        while time.monotonic() < stop_at:
+            started = time.perf_counter()
+            assert get_game(reader_client, game_id, token).status_code == 200
+            latencies[index].append(time.perf_counter() - started)
+
+    readers = [threading.Thread(target=reader, args=(i,)) for i in range(clients)]
+    for thread in readers:
+        thread.start()
+    threads_used = threading.active_count() - threads_before
+    for thread in readers:
+        thread.join()
+
+    # Finishing the game ends the streams
+    make_moves(client, [0, 3, 1, 4, 2], game_id, token)
+    for thread in followers:
+        thread.join()
+    for response in responses:
+        response.close()
+
+    latencies = sum(latencies, [])
+    return len(latencies) / seconds, percentile(latencies, 0.99), threads_used
+
+
+# -------------------------------------------------------------------------------------------------
+# The same load through app.asgi: streams and clients are coroutines, served by the coroutine views
+# -------------------------------------------------------------------------------------------------
+def asgi_mode_load(app, streams: int, clients: int, seconds: float) -> tuple:
+    asgi_app = ASGIApp(app)
+    threads_before = threading.active_count()
+
+    async def run():
+        token = await asgi_user(asgi_app)
+        game_id = json.loads((await asgi_request(asgi_app, "POST", "/game", token=token))[2])["game_id"]
+
+        disconnect = asyncio.Event()
+        followers = [
+            await asgi_request(asgi_app, "GET", f"/game/{game_id}/events", token=token, stream=True, disconnect=disconnect)
+            for _ in range(streams)
+        ]
+        for follower in followers:
+            await asgi_event(follower)
+
+        latencies = []
+        loop = asyncio.get_running_loop()
+        stop_at = loop.time() + seconds
+
+        async def reader():
+            while loop.time() < stop_at:
+                started = time.perf_counter()
+                assert (await asgi_request(asgi_app, "GET", f"/game/{game_id}", token=token))[0] == 200
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(reader() for _ in range(clients)))
+        threads_used = threading.active_count() - threads_before
+        disconnect.set()
+        return latencies, threads_used
+
+    latencies, threads_used = asyncio.run(asgi_closing(asgi_app, run()))
+
+    return len(latencies) / seconds, percentile(latencies, 0.99), threads_used
+
+
+# -----------------------------------------------------------------------------------
+# Description: Serve game reads at high concurrency next to idle event streams, sync vs ASGI
+#
+# Verifies:
+# ✅ Both modes serve every read
+# ✅ The ASGI mode serves its streams without a thread each
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_benchmark_asgi_mode(app, record_property):
+    streams, clients = 200, 32
+    app.config['ASGI_THREADS'] = 16
+
+    sync_rate, sync_p99, sync_threads = sync_mode_load(app, streams, clients, seconds=1.0)
+    asgi_rate, asgi_p99, asgi_threads = asgi_mode_load(app, streams, clients, seconds=1.0)
+
+    record_property("sync", f"{sync_rate:.0f} req/s, p99 {sync_p99 * 1000:.1f}ms, {sync_threads} threads")
+    record_property("asgi", f"{asgi_rate:.0f} req/s, p99 {asgi_p99 * 1000:.1f}ms, {asgi_threads} threads")
+
+    # ✅ A thread per stream and client in sync mode, one per database connection in ASGI mode
+    assert sync_threads >= streams + clients
+    assert asgi_threads < clients, f"ASGI mode used {asgi_threads} threads"
+    assert asgi_rate > 0
+
+
+# -----------------------------------------------------------------------------------
+# Description: Run the load generator in tests/loadgen.py against a real server process
+#
+# Verifies:
+# ✅ Every game is played without errors through the helpers in tests/funcs.py
+# ✅ Every endpoint is reported with throughput and latency percentiles
+# ✅ A run passes against its own baseline and fails against a faster one
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+@pytest.mark.game_Move
+def test_benchmark_load_suite(tmp_path, record_property):
+    database = str(tmp_path / "load.sqlite")
+    process, port = loadgen.start_server(database)
+    try:
+        report = loadgen.run_load("127.0.0.1", port, concurrency=4, games=3)
+    finally:
+        loadgen.stop_server(process)
+
+    record_property("report", loadgen.format_report(report))
+
+    # ✅ No errors
+    assert not report['errors'], f"Requests failed under load: {report['errors']}"
+
+    # ✅ Every endpoint
+    assert set(report['endpoints']) == {"POST /auth/register", "POST /auth/login", "POST /game", "POST /game/move"}
+    assert report['endpoints']["POST /game/move"]['requests'] == 4 * 3 * len(loadgen.DRAW_MOVES)
+    for stats in report['endpoints'].values():
+        assert stats['throughput'] > 0 and stats['p50'] <= stats['p99'] <= stats['max']
+
+    # ✅ Baselines survive JSON and catch regressions
+    baseline_path = tmp_path / "baseline.json"
+    baseline_path.write_text(json.dumps(report))
+    baseline = json.loads(baseline_path.read_text())
+    assert loadgen.compare(report, baseline) == []
+
+    for stats in baseline['endpoints'].values():
+        stats['throughput'] *= 10
+    baseline['endpoints']["POST /game/undo"] = baseline['endpoints']["POST /game"]
+    regressions = loadgen.compare(report, baseline)
+    assert len(regressions) == len(report['endpoints']) + 1, regressions
+
+
+# -------------------------------------------------------------------------------------------------
+# Peak Python memory of exporting a games table of rows rows as NDJSON, in bytes. streamed=False
+# reads the table whole with fetchall first, as the export scripts it replaces did
+# -------------------------------------------------------------------------------------------------
+def export_peak(rows: int, streamed: bool) -> int:
+    db_fd, db_path = tempfile.mkstemp()
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': db_path,
+    })
+
+    with app.app_context():
+        init_db()
+    db = connect(app.config)
+    db.execute("INSERT INTO users (username, password) VALUES ('player', '')")
+    db.executemany("INSERT INTO games (user_id, board, current_turn) VALUES (1, 'XOXOXOX  ', 8)", [()] * rows)
+    db.commit()
+
+    written = 0
+    tracemalloc.start()
+    if streamed:
+        for text in export_lines('games', export_rows(app.config, 'games'), 'ndjson'):
+            written += len(text)
+    else:
+        everything = db.execute("SELECT * FROM games").fetchall()
+        written = len(''.join(json.dumps(dict(row), default=str) + '\n' for row in everything))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    db.close()
+    close_pool(app)
+    os.close(db_fd)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.unlink(db_path + suffix)
+
+    assert written > rows * 50, "The export is missing rows"
+    return peak
+
+
+# -----------------------------------------------------------------------------------
+# Description: Memory of streaming an export against reading the table whole
+#
+# Verifies:
+# ✅ The streamed export's memory doesn't grow with the table
+# ✅ It takes a fraction of reading the table whole
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Performance
+def test_benchmark_export_memory(record_property):
+    small = export_peak(5000, streamed=True)
+    large = export_peak(50000, streamed=True)
+    whole = export_peak(50000, streamed=False)
+
+    record_property("result", f"streamed: {small / 1024:.0f} KiB for 5k games, {large / 1024:.0f} KiB for 50k; "
+                              f"fetchall: {whole / 1024:.0f} KiB for 50k")
+
+    # ✅ Constant
+    assert large < small * 1.5, f"Streaming 10x the rows took {large / small:.1f}x the memory"
+
+    # ✅ A fraction
+    assert large * 10 < whole, f"Streaming ({large} bytes) was not far below reading it whole ({whole} bytes)"
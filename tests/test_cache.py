@@ -0,0 +1,202 @@
+import threading
+
+import pytest
+from app import create_app
+from app.cache import CacheServer, GameCache, SocketBackend, get_game_cache
+from app.db import close_pool
+from tests.funcs import *
+
+"""
+Tests for the game cache in app/cache.py
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: The cache keeps the newest state of the most recently used games
+#
+# Verifies:
+# ✅ Hits and misses are counted
+# ✅ An older state doesn't replace a newer one
+# ✅ The least recently used game is evicted
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_game_cache_lru():
+    cache = GameCache(maxsize=2)
+
+    # ✅ Miss, then hit
+    assert cache.get(1) is None
+    cache.put(game_state(1, current_turn=2, board="X        "))
+    assert cache.get(1)['board'] == "X        "
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 1, f"Unexpected stats {cache.stats()}"
+
+    # ✅ A slow writer can't put an older state back
+    cache.put(game_state(1, current_turn=3, board="XO       "))
+    cache.put(game_state(1, current_turn=2, board="X        "))
+    assert cache.get(1)['board'] == "XO       ", "Older state replaced a newer one"
+
+    # ✅ Least recently used evicted
+    cache.put(game_state(2, current_turn=1))
+    cache.get(1)
+    cache.put(game_state(3, current_turn=1))
+    assert cache.get(2) is None, "Least recently used game was not evicted"
+    assert cache.get(1) is not None and cache.get(3) is not None, "Recently used games were evicted"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Two workers share game states through the cache server
+#
+# Verifies:
+# ✅ A state written by one worker is read by the other
+# ✅ The server keeps the newest state
+# ✅ A cache without a reachable server still works on its own
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_game_cache_shared(tmp_path):
+    path = str(tmp_path / "cache.sock")
+    server = CacheServer(path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        worker1 = GameCache(backend=SocketBackend(path))
+        worker2 = GameCache(backend=SocketBackend(path))
+
+        # ✅ Shared
+        worker1.put(game_state(1, current_turn=2, board="X        "))
+        assert worker2.get(1)['board'] == "X        ", "State was not shared between workers"
+
+        # ✅ Newest kept on the server
+        worker2.put(game_state(1, current_turn=3, board="XO       "))
+        worker1.put(game_state(1, current_turn=2, board="X        "))
+        assert GameCache(backend=SocketBackend(path)).get(1)['board'] == "XO       ", "Server kept an older state"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # ✅ No server
+    cache = GameCache(backend=SocketBackend(str(tmp_path / "missing.sock")))
+    cache.put(game_state(1, current_turn=1))
+    assert cache.get(1) is not None, "Local cache should work without the server"
+    assert cache.get(2) is None
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves write through the game cache and reads are served from it
+#
+# Verifies:
+# ✅ Games are cached when created and after every move
+# ✅ A move on an occupied cell is answered from the cache
+# ✅ The cache is reported on /metrics
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_cache_write_through(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    cache = get_game_cache(app)
+
+    # ✅ Cached on create and move
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+    assert cache.get(game_id)['current_turn'] == 1
+    make_move_user(client, move=4, game_id=game_id, token=user_data['token'], expected_flair="X")
+    assert cache.get(game_id)['board'] == "    X    ", "Move was not written through to the cache"
+
+    # ✅ Occupied cell answered from the cache
+    hits = cache.stats()['hits']
+    response = make_move(client, move=4, game_id=game_id, token=user_data['token'])
+    check_code(gotten_code=response.status_code, expect=400)
+    assert check_valid_json(response)['message'] == "Invalid move"
+    assert cache.stats()['hits'] == hits + 1, "Invalid move was not answered from the cache"
+
+    # ✅ Metrics
+    assert check_valid_json(client.get('/metrics'))['game_cache']['hits'] == cache.stats()['hits']
+
+
+# -----------------------------------------------------------------------------------
+# Description: Two workers with caches of their own serve the same game
+#
+# Verifies:
+# ✅ A move made in one worker is served by the other, not its cached state
+# ✅ The old ETag gets the new state, not a 304
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_cache_other_worker(app, client, context):
+    user_data = new_user_setup(client, context)
+    token = user_data['token']
+    other_app = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+    })
+    other = other_app.test_client()
+
+    game_id = check_valid_json(create_game(client, token))['game_id']
+    etag = get_game(client, game_id, token).headers['ETag']
+
+    # ✅ Moved elsewhere
+    make_move_user(other, move=4, game_id=game_id, token=token, expected_flair="X")
+    response = get_game(client, game_id, token)
+    assert check_valid_json(response)['board'][4] == "X", "A stale cached game was served"
+
+    # ✅ No stale 304
+    response = get_game(client, game_id, token, etag=etag)
+    check_code(gotten_code=response.status_code, expect=200, message="A stale cached game was answered with 304")
+    assert check_valid_json(response)['current_turn'] == 2
+
+    close_pool(other_app)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Two workers sharing the cache server serve the same game
+#
+# Verifies:
+# ✅ A move made in one worker is served by the other, not its own cached state
+# ✅ The old ETag gets the new state, not a 304
+# ✅ A move on the cell the other worker took is rejected with the state after it
+# ✅ A move whose write to the server failed is still seen by the other worker
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_cache_other_worker_shared(app, client, context, tmp_path):
+    user_data = new_user_setup(client, context)
+    token = user_data['token']
+    path = str(tmp_path / "cache.sock")
+    server = CacheServer(path)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    workers = [
+        create_app({'TESTING': True, 'DATABASE': app.config['DATABASE'], 'GAME_CACHE_SOCKET': path})
+        for _ in range(2)
+    ]
+    worker1, worker2 = (worker.test_client() for worker in workers)
+
+    try:
+        game_id = check_valid_json(create_game(worker1, token))['game_id']
+        etag = get_game(worker1, game_id, token).headers['ETag']
+
+        # ✅ Moved elsewhere
+        make_move_user(worker2, move=4, game_id=game_id, token=token, expected_flair="X")
+        response = get_game(worker1, game_id, token)
+        assert check_valid_json(response)['board'][4] == "X", "A stale cached game was served"
+
+        # ✅ No stale 304
+        response = get_game(worker1, game_id, token, etag=etag)
+        check_code(gotten_code=response.status_code, expect=200, message="A stale cached game was answered with 304")
+        assert check_valid_json(response)['current_turn'] == 2
+
+        # ✅ The cell is taken
+        response = make_move(worker1, move=4, game_id=game_id, token=token)
+        check_code(gotten_code=response.status_code, expect=400)
+
+        # ✅ The server misses a move
+        server.store.clear()
+        get_game_cache(workers[1]).backend = SocketBackend(str(tmp_path / "missing.sock"))
+        make_move_user(worker2, move=0, game_id=game_id, token=token, expected_flair="O")
+        response = get_game(worker1, game_id, token)
+        assert check_valid_json(response)['current_turn'] == 3, "A move the server missed was not seen"
+    finally:
+        server.shutdown()
+        server.server_close()
+        for worker in workers:
+            close_pool(worker)
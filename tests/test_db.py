@@ -0,0 +1,238 @@
+import queue
+import sqlite3
+import time
+
+import pytest
+from app import create_app
+from app.db import MEMORY_DATABASE, close_memory_db, close_pool, get_db, get_pool
+from tests.funcs import *
+
+"""
+Tests for the connection pool and database CLI commands in app/db.py
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: Connections are reused across requests
+#
+# Verifies:
+# ✅ The same connection is handed to consecutive requests
+# ✅ Uncommitted work from one request is not seen by the next
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_pool_reuses_connection(app):
+    with app.app_context():
+        db = get_db()
+        db.execute("INSERT INTO games (user_id, board) VALUES (1, '         ')")
+
+    with app.app_context():
+        # ✅ Same connection
+        assert get_db() is db, "Connection was not reused from the pool"
+
+        # ✅ The previous insert was rolled back
+        count = get_db().execute("SELECT COUNT(*) FROM games").fetchone()[0]
+        assert count == 0, "Uncommitted insert leaked into the next request"
+
+
+# -----------------------------------------------------------------------------------
+# Description: The pool never opens more connections than its size
+#
+# Verifies:
+# ✅ Checkout times out when every connection is in use
+# ✅ A released connection can be checked out again
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Boundary
+def test_pool_bounded(app):
+    # Start a new pool with the smaller size
+    close_pool(app)
+    app.config.update(DATABASE_POOL_SIZE=2, DATABASE_POOL_TIMEOUT=0.05)
+    pool = get_pool(app)
+
+    first, second = pool.acquire(), pool.acquire()
+
+    # ✅ No third connection
+    with pytest.raises(queue.Empty):
+        pool.acquire()
+
+    # ✅ Returned connection is handed out again
+    pool.release(second)
+    assert pool.acquire() is second, "Released connection was not reused"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Broken connections are replaced and the pool drains on shutdown
+#
+# Verifies:
+# ✅ A connection that fails the health check is replaced
+# ✅ Closing the pool closes idle connections
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_ErrorHandling
+def test_pool_health_check_and_close(app):
+    pool = get_pool(app)
+
+    # ✅ A closed connection is not handed out
+    broken = pool.acquire()
+    pool.release(broken)
+    broken.close()
+    healthy = pool.acquire()
+    assert healthy is not broken, "Broken connection was handed out"
+    assert healthy.execute("SELECT 1").fetchone()[0] == 1
+    pool.release(healthy)
+
+    # ✅ Idle connections are closed on shutdown
+    close_pool(app)
+    with pytest.raises(sqlite3.ProgrammingError):
+        healthy.execute("SELECT 1")
+
+
+# -----------------------------------------------------------------------------------
+# Description: Pragma profiles are applied to new connections and init-db persists WAL
+#
+# Verifies:
+# ✅ The wal profile is applied to pooled connections
+# ✅ Single pragmas override the profile
+# ✅ init-db leaves the database file in WAL mode
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_pragma_profile(app, runner):
+    close_pool(app)
+    app.config.update(DATABASE_PRAGMA_PROFILE="wal", DATABASE_PRAGMAS={"synchronous": "FULL"})
+
+    # ✅ Profile and override applied
+    with app.app_context():
+        db = get_db()
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal", "WAL was not applied"
+        assert db.execute("PRAGMA synchronous").fetchone()[0] == 2, "synchronous override was not applied"
+        assert db.execute("PRAGMA temp_store").fetchone()[0] == 2, "temp_store from the profile was not applied"
+
+    # ✅ WAL is stored in the file itself
+    result = runner.invoke(args=["init-db"])
+    assert "journal mode: wal" in result.output, f"init-db did not report WAL: {result.output}"
+    db = sqlite3.connect(app.config["DATABASE"])
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal", "WAL was not persisted by init-db"
+    db.close()
+
+
+# -----------------------------------------------------------------------------------
+# Description: Re-score the stored games and report the ones whose winner is wrong
+#
+# Verifies:
+# ✅ Games with a correct winner are not reported
+# ✅ Games with a wrong winner are reported
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_check_winners_command(app, runner):
+    pytest.importorskip("numpy")
+
+    # Store games directly, one of them with a wrong winner
+    with app.app_context():
+        db = get_db()
+        db.executemany(
+            "INSERT INTO games (user_id, board, winner) VALUES (?, ?, ?)",
+            [
+                (1, "XXXOO    ", "X"),
+                (1, "XO       ", None),
+                (1, "XOXXOOOXX", "Draw"),
+                (1, "OOOXX X  ", "X"),
+            ]
+        )
+        db.commit()
+
+    result = runner.invoke(args=["check-winners", "--chunk-size", "3"])
+
+    # ✅ Only the wrong game is reported
+    assert result.exit_code == 0, result.output
+    assert "Game 4: stored 'X', board gives 'O'" in result.output, f"Mismatch not reported: {result.output}"
+    assert "Game 1" not in result.output, f"Correct game was reported: {result.output}"
+    assert "Checked 4 games, 1 mismatches." in result.output, f"Summary not reported: {result.output}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Every test gets its own copy of the session's template database
+#
+# Verifies:
+# ✅ The copy has the tables and the WAL journal mode of init_db
+# ✅ Writes to the copy don't reach the template
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_template_database(app, template_db):
+    with app.app_context():
+        db = get_db()
+
+        # ✅ Same as init_db
+        tables = {row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        assert {"users", "games"} <= tables, f"Missing tables in {tables}"
+        assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        db.execute("INSERT INTO users (username, password) VALUES ('copy', '')")
+        db.commit()
+
+    # ✅ Template untouched
+    template = sqlite3.connect(template_db)
+    assert template.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+    template.close()
+
+
+# -----------------------------------------------------------------------------------
+# Description: Run on an in-memory database that is snapshot to a file and restored from it
+#
+# Verifies:
+# ✅ Requests on different pooled connections share the database
+# ✅ Shutting down takes a snapshot, the next start restores it
+# ✅ Snapshots are taken periodically and reported on /metrics
+# ✅ Without a snapshot file every start is empty
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Login
+def test_memory_database(tmp_path):
+    snapshot = str(tmp_path / "snapshot.sqlite")
+    config = {
+        'TESTING': True,
+        'DATABASE': MEMORY_DATABASE,
+        'DATABASE_SNAPSHOT': snapshot,
+        'DATABASE_SNAPSHOT_INTERVAL': 0,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    }
+
+    # ✅ Shared across connections
+    app = create_app(config)
+    client = app.test_client()
+    user_data = new_user_setup(client, {})
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+    check_code(gotten_code=make_move(client, 4, game_id, user_data['token']).status_code, expect=200)
+    close_pool(app)
+    close_memory_db(app)
+
+    # ✅ Restored
+    app = create_app(config)
+    client = app.test_client()
+    response = login(client, user_data['username'], user_data['password'])
+    check_code(gotten_code=response.status_code, expect=200, message="User was not restored")
+    response = get_game(client, game_id, response.json['token'])
+    assert check_valid_json(response)['board'][4] == "X", "Move was not restored"
+    close_pool(app)
+    close_memory_db(app)
+
+    # ✅ Periodic
+    app = create_app(dict(config, DATABASE_SNAPSHOT_INTERVAL=0.05))
+    for _ in range(100):
+        if app.extensions['memory_db'].snapshots:
+            break
+        time.sleep(0.01)
+    stats = check_valid_json(app.test_client().get('/metrics'))['database']
+    assert stats['restored'] and stats['snapshots'] >= 1, f"No periodic snapshot in {stats}"
+    close_pool(app)
+    close_memory_db(app)
+
+    # ✅ Nothing kept
+    app = create_app(dict(config, DATABASE_SNAPSHOT=None))
+    with app.app_context():
+        assert get_db().execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+    close_pool(app)
+    close_memory_db(app)
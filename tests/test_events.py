@@ -0,0 +1,185 @@
+import threading
+import time
+
+import pytest
+from app import create_app
+from app.db import close_pool
+from app.events import GameEvents, close_game_events, get_game_events
+from tests.funcs import *
+
+"""
+Tests for the game events in app/events.py and the event endpoints in app/routes/game.py
+"""
+
+
+# -----------------------------------------------------------------------------------
+# Description: Publish game states to waiting subscribers
+#
+# Verifies:
+# ✅ Every subscriber of a game is woken by one publish
+# ✅ Older states and other games don't wake anyone
+# ✅ A state published before the wait is still seen
+# ✅ Games are forgotten once their last subscriber leaves
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_game_events_publish():
+    events = GameEvents()
+    subscriptions = [events.subscribe(1) for _ in range(20)]
+    received = [None] * len(subscriptions)
+
+    def waiter(index):
+        received[index] = subscriptions[index].wait(after_turn=1, timeout=5)
+
+    threads = [threading.Thread(target=waiter, args=(i,)) for i in range(len(subscriptions))]
+    for thread in threads:
+        thread.start()
+
+    # ✅ Nothing newer
+    events.publish(game_state(2, current_turn=5))
+    events.publish(game_state(1, current_turn=1))
+    assert subscriptions[0].wait(after_turn=1, timeout=0.05) is None
+
+    # ✅ All woken
+    events.publish(game_state(1, current_turn=2))
+    for thread in threads:
+        thread.join()
+    assert all(state['current_turn'] == 2 for state in received), f"Subscribers missed the move: {received}"
+
+    # ✅ Published before waiting
+    events.publish(game_state(1, current_turn=3))
+    assert subscriptions[0].wait(after_turn=2, timeout=0)['current_turn'] == 3
+    events.publish(game_state(1, current_turn=2))
+    assert subscriptions[0].wait(after_turn=2, timeout=0)['current_turn'] == 3, "An older state replaced a newer one"
+
+    # ✅ Forgotten
+    assert events.stats() == {'games': 1, 'subscribers': 20, 'shared': False}
+    for subscription in subscriptions:
+        subscription.close()
+    subscriptions[0].close()
+    assert events.stats()['games'] == 0 and events.watched() == []
+
+
+# -----------------------------------------------------------------------------------
+# Description: Follow a game on its event stream
+#
+# Verifies:
+# ✅ The stream starts with the current state
+# ✅ Every move is pushed with its turn as the event id
+# ✅ A reconnect with Last-Event-ID skips the state it has
+# ✅ The stream ends with the game and unsubscribes
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_events_stream(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    response = game_events(client, game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    assert response.mimetype == 'text/event-stream'
+    stream = response.response
+
+    # ✅ Current state
+    assert next_event(stream) == (1, check_valid_json(get_game(client, game_id, user_data['token'])))
+
+    # ✅ Moves, X wins on the top row
+    for turn, move in enumerate([0, 3, 1, 4, 2], start=2):
+        make_move(client, move, game_id, user_data['token'])
+        event_id, game = next_event(stream)
+        assert event_id == turn and game['current_turn'] == turn and game['board'][move] != " "
+    assert game['winner'] == "X"
+
+    # ✅ Ends with the game
+    with pytest.raises(StopIteration):
+        next(stream)
+    response.close()
+    with app.app_context():
+        assert get_game_events().stats()['subscribers'] == 0, "Stream was not unsubscribed"
+
+    # ✅ Nothing new since the last event, the finished game ends the stream straight away
+    response = game_events(client, game_id, user_data['token'], last_event_id=6)
+    assert list(response.response) == []
+    response.close()
+
+    # ✅ Unknown game
+    check_code(gotten_code=game_events(client, game_id + 1, user_data['token']).status_code, expect=404)
+    with app.app_context():
+        assert get_game_events().stats()['subscribers'] == 0
+
+
+# -----------------------------------------------------------------------------------
+# Description: Wait for a move with a long poll
+#
+# Verifies:
+# ✅ A game already past the turn answers straight away
+# ✅ A waiting poll is answered by the next move
+# ✅ A poll with no move times out with 304
+# ✅ Bad parameters are rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.type_Boundary
+@pytest.mark.game_Move
+def test_game_events_poll(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    # ✅ Already past
+    response = poll_game(client, game_id, user_data['token'], after=0)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert check_valid_json(response)['current_turn'] == 1
+
+    # ✅ Answered by the move
+    mover = threading.Timer(0.2, make_move, args=(app.test_client(), 4, game_id, user_data['token']))
+    mover.start()
+    started = time.monotonic()
+    response = poll_game(client, game_id, user_data['token'], after=1, timeout=5)
+    mover.join()
+    check_code(gotten_code=response.status_code, expect=200)
+    assert check_valid_json(response)['board'][4] == "X"
+    assert time.monotonic() - started < 5, "Poll waited for the timeout"
+
+    # ✅ Times out
+    response = poll_game(client, game_id, user_data['token'], after=2, timeout=0.1)
+    check_code(gotten_code=response.status_code, expect=304)
+
+    # ✅ Bad parameters
+    check_code(gotten_code=poll_game(client, game_id, user_data['token']).status_code, expect=400)
+    check_code(gotten_code=poll_game(client, game_id, user_data['token'], after=1, timeout=-1).status_code, expect=400)
+    check_code(gotten_code=poll_game(client, game_id + 1, user_data['token'], after=1).status_code, expect=404)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves made in one worker reach subscribers in another through the database
+#
+# Verifies:
+# ✅ The 'sqlite' backend publishes a move committed by another worker
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_events_sqlite_backend(app, client, context):
+    # A second worker on the same database
+    worker = create_app({
+        'TESTING': True,
+        'DATABASE': app.config['DATABASE'],
+        'GAME_EVENTS_BACKEND': 'sqlite',
+        'GAME_EVENTS_POLL_INTERVAL': 0.05,
+    })
+
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    try:
+        with get_game_events(worker).subscribe(game_id) as subscription:
+            make_move(client, 4, game_id, user_data['token'])
+
+            # ✅ Seen by the other worker
+            state = subscription.wait(after_turn=1, timeout=5)
+            assert state is not None, "Move was not published to the other worker"
+            assert state['current_turn'] == 2
+    finally:
+        close_game_events(worker)
+        close_pool(worker)
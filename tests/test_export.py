@@ -0,0 +1,149 @@
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+from app.asgi import ASGIApp
+from tests.funcs import *
+
+"""
+Tests for the exports in app/export.py: the export command and the /admin/export endpoint
+"""
+
+ADMIN_TOKEN = "admin-token-for-tests"
+
+
+# -------------------------------------------------------------------------------------------------
+# Register count users and play a game for each. Returns their usernames
+# -------------------------------------------------------------------------------------------------
+def export_fixture(client, count: int = 5) -> list:
+    users = [{"username": random_str(), "password": random_str()} for _ in range(count)]
+    check_code(gotten_code=register_bulk(client, users).status_code, expect=200)
+
+    for user in users:
+        token = login(client, user["username"], user["password"]).json['token']
+        game_id = check_valid_json(create_game(client, token))['game_id']
+        make_move_user(client, move=4, game_id=game_id, token=token, expected_flair="X")
+
+    return [user["username"] for user in users]
+
+
+# -----------------------------------------------------------------------------------
+# Description: Export both tables through the admin endpoint
+#
+# Verifies:
+# ✅ Only the admin token is let in, and nobody while none is set
+# ✅ NDJSON rows in id order without password hashes, whatever the chunk size
+# ✅ CSV with a header row
+# ✅ Incremental exports since an id or a created_at watermark
+# ✅ Bad tables, formats, chunk sizes and watermarks are rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.type_Boundary
+@pytest.mark.account_Registration
+def test_export_endpoint(app, client):
+    usernames = export_fixture(client)
+
+    # ✅ Admin only
+    check_code(gotten_code=export_table(client, "users", ADMIN_TOKEN).status_code, expect=403)
+    app.config['ADMIN_TOKEN'] = ADMIN_TOKEN
+    check_code(gotten_code=export_table(client, "users", "wrong").status_code, expect=403)
+
+    # ✅ NDJSON
+    response = export_table(client, "users", ADMIN_TOKEN)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert response.mimetype == "application/x-ndjson"
+    users = [json.loads(line) for line in response.data.splitlines()]
+    assert [user["username"] for user in users] == usernames
+    assert all(set(user) == {"id", "username", "wins", "created_at"} for user in users), "Password hashes were exported"
+    response = export_table(client, "users", ADMIN_TOKEN, chunk_size=2)
+    assert [json.loads(line) for line in response.data.splitlines()] == users
+
+    # ✅ CSV
+    response = export_table(client, "games", ADMIN_TOKEN, format="csv")
+    check_code(gotten_code=response.status_code, expect=200)
+    rows = list(csv.DictReader(io.StringIO(response.data.decode())))
+    assert len(rows) == len(usernames)
+    assert all(row["board"] == "    X    " and row["current_turn"] == "2" and row["winner"] == "" for row in rows)
+
+    # ✅ Incremental
+    response = export_table(client, "users", ADMIN_TOKEN, since_id=users[1]["id"])
+    assert [json.loads(line)["id"] for line in response.data.splitlines()] == [user["id"] for user in users[2:]]
+    response = export_table(client, "games", ADMIN_TOKEN, since=users[0]["created_at"])
+    assert len(response.data.splitlines()) == len(usernames)
+    response = export_table(client, "games", ADMIN_TOKEN, since="2999-01-01T00:00:00+02:00")
+    assert response.data == b""
+    response = export_table(client, "users", ADMIN_TOKEN, format="csv", since_id=users[-1]["id"])
+    assert response.data.decode() == "id,username,wins,created_at\n", "An empty CSV export has no header"
+
+    # ✅ Rejected
+    check_code(gotten_code=export_table(client, "moves", ADMIN_TOKEN).status_code, expect=404)
+    check_code(gotten_code=export_table(client, "users", ADMIN_TOKEN, format="xml").status_code, expect=400)
+    check_code(gotten_code=export_table(client, "users", ADMIN_TOKEN, chunk_size=0).status_code, expect=400)
+    check_code(gotten_code=export_table(client, "users", ADMIN_TOKEN, since="yesterday").status_code, expect=400)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Export with the flask export command
+#
+# Verifies:
+# ✅ Rows are written to the output, the last id is reported for the next run
+# ✅ The next run since that id exports only newer rows
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Registration
+def test_export_command(app, client, runner, tmp_path):
+    usernames = export_fixture(client, count=3)
+    output = tmp_path / "users.ndjson"
+
+    # ✅ Written
+    result = runner.invoke(args=["export", "users", "--output", str(output), "--chunk-size", "2"])
+    assert result.exit_code == 0, result.output
+    users = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [user["username"] for user in users] == usernames
+    assert f"Exported 3 users, last id {users[-1]['id']}." in result.output
+
+    # ✅ Incremental
+    usernames += export_fixture(client, count=2)
+    result = runner.invoke(args=["export", "games", "--format", "csv", "--since-id", "0"])
+    assert result.exit_code == 0 and result.output.startswith("id,user_id,board,")
+    result = runner.invoke(args=["export", "users", "--output", str(output), "--since-id", str(users[-1]["id"])])
+    assert [json.loads(line)["username"] for line in output.read_text().splitlines()] == usernames[3:]
+    assert "Exported 2 users" in result.output
+
+    result = runner.invoke(args=["export", "users", "--since", "not a date"])
+    assert result.exit_code != 0 and "ISO 8601" in result.output
+
+
+# -----------------------------------------------------------------------------------
+# Description: Export through the ASGI app
+#
+# Verifies:
+# ✅ The export is sent chunk by chunk instead of read whole first
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.account_Registration
+def test_export_asgi(app, client):
+    usernames = export_fixture(client, count=4)
+    app.config['ADMIN_TOKEN'] = ADMIN_TOKEN
+    asgi_app = ASGIApp(app)
+
+    async def export():
+        messages = await asgi_request(asgi_app, "GET", "/admin/export/users", token=ADMIN_TOKEN,
+                                      query="chunk_size=1", stream=True)
+        start = await asyncio.wait_for(messages.get(), 5)
+        assert start["status"] == 200
+
+        bodies = []
+        while True:
+            message = await asyncio.wait_for(messages.get(), 5)
+            bodies.append(message["body"])
+            if not message.get("more_body"):
+                return bodies
+
+    bodies = asyncio.run(asgi_closing(asgi_app, export()))
+
+    # ✅ A message per chunk
+    assert len([body for body in bodies if body]) == len(usernames)
+    assert [json.loads(line)["username"] for line in b"".join(bodies).splitlines()] == usernames
@@ -1,4 +1,9 @@
+import threading
+
 import pytest
+from app.cache import get_game_cache
+from app.db import get_db
+from app.util import check_winner
 from tests.funcs import *
 
 """
@@ -479,3 +484,543 @@ def test_game_single_game_user_twice(client, context):
     msg = "Invalid move"
     assert response_body['message'] == "Invalid move", \
         f"Expected message \"{msg}\" but got \"{response_body['message']}\" instead."
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play a game with the board packed into board_bits
+#
+# Verifies:
+# ✅ Moves and the winner are the same as with the text board
+# ✅ The board is stored in board_bits only
+# ✅ No more moves once the game has a winner
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_CreateGame
+@pytest.mark.game_Move
+def test_game_single_game_bits_storage(app, client, context):
+    app.config['GAME_BOARD_STORAGE'] = 'bits'
+
+    # Create a new users and login to get token
+    user1_data = new_user_setup(client, context)
+    user2_data = new_user_setup(client, context)
+
+    # User 1 Create a new game
+    response = create_game(client, user1_data['token'])
+    response_body = check_valid_json(response)
+    game_id = response_body['game_id']
+
+    # ✅ X wins down the middle column
+    # [0] [X] [O]
+    # [3] [X] [O]
+    # [6] [X] [8]
+    for move, token, flair in [(4, user1_data['token'], "X"), (2, user2_data['token'], "O"),
+                               (1, user1_data['token'], "X"), (5, user2_data['token'], "O")]:
+        assert make_move_user(client, move=move, game_id=game_id, token=token, expected_flair=flair) is None, \
+            "Should not have a winner yet"
+    assert make_move_user(client, move=7, game_id=game_id, token=user1_data['token'], expected_flair="X") == "X", \
+        "X should have won"
+
+    # ✅ Stored as bits
+    with app.app_context():
+        game = get_db().execute("SELECT board, board_bits FROM games WHERE id = ?", (game_id,)).fetchone()
+    assert game['board'] is None, "Text board should not be stored"
+    assert game['board_bits'] == (1 << 1 | 1 << 4 | 1 << 7) | (1 << 2 | 1 << 5) << 9, \
+        f"Unexpected board_bits {game['board_bits']:018b}"
+
+    # ✅ Game is over
+    response = make_move(client, move=0, game_id=game_id, token=user2_data['token'])
+    response_body = check_valid_json(response)
+    check_code(gotten_code=response.status_code, expect=400, message="No moves after the game is won.")
+    assert response_body['message'] == "Game already has a winner"
+    assert response_body['board'] == " XO XO X ", f"Unexpected board {response_body['board']!r}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Moves outside the board are rejected
+#
+# Verifies:
+# ✅ Moves outside 0-8 are invalid moves
+# ✅ An unknown game is still reported first
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Boundary
+@pytest.mark.type_ErrorHandling
+@pytest.mark.game_Move
+def test_game_move_out_of_range(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # Create a new game
+    response = create_game(client, user_data['token'])
+    game_id = check_valid_json(response)['game_id']
+
+    # ✅ Outside the board
+    for move in [-1, 9, "4"]:
+        response = make_move(client, move=move, game_id=game_id, token=user_data['token'])
+        check_code(gotten_code=response.status_code, expect=400, message=f"Move {move!r} should be invalid.")
+        assert check_valid_json(response)['message'] == "Invalid move"
+
+    # ✅ Unknown game
+    response = make_move(client, move=9, game_id=game_id + 1, token=user_data['token'])
+    check_code(gotten_code=response.status_code, expect=400)
+    assert check_valid_json(response)['message'] == "Invalid game ID"
+
+
+# -----------------------------------------------------------------------------------
+# Description: A move made with a stale current_turn loses the race
+#
+# Verifies:
+# ✅ Moves return the next current_turn
+# ✅ A stale current_turn is rejected with 409 and the actual turn
+# ✅ The up to date current_turn is accepted
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_move_stale_turn(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # Create a new game
+    response = create_game(client, user_data['token'])
+    game_id = check_valid_json(response)['game_id']
+
+    # ✅ First move with the first turn
+    response = make_move(client, move=4, game_id=game_id, token=user_data['token'], current_turn=1)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert check_valid_json(response)['current_turn'] == 2, "Expected the next turn to be 2"
+
+    # ✅ Another client still thinks it's the first turn
+    response = make_move(client, move=0, game_id=game_id, token=user_data['token'], current_turn=1)
+    check_code(gotten_code=response.status_code, expect=409, message="A stale turn should lose the race.")
+    response_body = check_valid_json(response)
+    assert response_body['message'] == "Game was changed by another move"
+    assert response_body['current_turn'] == 2, "Expected the actual turn in the response"
+
+    # ✅ Up to date turn
+    response = make_move(client, move=0, game_id=game_id, token=user_data['token'], current_turn=2)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert check_valid_json(response)['board'][0] == "O"
+
+
+# -----------------------------------------------------------------------------------
+# Description: A current_turn that isn't an integer is rejected before the move is tried
+#
+# Verifies:
+# ✅ A string, float, bool or list current_turn is rejected with 400 by /game/move and /game/moves
+# ✅ The board is left as it was
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_move_invalid_turn(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # Create a new game
+    response = create_game(client, user_data['token'])
+    game_id = check_valid_json(response)['game_id']
+
+    for current_turn in ("1", 1.0, True, [1]):
+        # ✅ Single move
+        response = make_move(client, move=4, game_id=game_id, token=user_data['token'], current_turn=current_turn)
+        check_code(gotten_code=response.status_code, expect=400, message=f"current_turn {current_turn!r} should be rejected.")
+        assert check_valid_json(response)['message'] == "current_turn must be an integer"
+
+        # ✅ Several moves
+        response = make_moves(client, moves=[4, 0], game_id=game_id, token=user_data['token'], current_turn=current_turn)
+        check_code(gotten_code=response.status_code, expect=400, message=f"current_turn {current_turn!r} should be rejected.")
+        assert check_valid_json(response)['message'] == "current_turn must be an integer"
+
+    # ✅ Nothing was played
+    response = get_game(client, game_id, user_data['token'])
+    response_body = check_valid_json(response)
+    assert response_body['board'] == [" "] * 9, "Expected the board to be empty"
+    assert response_body['current_turn'] == 1, "Expected the first turn"
+
+
+# -------------------------------------------------------------------------------------------------
+# Play one game from several threads at once, each making random moves until the game ends.
+# Returns the bodies of the accepted moves, the unexpected responses and the number of requests made
+# -------------------------------------------------------------------------------------------------
+def hammer_game(app, game_id: int, token: str, threads: int):
+    lock = threading.Lock()
+    game_over = threading.Event()
+    moves = []
+    unexpected = []
+    requests_made = 0
+
+    def player():
+        nonlocal requests_made
+        player_client = app.test_client()
+        while not game_over.is_set():
+            response = make_move(player_client, random.randrange(9), game_id, token)
+            response_body = response.json
+            with lock:
+                requests_made += 1
+                if response.status_code == 200:
+                    moves.append(response_body)
+                elif response.status_code != 400:
+                    unexpected.append((response.status_code, response_body))
+
+            if response.status_code == 200 and response_body['winner'] or \
+                    response.status_code == 400 and response_body['message'] == "Game already has a winner":
+                game_over.set()
+
+    workers = [threading.Thread(target=player) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return moves, unexpected, requests_made
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play single games from several threads at once
+#
+# Verifies:
+# ✅ Nothing but wins, draws, occupied cells and finished games are answered
+# ✅ Every accepted move is on the final board, once, in turn order
+# ✅ The game cache ends on the stored state, whatever order the writes landed in
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_concurrent_moves(app, client, context):
+    user_data = new_user_setup(client, context)
+
+    for _ in range(3):
+        game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+        moves, unexpected, _ = hammer_game(app, game_id, user_data['token'], threads=4)
+
+        # ✅ Expected responses only
+        assert not unexpected, f"Unexpected responses for game {game_id}: {unexpected}"
+
+        # ✅ Consistent with the accepted moves
+        with app.app_context():
+            game = get_db().execute("SELECT * FROM games WHERE id = ?", (game_id,)).fetchone()
+        board = list(game['board'])
+        moves.sort(key=lambda body: body['current_turn'])
+        assert [body['current_turn'] for body in moves] == list(range(2, len(moves) + 2)), \
+            f"Accepted moves skipped or repeated a turn in game {game_id}"
+        assert game['current_turn'] == len(moves) + 1, f"current_turn doesn't match the moves in game {game_id}"
+        assert 9 - board.count(" ") == len(moves), f"Board {board} doesn't match {len(moves)} accepted moves"
+        assert board.count("X") - board.count("O") in (0, 1), f"X and O didn't alternate on board {board}"
+        assert moves[-1]['board'] == board, f"Last accepted move doesn't match the stored board {board}"
+        assert game['winner'] == check_winner(board), f"Stored winner is wrong for board {board}"
+
+        # ✅ Cache
+        cached = get_game_cache(app).get(game_id)
+        assert (cached['board'], cached['current_turn'], cached['winner']) == \
+               (game['board'], game['current_turn'], game['winner']), f"Game cache is stale for game {game_id}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play a whole game with one request
+#
+# Verifies:
+# ✅ Every move is applied in order and the board after each one is returned
+# ✅ The game stops at the win and the rest of the moves aren't played
+# ✅ The final state is stored and the win is counted
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Smoke
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_multiple_moves(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # Create a new game
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    # X wins on the top row with the 5th move, the 6th should not be played
+    response = make_moves(client, [0, 3, 1, 4, 2, 5], game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    response_body = check_valid_json(response)
+
+    # ✅ Boards after every move
+    assert [''.join(step['board']) for step in response_body['steps']] == [
+        "X        ", "X  O     ", "XX O     ", "XX OO    ", "XXXOO    "
+    ], f"Unexpected boards {response_body['steps']}"
+    assert [step['winner'] for step in response_body['steps']] == [None, None, None, None, "X"]
+
+    # ✅ Stopped at the win
+    assert response_body['winner'] == "X"
+    assert response_body['message'] == "Game already has a winner"
+    assert response_body['stopped_at'] == 5
+    assert response_body['current_turn'] == 6
+
+    # ✅ Stored and counted
+    response = make_move(client, move=8, game_id=game_id, token=user_data['token'])
+    check_code(gotten_code=response.status_code, expect=400)
+    assert check_valid_json(response)['board'] == "XXXOO    "
+    response = login(client, user_data['username'], user_data['password'])
+    assert check_valid_json(response)['user']['wins'] == 1, "Win was not counted"
+
+
+# -----------------------------------------------------------------------------------
+# Description: A sequence with an invalid move keeps the moves before it
+#
+# Verifies:
+# ✅ Moves up to the invalid one are applied and stored
+# ✅ A sequence that starts with an invalid move changes nothing
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_ErrorHandling
+@pytest.mark.game_Move
+def test_game_multiple_moves_invalid(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # Create a new game
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    # ✅ Stops at the occupied cell
+    response = make_moves(client, [4, 0, 4, 8], game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    response_body = check_valid_json(response)
+    assert len(response_body['steps']) == 2
+    assert response_body['message'] == "Invalid move"
+    assert response_body['stopped_at'] == 2
+    assert response_body['current_turn'] == 3
+
+    # ✅ Nothing to apply
+    response = make_moves(client, [0], game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=400)
+    assert check_valid_json(response)['message'] == "Invalid move"
+
+    # The stored game continues from the 2 applied moves
+    assert make_move_user(client, move=8, game_id=game_id, token=user_data['token'], expected_flair="X") is None
+
+
+# -----------------------------------------------------------------------------------
+# Description: Play against the computer
+#
+# Verifies:
+# ✅ A game can be created with the computer as the opponent
+# ✅ The computer answers every move in the same request
+# ✅ The user can't win against the computer
+# ✅ An unknown opponent is rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Smoke
+@pytest.mark.type_Regression
+@pytest.mark.game_CreateGame
+@pytest.mark.game_Move
+def test_game_ai_opponent(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+
+    # ✅ Unknown opponent
+    response = create_game(client, user_data['token'], opponent="robot")
+    check_code(gotten_code=response.status_code, expect=400)
+
+    # Create a new game against the computer
+    response = create_game(client, user_data['token'], opponent="ai")
+    check_code(gotten_code=response.status_code, expect=200)
+    game_id = check_valid_json(response)['game_id']
+
+    # ✅ Every move is answered, play the first free cell until the game ends
+    winner = None
+    board = [" "] * 9
+    while winner is None:
+        move = board.index(" ")
+        response = make_move(client, move=move, game_id=game_id, token=user_data['token'])
+        check_code(gotten_code=response.status_code, expect=200)
+        response_body = check_valid_json(response)
+        board, winner = response_body['board'], response_body['winner']
+
+        assert board[move] == "X", f"User move {move} was not played"
+        if winner is None:
+            assert board[response_body['ai_move']] == "O", "Computer did not answer"
+            assert board.count("X") == board.count("O"), f"Computer did not answer once on board {board}"
+
+    # ✅ The computer won or drew
+    assert winner in ["O", "Draw"], f"User should not beat the computer, got {winner}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Read the state of a game
+#
+# Verifies:
+# ✅ A new game and a game in progress can be read
+# ✅ An unknown game is not found
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Smoke
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_get(client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    # ✅ New game
+    response = get_game(client, game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    response_body = check_valid_json(response)
+    assert response_body['board'] == [" "] * 9
+    assert response_body['status'] == "in_progress"
+    assert response_body['current_turn'] == 1
+
+    # ✅ After a move
+    make_move_user(client, move=4, game_id=game_id, token=user_data['token'], expected_flair="X")
+    response_body = check_valid_json(get_game(client, game_id, user_data['token']))
+    assert ''.join(response_body['board']) == "    X    "
+    assert response_body['current_turn'] == 2
+
+    # ✅ Unknown game
+    response = get_game(client, game_id + 1, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=404)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Poll a game with the ETag of the last response
+#
+# Verifies:
+# ✅ An unchanged game is answered with an empty 304 from the game cache
+# ✅ A move changes the ETag and the next poll gets the new state
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_get_etag(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    game_id = check_valid_json(create_game(client, user_data['token']))['game_id']
+
+    response = get_game(client, game_id, user_data['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    etag = response.headers['ETag']
+
+    # ✅ Unchanged, answered from the cache
+    with app.app_context():
+        stats = get_game_cache().stats()
+    response = get_game(client, game_id, user_data['token'], etag=etag)
+    check_code(gotten_code=response.status_code, expect=304)
+    assert response.data == b"" and response.headers['ETag'] == etag
+    with app.app_context():
+        assert get_game_cache().stats()['misses'] == stats['misses'], "Unchanged game was read from the database"
+
+    # ✅ New state after a move
+    make_move_user(client, move=4, game_id=game_id, token=user_data['token'], expected_flair="X")
+    response = get_game(client, game_id, user_data['token'], etag=etag)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert response.headers['ETag'] != etag
+    assert check_valid_json(response)['current_turn'] == 2
+
+
+# -----------------------------------------------------------------------------------
+# Description: Replay a game from its move history
+#
+# Verifies:
+# ✅ Every move is recorded, from /game/move, /game/moves and the computer
+# ✅ Boards are rebuilt ply by ply, ending on the game's board and winner
+# ✅ The history is read off the moves table's primary key alone
+# ✅ Unknown games are a 404
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_game_replay(app, client, context):
+    # Create a new user and login to get token
+    user_data = new_user_setup(client, context)
+    token = user_data['token']
+    game_id = check_valid_json(create_game(client, token))['game_id']
+
+    make_move_user(client, move=0, game_id=game_id, token=token, expected_flair="X")
+    check_code(gotten_code=make_moves(client, [3, 1, 4], game_id, token).status_code, expect=200)
+    assert make_move_user(client, move=2, game_id=game_id, token=token, expected_flair="X") == "X"
+
+    # ✅ Recorded and rebuilt
+    response = replay_game(client, game_id, token)
+    check_code(gotten_code=response.status_code, expect=200)
+    assert response.mimetype == "application/x-ndjson"
+    plies = [json.loads(line) for line in response.data.splitlines()]
+    assert [(ply['ply'], ply['cell'], ply['player']) for ply in plies] == \
+        [(1, 0, "X"), (2, 3, "O"), (3, 1, "X"), (4, 4, "O"), (5, 2, "X")]
+    assert plies[1]['board'] == ["X", " ", " ", "O", " ", " ", " ", " ", " "] and plies[1]['winner'] is None
+    assert plies[-1]['board'] == check_valid_json(get_game(client, game_id, token))['board']
+    assert plies[-1]['winner'] == "X" and all(ply['ts'] for ply in plies)
+
+    # ✅ The computer's answers
+    game_id = check_valid_json(create_game(client, token, opponent="ai"))['game_id']
+    ai_move = check_valid_json(make_move(client, 4, game_id, token))['ai_move']
+    plies = [json.loads(line) for line in replay_game(client, game_id, token).data.splitlines()]
+    assert [(ply['cell'], ply['player']) for ply in plies] == [(4, "X"), (ai_move, "O")]
+
+    # ✅ Primary key only
+    with app.app_context():
+        plan = get_db().execute(
+            "EXPLAIN QUERY PLAN SELECT ply, cell, ts FROM moves WHERE game_id = ? ORDER BY ply", (game_id,)
+        ).fetchall()
+    details = ' '.join(row['detail'] for row in plan)
+    assert "USING PRIMARY KEY" in details and "TEMP B-TREE" not in details, f"Replay doesn't use the primary key: {details}"
+
+    # ✅ Unknown game
+    check_code(gotten_code=replay_game(client, 999999, token).status_code, expect=404)
+
+
+# -----------------------------------------------------------------------------------
+# Description: List a user's games page by page, by status
+#
+# Verifies:
+# ✅ Pages are newest first, don't overlap and end with no cursor
+# ✅ Games can be filtered by status
+# ✅ Only the user's own games are listed
+# ✅ Bad status and limit are rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.type_Boundary
+@pytest.mark.game_CreateGame
+def test_game_list(client, context):
+    # Create new users and login to get tokens
+    user_data = new_user_setup(client, context)
+    other_user_data = new_user_setup(client, context)
+    create_game(client, other_user_data['token'])
+
+    # 5 games: 2 won, 1 draw, 2 in progress
+    game_ids = [check_valid_json(create_game(client, user_data['token']))['game_id'] for _ in range(5)]
+    for game_id in game_ids[:2]:
+        make_moves(client, [0, 3, 1, 4, 2], game_id, user_data['token'])
+    make_moves(client, [4, 2, 8, 0, 1, 7, 5, 3, 6], game_ids[2], user_data['token'])
+
+    # ✅ Pages of 2
+    listed = []
+    cursor = None
+    for _ in range(3):
+        params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+        response = list_games(client, user_data['token'], **params)
+        check_code(gotten_code=response.status_code, expect=200)
+        response_body = check_valid_json(response)
+        listed += [game['game_id'] for game in response_body['games']]
+        cursor = response_body['next_cursor']
+    assert listed == sorted(game_ids, reverse=True), f"Expected {sorted(game_ids, reverse=True)} but listed {listed}"
+    assert cursor is None, "Last page should have no cursor"
+
+    # ✅ By status
+    for status, expected in [("won", game_ids[:2]), ("draw", game_ids[2:3]), ("in_progress", game_ids[3:])]:
+        response_body = check_valid_json(list_games(client, user_data['token'], status=status))
+        listed = [game['game_id'] for game in response_body['games']]
+        assert listed == sorted(expected, reverse=True), f"Expected {expected} {status} games but listed {listed}"
+        assert all(game['status'] == status for game in response_body['games'])
+
+    # ✅ Bad filters
+    check_code(gotten_code=list_games(client, user_data['token'], status="lost").status_code, expect=400)
+    check_code(gotten_code=list_games(client, user_data['token'], limit=0).status_code, expect=400)
+    check_code(gotten_code=list_games(client, user_data['token'], limit=101).status_code, expect=400)
+
+
+# -----------------------------------------------------------------------------------
+# Description: The game listing is answered from an index, whatever the filter
+#
+# Verifies:
+# ✅ No scan of the games table and no sort for every status
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+@pytest.mark.parametrize("status_filter", ["", " AND winner IS NULL", " AND winner IN ('X', 'O')", " AND winner = 'Draw'"])
+def test_game_list_query_plan(app, status_filter):
+    with app.app_context():
+        plan = get_db().execute(
+            f"EXPLAIN QUERY PLAN SELECT * FROM games WHERE user_id = ?{status_filter} AND id < ? ORDER BY id DESC LIMIT ?",
+            (1, 100, 21)
+        ).fetchall()
+    details = ' '.join(row['detail'] for row in plan)
+
+    assert "USING INDEX games_user" in details, f"Listing doesn't use an index: {details}"
+    assert "TEMP B-TREE" not in details, f"Listing sorts its results: {details}"
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+from app import create_app
+from app.db import close_pool
+from app.journal import close_move_journal, get_move_journal
+from tests.funcs import *
+
+"""
+Tests for the write-behind move journal in app/journal.py
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# -------------------------------------------------------------------------------------------------
+# An app on database with MOVE_WRITE_BEHIND set. Nothing is flushed on a timer unless the config says so
+# -------------------------------------------------------------------------------------------------
+def write_behind_app(database: str, **config):
+    return create_app(dict({
+        'TESTING': True,
+        'DATABASE': database,
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'MOVE_WRITE_BEHIND': True,
+        'MOVE_JOURNAL_FLUSH_INTERVAL': 60,
+        'MOVE_JOURNAL_FLUSH_MOVES': 1000,
+    }, **config))
+
+
+# -------------------------------------------------------------------------------------------------
+# (board, current_turn, winner) of a game and the wins of a user, read straight from the database
+# -------------------------------------------------------------------------------------------------
+def stored(database: str, game_id: int, username: str):
+    db = sqlite3.connect(database)
+    try:
+        game = db.execute("SELECT board, current_turn, winner FROM games WHERE id = ?", (game_id,)).fetchone()
+        wins = db.execute("SELECT wins FROM users WHERE username = ?", (username,)).fetchone()[0]
+    finally:
+        db.close()
+
+    return game, wins
+
+
+# -------------------------------------------------------------------------------------------------
+# (ply, cell) of the stored moves of a game
+# -------------------------------------------------------------------------------------------------
+def history(database: str, game_id: int):
+    db = sqlite3.connect(database)
+    try:
+        return db.execute("SELECT ply, cell FROM moves WHERE game_id = ? ORDER BY ply", (game_id,)).fetchall()
+    finally:
+        db.close()
+
+
+# -----------------------------------------------------------------------------------
+# Description: Acknowledge moves before they are stored, then store them in one flush
+#
+# Verifies:
+# ✅ Moves are answered while the database still has the old state
+# ✅ Game IDs that aren't ints are rejected, not a 500
+# ✅ Later reads and moves see the pending state
+# ✅ A flush stores the game and counts the win once
+# ✅ Storing the same state again changes nothing
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_write_behind_moves(app):
+    database = app.config['DATABASE']
+    wb_app = write_behind_app(database)
+    client = wb_app.test_client()
+    journal = get_move_journal(wb_app)
+
+    user_data = new_user_setup(client, {})
+    token, username = user_data['token'], user_data['username']
+    game_id = check_valid_json(create_game(client, token))['game_id']
+
+    # ✅ Answered before stored
+    for move, flair in zip([0, 3, 1, 4], "XOXO"):
+        make_move_user(client, move, game_id, token, flair)
+    assert make_move_user(client, 2, game_id, token, "X") == "X"
+    assert stored(database, game_id, username) == (("         ", 1, None), 0), "A move was stored before the flush"
+
+    # ✅ Ids that aren't ints
+    for bad_id in [str(game_id), float(game_id), True, [game_id]]:
+        check_code(gotten_code=make_move(client, 5, bad_id, token).status_code, expect=400,
+                   message=f"Game ID {bad_id!r} should be rejected")
+        check_code(gotten_code=make_moves(client, [5], bad_id, token).status_code, expect=400,
+                   message=f"Game ID {bad_id!r} should be rejected")
+
+    # ✅ Pending state
+    assert check_valid_json(get_game(client, game_id, token))['winner'] == "X"
+    plies = [json.loads(line) for line in replay_game(client, game_id, token).data.splitlines()]
+    assert [ply['cell'] for ply in plies] == [0, 3, 1, 4, 2], "Pending moves are missing from the replay"
+    response = make_move(client, 5, game_id, token)
+    check_code(gotten_code=response.status_code, expect=400, message="A move was played on a won game")
+    stats = check_valid_json(client.get('/metrics'))['move_journal']
+    assert stats['pending_games'] == 1 and stats['pending_moves'] == 5, f"Unexpected pending moves in {stats}"
+
+    # ✅ Flushed
+    assert journal.flush() == 5
+    assert stored(database, game_id, username) == (("XXXOO    ", 6, "X"), 1)
+    assert history(database, game_id) == [(1, 0), (2, 3), (3, 1), (4, 4), (5, 2)]
+    assert journal.flush() == 0
+    stats = check_valid_json(client.get('/metrics'))['move_journal']
+    assert stats['batches'] == 1 and stats['moves_flushed'] == 5 and stats['pending_games'] == 0, stats
+
+    # ✅ Stored twice
+    db = sqlite3.connect(database)
+    db.row_factory = sqlite3.Row
+    game = dict(db.execute("SELECT * FROM games WHERE id = ?", (game_id,)).fetchone())
+    user_id = db.execute("SELECT id FROM users WHERE username = ?", (username,)).fetchone()[0]
+    db.close()
+    journal.append(game, user_id, [(5, 2)])
+    assert journal.flush() == 1
+    assert stored(database, game_id, username) == (("XXXOO    ", 6, "X"), 1), "A replayed win was counted again"
+    assert len(history(database, game_id)) == 5, "A replayed move was stored again"
+
+    close_move_journal(wb_app)
+    close_pool(wb_app)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Flush once enough moves are pending, without waiting for the interval
+#
+# Verifies:
+# ✅ MOVE_JOURNAL_FLUSH_MOVES moves are stored together by the writer thread
+# ✅ Every move of a batch from /game/moves is counted
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_write_behind_group_commit(app):
+    database = app.config['DATABASE']
+    wb_app = write_behind_app(database, MOVE_JOURNAL_FLUSH_MOVES=4)
+    client = wb_app.test_client()
+    journal = get_move_journal(wb_app)
+
+    user_data = new_user_setup(client, {})
+    token, username = user_data['token'], user_data['username']
+    game_ids = [check_valid_json(create_game(client, token))['game_id'] for _ in range(3)]
+
+    # ✅ Stored by count
+    check_code(gotten_code=make_moves(client, [4, 0], game_ids[0], token).status_code, expect=200)
+    make_move_user(client, 4, game_ids[1], token, "X")
+    assert stored(database, game_ids[0], username)[0][1] == 1, "Flushed before enough moves were pending"
+    make_move_user(client, 8, game_ids[2], token, "X")
+
+    for _ in range(500):
+        if journal.stats()['batches']:
+            break
+        time.sleep(0.01)
+    stats = journal.stats()
+    assert stats['batches'] == 1 and stats['last_batch_moves'] == 4, f"Expected one batch of 4 moves in {stats}"
+    assert [stored(database, game_id, username)[0] for game_id in game_ids] == [
+        ("O   X    ", 3, None), ("    X    ", 2, None), ("        X", 2, None)
+    ]
+
+    close_move_journal(wb_app)
+    close_pool(wb_app)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Replay the log of a process that died before storing its moves
+#
+# Verifies:
+# ✅ Acknowledged moves and wins are stored when the next app starts
+# ✅ The replayed segments are removed
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.game_Move
+def test_write_behind_crash_recovery(app, tmp_path):
+    database = app.config['DATABASE']
+    log = str(tmp_path / "moves.log")
+
+    # Plays a game to a win and starts another, then exits without flushing or closing anything
+    script = f"""
+import os
+from tests.funcs import create_game, make_move, make_moves, new_user_setup
+from tests.test_journal import write_behind_app
+client = write_behind_app({database!r}, MOVE_JOURNAL_PATH={log!r}).test_client()
+user_data = new_user_setup(client, {{}})
+won_game, open_game = (create_game(client, user_data['token']).json['game_id'] for _ in range(2))
+assert make_moves(client, [0, 3, 1, 4, 2], won_game, user_data['token']).json['winner'] == 'X'
+assert make_move(client, 4, open_game, user_data['token']).status_code == 200
+print(user_data['username'], won_game, open_game, flush=True)
+os._exit(0)
+"""
+    result = subprocess.run([sys.executable, '-c', script], cwd=ROOT, capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    username, won_game, open_game = result.stdout.split()
+    won_game, open_game = int(won_game), int(open_game)
+
+    assert stored(database, won_game, username) == (("         ", 1, None), 0), "The crashed process stored its moves"
+    assert os.listdir(tmp_path) == ["moves.log.1"]
+
+    # ✅ Replayed
+    wb_app = write_behind_app(database, MOVE_JOURNAL_PATH=log)
+    assert get_move_journal(wb_app).stats()['recovered'] == 2
+    assert stored(database, won_game, username) == (("XXXOO    ", 6, "X"), 1)
+    assert stored(database, open_game, username)[0] == ("    X    ", 2, None)
+    assert history(database, won_game) == [(1, 0), (2, 3), (3, 1), (4, 4), (5, 2)]
+    assert history(database, open_game) == [(1, 4)]
+
+    # ✅ Removed
+    close_move_journal(wb_app)
+    close_pool(wb_app)
+    assert os.listdir(tmp_path) == []
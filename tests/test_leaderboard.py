@@ -0,0 +1,138 @@
+import pytest
+from app.db import get_db
+from app.leaderboard import Leaderboard, WinsRanking
+from tests.funcs import *
+
+"""
+Tests for the leaderboard in app/leaderboard.py and app/routes/leaderboard.py
+"""
+
+
+# -------------------------------------------------------------------------------------------------
+# Win a new game as X, playing both sides
+# -------------------------------------------------------------------------------------------------
+def win_game(client, token: str):
+    game_id = check_valid_json(create_game(client, token))['game_id']
+    response = make_moves(client, [0, 3, 1, 4, 2], game_id, token)
+    check_code(gotten_code=response.status_code, expect=200)
+
+
+# -----------------------------------------------------------------------------------
+# Description: Rank win counts against a sorted list
+#
+# Verifies:
+# ✅ Ranks match counting the users with more wins
+# ✅ Users with the same wins share a rank
+# ✅ The tree grows past its initial size
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Boundary
+def test_wins_ranking():
+    wins = [random.randrange(50) for _ in range(500)]
+    ranking = WinsRanking()
+    for user_wins in wins:
+        ranking.add(user_wins)
+
+    # Move some users up, past the initial size of the tree
+    for index in range(0, 500, 7):
+        for _ in range(100):
+            ranking.record_win(wins[index])
+            wins[index] += 1
+
+    # ✅ Same ranks as a full count
+    assert ranking.total == len(wins)
+    for user_wins in set(wins) | {0, max(wins) + 1, 10 ** 6}:
+        expected = 1 + sum(1 for other in wins if other > user_wins)
+        assert ranking.rank(user_wins) == expected, f"Wrong rank for {user_wins} wins"
+
+    # ✅ Ties share a rank
+    assert ranking.rank(max(wins)) == 1
+
+
+# -----------------------------------------------------------------------------------
+# Description: Win games and check the leaderboard and ranks follow
+#
+# Verifies:
+# ✅ Top users are ordered by wins, with ranks
+# ✅ A user's rank moves up as they win
+# ✅ Unknown users and bad limits are rejected
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Regression
+@pytest.mark.type_Boundary
+@pytest.mark.game_Move
+def test_leaderboard(app, client, context):
+    # Create new users and login to get tokens
+    first = new_user_setup(client, context)
+    second = new_user_setup(client, context)
+    with app.app_context():
+        ids = {row['username']: row['id'] for row in get_db().execute("SELECT id, username FROM users")}
+    first_id, second_id = ids[first['username']], ids[second['username']]
+
+    # Loads the ranking before any wins
+    response = get_rank(client, second_id, first['token'])
+    check_code(gotten_code=response.status_code, expect=200)
+    assert response.json['rank'] == 1 and response.json['users'] == 2
+
+    win_game(client, first['token'])
+    win_game(client, first['token'])
+    win_game(client, second['token'])
+
+    # ✅ Ordered by wins
+    response = get_leaders(client, first['token'], limit=2)
+    check_code(gotten_code=response.status_code, expect=200)
+    leaders = check_valid_json(response)['leaders']
+    assert [(leader['id'], leader['wins'], leader['rank']) for leader in leaders] == [(first_id, 2, 1), (second_id, 1, 2)]
+
+    # ✅ Ranks follow the wins, without reloading the ranking
+    assert get_rank(client, second_id, first['token']).json['rank'] == 2
+    win_game(client, second['token'])
+    assert get_rank(client, second_id, first['token']).json['rank'] == 1
+    assert get_rank(client, first_id, first['token']).json['rank'] == 1
+
+    # ✅ Unknown user
+    check_code(gotten_code=get_rank(client, second_id + 1, first['token']).status_code, expect=404)
+
+    # ✅ Bad limits
+    for limit in [0, 101]:
+        check_code(gotten_code=get_leaders(client, first['token'], limit=limit).status_code, expect=400)
+
+
+# -----------------------------------------------------------------------------------
+# Description: The ranking is reloaded between a win's commit and record_win
+#
+# Verifies:
+# ✅ A win recorded with no reload since its commit moves the user up without a reload
+# ✅ A win the reload already read isn't counted twice
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_leaderboard_reload_race(app, client, context):
+    first = new_user_setup(client, context)
+    new_user_setup(client, context)
+    leaderboard = Leaderboard(refresh=3600)
+
+    def commit_win(username):
+        db = get_db()
+        wins = db.execute("UPDATE users SET wins = wins + 1 WHERE username = ? RETURNING wins", (username,)).fetchall()[0][0]
+        db.commit()
+        return wins
+
+    with app.app_context():
+        assert leaderboard.rank(0) == (1, 2)
+
+        # ✅ No reload in between
+        version = leaderboard.version()
+        wins = commit_win(first['username'])
+        leaderboard.record_win(version, wins - 1)
+        assert leaderboard.rank(0) == (2, 2) and leaderboard.rank(1) == (1, 2)
+        assert leaderboard.version() == version, "The ranking was reloaded"
+
+        # ✅ Reloaded after the commit
+        version = leaderboard.version()
+        wins = commit_win(first['username'])
+        leaderboard.refresh = 0
+        leaderboard.rank(0)
+        leaderboard.refresh = 3600
+        leaderboard.record_win(version, wins - 1)
+        assert leaderboard.rank(0) == (2, 2), "The win was counted twice"
+        assert leaderboard.rank(2) == (1, 2) and leaderboard.rank(1) == (2, 2)
@@ -1,5 +1,6 @@
 import pytest
-from app.util import check_winner
+from app.util import (CELL_CODES, RESULTS, SYMMETRIES, board_to_bits, canonicalize, check_winner, check_winner_batch,
+                      check_winner_bits)
 from tests.funcs import *
 
 """
@@ -149,3 +150,104 @@ def test_check_winner_bad_type():
 
     with pytest.raises(TypeError):
         check_winner(abc="def")
+
+
+# -----------------------------------------------------------------------------------
+# Description: The bitboard lookup agrees with the list based check on every board
+#
+# Verifies:
+# ✅ board_to_bits and check_winner_bits match check_winner for all possibilities
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_check_winner_bits_exhaustive():
+    for combo in get_all_board_combinations():
+        x_mask, o_mask = board_to_bits(combo)
+
+        assert x_mask & o_mask == 0, f"X and O masks overlap for board {combo}"
+        assert check_winner_bits(x_mask, o_mask) == check_winner(combo), \
+            f"Bitboard result does not match for board {combo}"
+
+
+# -----------------------------------------------------------------------------------
+# Description: The batch scorer agrees with check_winner on every board
+#
+# Verifies:
+# ✅ Board strings are scored the same as check_winner
+# ✅ Cell code arrays are scored the same as check_winner
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_check_winner_batch_exhaustive():
+    np = pytest.importorskip("numpy")
+
+    all_combos = get_all_board_combinations()
+    expected = [check_winner(combo) for combo in all_combos]
+
+    # ✅ Board strings
+    results = check_winner_batch([''.join(combo) for combo in all_combos])
+    assert [RESULTS[code] for code in results] == expected, "Batch results for board strings do not match"
+
+    # ✅ Cell code arrays
+    cells = np.array([[CELL_CODES[mark] for mark in combo] for combo in all_combos], dtype=np.uint8)
+    results = check_winner_batch(cells)
+    assert [RESULTS[code] for code in results] == expected, "Batch results for cell arrays do not match"
+
+
+# -----------------------------------------------------------------------------------
+# Description: Bad boards are passed to the batch scorer
+#
+# Verifies:
+# ✅ Bad board lengths, marks, shapes, negative codes and dtypes
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_ErrorHandling
+def test_check_winner_batch_bad_boards():
+    np = pytest.importorskip("numpy")
+
+    with pytest.raises(ValueError):
+        check_winner_batch(["X" * 8])
+
+    with pytest.raises(ValueError):
+        check_winner_batch(["XOXOXOXOA"])
+
+    with pytest.raises(ValueError):
+        check_winner_batch(np.zeros((2, 8), dtype=np.uint8))
+
+    with pytest.raises(ValueError):
+        check_winner_batch(np.full((2, 9), 3, dtype=np.uint8))
+
+    with pytest.raises(ValueError):
+        check_winner_batch(np.array([[-1, 0, 0, 0, 0, 0, 0, 0, 0]], dtype=np.int8))
+
+    with pytest.raises(ValueError):
+        check_winner_batch(np.zeros((2, 9), dtype=np.float64))
+
+
+# -----------------------------------------------------------------------------------
+# Description: Boards that are rotations or reflections of each other share a canonical form
+#
+# Verifies:
+# ✅ All 8 symmetries of a board give the same canonical board
+# ✅ The returned transform maps the board onto its canonical form
+# ✅ The boards fall into the 2862 classes Burnside's lemma predicts
+# -----------------------------------------------------------------------------------
+@pytest.mark.type_Unit
+@pytest.mark.type_Regression
+def test_canonicalize_exhaustive():
+    canonical_boards = set()
+
+    for combo in get_all_board_combinations():
+        canonical, transform = canonicalize(combo)
+        canonical_boards.add(''.join(canonical))
+
+        # ✅ Transform maps the board onto the canonical board
+        assert [combo[i] for i in SYMMETRIES[transform]] == canonical, f"Transform {transform} is wrong for {combo}"
+
+        # ✅ Same canonical form for every symmetry
+        for perm in SYMMETRIES:
+            symmetric = [combo[i] for i in perm]
+            assert canonicalize(symmetric)[0] == canonical, f"{symmetric} and {combo} have different canonical forms"
+
+    # ✅ (3^9 + 2 * 3^3 + 3^5 + 4 * 3^6) / 8
+    assert len(canonical_boards) == 2862, f"Expected 2862 canonical boards but got {len(canonical_boards)}"